@@ -0,0 +1,582 @@
+"""
+
+NAME:
+===============================
+Alignment (alignment.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Array-based engines for the alignment of two measure maps.
+These are drop-in alternatives to `measuring_bars.needleman_wunsch`
+for long sources where the pure Python matrix becomes too slow and too large.
+
+Each measure is reduced once to an integer code for its comparison key
+so that the dynamic programming compares integers rather than dicts.
+
+"""
+
+from bisect import bisect_left
+
+import numpy as np
+
+
+# ------------------------------------------------------------------------------
+
+COMPARISON_KEYS = ["actual_length", "time_signature", "start_repeat", "end_repeat"]
+
+MATCH_SCORE = 1
+MISMATCH_SCORE = -1
+GAP_PENALTY = -1
+
+# Traceback directions, stored one byte per cell
+MATCH = 0  # preferred and other measures aligned
+DELETE = 1  # preferred measure aligned with a gap
+INSERT = 2  # other measure aligned with a gap
+
+
+# ------------------------------------------------------------------------------
+
+def encode_measure_maps(
+        preferred_mm: list,
+        other_mm: list,
+        keys: list = None
+) -> tuple:
+    """
+    Encode the comparison key of each measure as an integer,
+    such that two measures share a code if and only if their keys are equal.
+    The codes are shared across both measure maps.
+    """
+
+    if keys is None:
+        keys = COMPARISON_KEYS
+
+    codes = {}
+
+    def encode(measure_map):
+        return np.fromiter(
+            (codes.setdefault(tuple(x[y] for y in keys), len(codes)) for x in measure_map),
+            dtype=np.int64,
+            count=len(measure_map)
+        )
+
+    return encode(preferred_mm), encode(other_mm)
+
+
+def wavefront_directions(
+        preferred_codes: np.ndarray,
+        other_codes: np.ndarray
+) -> np.ndarray:
+    """
+    Fill the Needleman-Wunsch score matrix one anti-diagonal at a time.
+    All cells on an anti-diagonal depend only on the two previous ones,
+    so each is computed in a single vectorised step and
+    only three diagonals of scores are held in memory at once.
+
+    Returns the (n + 1) x (m + 1) matrix of traceback directions (uint8).
+    Ties are broken as in `measuring_bars.needleman_wunsch`: DELETE, then INSERT, then MATCH.
+    """
+
+    n = len(preferred_codes)
+    m = len(other_codes)
+
+    directions = np.zeros((n + 1, m + 1), dtype=np.uint8)
+    directions[1:, 0] = DELETE
+    directions[0, 1:] = INSERT
+
+    # Diagonal d is stored by row, i.e., diagonal[i] = matrix[i][d - i]
+    before_previous = np.zeros(n + 1, dtype=np.int64)
+    previous = np.zeros(n + 1, dtype=np.int64)
+    current = np.zeros(n + 1, dtype=np.int64)
+    previous[0] = GAP_PENALTY
+    if n > 0:
+        previous[1] = GAP_PENALTY
+
+    for d in range(2, n + m + 1):
+        if d <= m:
+            current[0] = d * GAP_PENALTY
+        if d <= n:
+            current[d] = d * GAP_PENALTY
+
+        lo = max(1, d - m)
+        hi = min(n, d - 1)
+        if lo <= hi:
+            same = preferred_codes[lo - 1:hi] == other_codes[d - hi - 1:d - lo][::-1]
+            match = before_previous[lo - 1:hi] + np.where(same, MATCH_SCORE, MISMATCH_SCORE)
+            delete = previous[lo - 1:hi] + GAP_PENALTY
+            insert = previous[lo:hi + 1] + GAP_PENALTY
+
+            best = np.maximum(match, np.maximum(delete, insert))
+            current[lo:hi + 1] = best
+
+            step = np.where(
+                delete == best,
+                DELETE,
+                np.where(insert == best, INSERT, MATCH)
+            )
+            rows = np.arange(lo, hi + 1)
+            directions[rows, d - rows] = step
+
+        before_previous, previous, current = previous, current, before_previous
+
+    return directions
+
+
+def trace_back_indices(directions: np.ndarray) -> list:
+    """
+    Follow the traceback directions from the bottom-right corner
+    and return the alignment as (preferred index, other index) pairs, with None for gaps.
+    """
+
+    pairs = []
+    i, j = directions.shape[0] - 1, directions.shape[1] - 1
+    while i > 0 and j > 0:
+        step = directions[i, j]
+        if step == DELETE:
+            pairs.append((i - 1, None))
+            i -= 1
+        elif step == INSERT:
+            pairs.append((None, j - 1))
+            j -= 1
+        else:
+            pairs.append((i - 1, j - 1))
+            i -= 1
+            j -= 1
+    while i > 0:
+        pairs.append((i - 1, None))
+        i -= 1
+    while j > 0:
+        pairs.append((None, j - 1))
+        j -= 1
+
+    return pairs[::-1]
+
+
+def pairs_to_aligned(
+        pairs: list,
+        preferred_mm: list,
+        other_mm: list
+) -> tuple:
+    """
+    Convert (preferred index, other index) pairs into
+    the aligned measure maps (with None for gaps).
+    """
+
+    preferred_aligned = [None if i is None else preferred_mm[i] for i, _ in pairs]
+    other_aligned = [None if j is None else other_mm[j] for _, j in pairs]
+    return preferred_aligned, other_aligned
+
+
+def score_alignment(preferred_aligned: list, other_aligned: list) -> int:
+    """Total Needleman-Wunsch score of an alignment."""
+
+    score = 0
+    for x, y in zip(preferred_aligned, other_aligned):
+        if x is None or y is None:
+            score += GAP_PENALTY
+        elif all(x[key] == y[key] for key in COMPARISON_KEYS):
+            score += MATCH_SCORE
+        else:
+            score += MISMATCH_SCORE
+    return score
+
+
+def needleman_wunsch_numpy(preferred_mm: list, other_mm: list) -> tuple:
+    """
+    NumPy engine for `measuring_bars.needleman_wunsch`.
+    Same scoring and the same tie-breaking, so the output is identical,
+    but the matrix is filled by anti-diagonal wavefront
+    and only the traceback directions are kept in full (one byte per cell).
+    """
+
+    preferred_codes, other_codes = encode_measure_maps(preferred_mm, other_mm)
+    directions = wavefront_directions(preferred_codes, other_codes)
+    return pairs_to_aligned(trace_back_indices(directions), preferred_mm, other_mm)
+
+
+# ------------------------------------------------------------------------------
+
+def last_row_scores(
+        preferred_codes: np.ndarray,
+        other_codes: np.ndarray
+) -> np.ndarray:
+    """
+    Scores for aligning all of `preferred_codes` with each prefix of `other_codes`,
+    i.e., the last row of the Needleman-Wunsch matrix, computed in O(m) memory.
+
+    Each row is vectorised: the match and delete terms come from the previous row and
+    the chain of inserts along the row is a running maximum, since
+    max_k (t[k] + gap * (j - k)) = gap * j + max_k (t[k] - gap * k).
+    """
+
+    m = len(other_codes)
+    gaps = np.arange(m + 1, dtype=np.int64) * GAP_PENALTY
+    row = gaps.copy()
+    best = np.empty(m + 1, dtype=np.int64)
+
+    for i, code in enumerate(preferred_codes, start=1):
+        best[0] = i * GAP_PENALTY
+        np.maximum(
+            row[:-1] + np.where(other_codes == code, MATCH_SCORE, MISMATCH_SCORE),
+            row[1:] + GAP_PENALTY,
+            out=best[1:]
+        )
+        row = gaps + np.maximum.accumulate(best - gaps)
+
+    return row
+
+
+def hirschberg_pairs(
+        preferred_codes: np.ndarray,
+        other_codes: np.ndarray,
+        max_cells: int = 1_000_000
+) -> list:
+    """
+    Divide-and-conquer (Hirschberg) alignment in linear memory.
+    The preferred map is halved and the optimal crossing point in the other map
+    is found from the forward and reverse last-row scores.
+    Subproblems of at most `max_cells` cells are solved directly with the wavefront engine.
+
+    Returns (preferred index, other index) pairs, with None for gaps.
+    """
+
+    n = len(preferred_codes)
+    m = len(other_codes)
+
+    if n <= 1 or m <= 1 or (n + 1) * (m + 1) <= max_cells:
+        return trace_back_indices(wavefront_directions(preferred_codes, other_codes))
+
+    mid = n // 2
+    forward = last_row_scores(preferred_codes[:mid], other_codes)
+    reverse = last_row_scores(preferred_codes[mid:][::-1], other_codes[::-1])[::-1]
+    split = int(np.argmax(forward + reverse))
+
+    left = hirschberg_pairs(preferred_codes[:mid], other_codes[:split], max_cells)
+    right = hirschberg_pairs(preferred_codes[mid:], other_codes[split:], max_cells)
+    right = [
+        (None if i is None else i + mid, None if j is None else j + split)
+        for i, j in right
+    ]
+    return left + right
+
+
+def hirschberg(
+        preferred_mm: list,
+        other_mm: list,
+        max_cells: int = 1_000_000
+) -> tuple:
+    """
+    Linear-memory engine for `measuring_bars.needleman_wunsch`.
+    Same scoring, so the alignment score is optimal and identical to the full-matrix engines,
+    though where several alignments tie for the best score it may return a different one.
+    """
+
+    preferred_codes, other_codes = encode_measure_maps(preferred_mm, other_mm)
+    pairs = hirschberg_pairs(preferred_codes, other_codes, max_cells)
+    return pairs_to_aligned(pairs, preferred_mm, other_mm)
+
+
+# ------------------------------------------------------------------------------
+
+AFFINE_GAP_PENALTY = -2.0  # opening a gap
+CONTINUE_GAP_PENALTY = -0.5  # each further measure in the same gap
+
+# Affine traceback states. Each cell packs the predecessor state of all three
+# (two bits each) into one byte: M in bits 0-1, X in bits 2-3, Y in bits 4-5.
+STATE_M = 0  # preferred and other measures aligned
+STATE_X = 1  # preferred measure aligned with a gap
+STATE_Y = 2  # other measure aligned with a gap
+
+
+def affine_directions(
+        preferred_codes: np.ndarray,
+        other_codes: np.ndarray,
+        gap_penalty: float = AFFINE_GAP_PENALTY,
+        continue_gap_penalty: float = CONTINUE_GAP_PENALTY
+) -> tuple:
+    """
+    Fill the three Gotoh matrices (M: aligned, X: gap in other, Y: gap in preferred)
+    by anti-diagonal wavefront, as in `wavefront_directions`.
+    A gap of length k costs gap_penalty + (k - 1) * continue_gap_penalty.
+
+    Returns the packed (n + 1) x (m + 1) uint8 traceback matrix
+    and the state in which the bottom-right corner scores best.
+    Ties are broken in the order X, Y, M, as for the linear engines.
+    """
+
+    n = len(preferred_codes)
+    m = len(other_codes)
+
+    directions = np.zeros((n + 1, m + 1), dtype=np.uint8)
+    # Boundaries: a single gap that opened at (0, 0)
+    directions[2:, 0] = STATE_X << 2
+    directions[0, 2:] = STATE_Y << 4
+
+    def boundary(d):
+        return gap_penalty + (d - 1) * continue_gap_penalty
+
+    # Three anti-diagonals of each matrix, stored by row as in `wavefront_directions`
+    m_diagonals = [np.full(n + 1, -np.inf) for _ in range(3)]
+    x_diagonals = [np.full(n + 1, -np.inf) for _ in range(3)]
+    y_diagonals = [np.full(n + 1, -np.inf) for _ in range(3)]
+    m_diagonals[0][0] = 0.0
+    y_diagonals[1][0] = boundary(1)
+    if n > 0:
+        x_diagonals[1][1] = boundary(1)
+
+    for d in range(2, n + m + 1):
+        m_before, m_previous, m_current = m_diagonals
+        x_before, x_previous, x_current = x_diagonals
+        y_before, y_previous, y_current = y_diagonals
+
+        m_current.fill(-np.inf)
+        x_current.fill(-np.inf)
+        y_current.fill(-np.inf)
+        if d <= m:
+            y_current[0] = boundary(d)
+        if d <= n:
+            x_current[d] = boundary(d)
+
+        lo = max(1, d - m)
+        hi = min(n, d - 1)
+        if lo <= hi:
+            same = preferred_codes[lo - 1:hi] == other_codes[d - hi - 1:d - lo][::-1]
+            substitution = np.where(same, MATCH_SCORE, MISMATCH_SCORE)
+
+            # M: from any state at (i - 1, j - 1)
+            from_x = x_before[lo - 1:hi]
+            from_y = y_before[lo - 1:hi]
+            from_m = m_before[lo - 1:hi]
+            best = np.maximum(from_m, np.maximum(from_x, from_y))
+            m_state = np.where(from_x == best, STATE_X, np.where(from_y == best, STATE_Y, STATE_M))
+            m_current[lo:hi + 1] = best + substitution
+
+            # X: from (i - 1, j), extending an X gap or opening a new one
+            from_x = x_previous[lo - 1:hi] + continue_gap_penalty
+            from_y = y_previous[lo - 1:hi] + gap_penalty
+            from_m = m_previous[lo - 1:hi] + gap_penalty
+            best = np.maximum(from_m, np.maximum(from_x, from_y))
+            x_state = np.where(from_x == best, STATE_X, np.where(from_y == best, STATE_Y, STATE_M))
+            x_current[lo:hi + 1] = best
+
+            # Y: from (i, j - 1), extending a Y gap or opening a new one
+            from_x = x_previous[lo:hi + 1] + gap_penalty
+            from_y = y_previous[lo:hi + 1] + continue_gap_penalty
+            from_m = m_previous[lo:hi + 1] + gap_penalty
+            best = np.maximum(from_m, np.maximum(from_x, from_y))
+            y_state = np.where(from_x == best, STATE_X, np.where(from_y == best, STATE_Y, STATE_M))
+            y_current[lo:hi + 1] = best
+
+            rows = np.arange(lo, hi + 1)
+            directions[rows, d - rows] = (m_state | (x_state << 2) | (y_state << 4)).astype(np.uint8)
+
+        m_diagonals = [m_previous, m_current, m_before]
+        x_diagonals = [x_previous, x_current, x_before]
+        y_diagonals = [y_previous, y_current, y_before]
+
+    if n + m == 0:
+        return directions, STATE_M
+    corner = [m_diagonals[1][n], x_diagonals[1][n], y_diagonals[1][n]]
+    best = max(corner)
+    for state in (STATE_X, STATE_Y, STATE_M):
+        if corner[state] == best:
+            return directions, state
+
+
+def affine_trace_back_indices(directions: np.ndarray, state: int) -> list:
+    """
+    Follow the packed affine traceback from the bottom-right corner, starting in `state`,
+    and return (preferred index, other index) pairs, with None for gaps.
+    """
+
+    pairs = []
+    i, j = directions.shape[0] - 1, directions.shape[1] - 1
+    while i > 0 or j > 0:
+        if i == 0:
+            state = STATE_Y
+        elif j == 0:
+            state = STATE_X
+        packed = int(directions[i, j])
+        if state == STATE_M:
+            pairs.append((i - 1, j - 1))
+            state = packed & 3
+            i -= 1
+            j -= 1
+        elif state == STATE_X:
+            pairs.append((i - 1, None))
+            state = (packed >> 2) & 3
+            i -= 1
+        else:
+            pairs.append((None, j - 1))
+            state = (packed >> 4) & 3
+            j -= 1
+
+    return pairs[::-1]
+
+
+def gotoh(
+        preferred_mm: list,
+        other_mm: list,
+        gap_penalty: float = AFFINE_GAP_PENALTY,
+        continue_gap_penalty: float = CONTINUE_GAP_PENALTY
+) -> tuple:
+    """
+    Affine-gap (Gotoh) engine for `measuring_bars.needleman_wunsch`.
+    Continuing a gap is cheaper than opening a new one,
+    so material missing from one source (e.g., a first-time ending)
+    comes out as one contiguous gap rather than many isolated ones.
+    """
+
+    preferred_codes, other_codes = encode_measure_maps(preferred_mm, other_mm)
+    directions, state = affine_directions(preferred_codes, other_codes, gap_penalty, continue_gap_penalty)
+    return pairs_to_aligned(affine_trace_back_indices(directions, state), preferred_mm, other_mm)
+
+
+def gap_runs(preferred_aligned: list, other_aligned: list) -> list:
+    """
+    Summarise an alignment as its contiguous gaps, in the form
+    ("Missing", count, length) for preferred measures absent from the other source, and
+    ("Extra", count, length) for other measures absent from the preferred source,
+    where `count` is that of the first measure in the run.
+    """
+
+    runs = []
+    previous_kind = None
+    for x, y in zip(preferred_aligned, other_aligned):
+        if y is None:
+            kind, measure = "Missing", x
+        elif x is None:
+            kind, measure = "Extra", y
+        else:
+            kind, measure = None, None
+        if kind is not None:
+            if kind == previous_kind:
+                runs[-1][2] += 1
+            else:
+                runs.append([kind, measure["count"], 1])
+        previous_kind = kind
+
+    return [tuple(run) for run in runs]
+
+
+# ------------------------------------------------------------------------------
+
+def kmer_hashes(codes: np.ndarray, k: int) -> np.ndarray:
+    """Polynomial hash of every window of `k` consecutive codes (wrapping uint64 arithmetic)."""
+
+    if len(codes) < k:
+        return np.empty(0, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes.astype(np.uint64), k)
+    powers = np.uint64(1_000_003) ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+    return (windows * powers).sum(axis=1, dtype=np.uint64)
+
+
+def find_anchors(
+        preferred_codes: np.ndarray,
+        other_codes: np.ndarray,
+        k: int = 12
+) -> list:
+    """
+    Find exact matches between the two maps to anchor an alignment.
+
+    Seeds are runs of `k` measures whose comparison keys occur exactly once in each map.
+    The largest co-linear set of seeds is kept (a longest increasing subsequence),
+    and overlapping seeds on the same diagonal are chained into one anchor.
+
+    Returns (preferred index, other index, length) triples in increasing order.
+    """
+
+    preferred_hashes = kmer_hashes(preferred_codes, k)
+    other_hashes = kmer_hashes(other_codes, k)
+    if not len(preferred_hashes) or not len(other_hashes):
+        return []
+
+    def unique_hashes(hashes):
+        values, first, counts = np.unique(hashes, return_index=True, return_counts=True)
+        return values[counts == 1], first[counts == 1]
+
+    preferred_values, preferred_first = unique_hashes(preferred_hashes)
+    other_values, other_first = unique_hashes(other_hashes)
+    _, preferred_at, other_at = np.intersect1d(
+        preferred_values, other_values, assume_unique=True, return_indices=True
+    )
+    seeds_i = preferred_first[preferred_at]
+    seeds_j = other_first[other_at]
+
+    # Guard against hash collisions
+    windows = np.lib.stride_tricks.sliding_window_view
+    same = np.all(
+        windows(preferred_codes, k)[seeds_i] == windows(other_codes, k)[seeds_j],
+        axis=1
+    )
+    order = np.argsort(seeds_i[same], kind="stable")
+    seeds = list(zip(seeds_i[same][order].tolist(), seeds_j[same][order].tolist()))
+
+    # Longest chain of seeds increasing in both maps
+    tails, tail_index, parents = [], [], [None] * len(seeds)
+    for index, (_, j) in enumerate(seeds):
+        position = bisect_left(tails, j)
+        if position:
+            parents[index] = tail_index[position - 1]
+        if position == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[position] = j
+            tail_index[position] = index
+    chain = []
+    index = tail_index[-1] if tail_index else None
+    while index is not None:
+        chain.append(seeds[index])
+        index = parents[index]
+    chain.reverse()
+
+    anchors = []
+    for i, j in chain:
+        if anchors:
+            anchor_i, anchor_j, length = anchors[-1]
+            if i - j == anchor_i - anchor_j and i <= anchor_i + length:
+                anchors[-1] = (anchor_i, anchor_j, i + k - anchor_i)
+                continue
+            if i < anchor_i + length or j < anchor_j + length:
+                continue  # overlaps the previous anchor on another diagonal
+        anchors.append((i, j, k))
+
+    return anchors
+
+
+def anchored_alignment(
+        preferred_mm: list,
+        other_mm: list,
+        align,
+        k: int = 12
+) -> tuple:
+    """
+    Anchor-and-extend alignment.
+    Exact matches from `find_anchors` are aligned directly and
+    only the stretches between anchors are passed to `align`,
+    a function with the signature of `measuring_bars.needleman_wunsch`.
+    For typical pairs of editions, which agree on long stretches,
+    this replaces one large O(n * m) problem with several small ones.
+    """
+
+    preferred_codes, other_codes = encode_measure_maps(preferred_mm, other_mm)
+    anchors = find_anchors(preferred_codes, other_codes, k)
+
+    preferred_aligned, other_aligned = [], []
+    i, j = 0, 0
+    for anchor_i, anchor_j, length in anchors + [(len(preferred_mm), len(other_mm), 0)]:
+        gap_preferred, gap_other = align(preferred_mm[i:anchor_i], other_mm[j:anchor_j])
+        preferred_aligned += gap_preferred
+        other_aligned += gap_other
+        preferred_aligned += preferred_mm[anchor_i:anchor_i + length]
+        other_aligned += other_mm[anchor_j:anchor_j + length]
+        i, j = anchor_i + length, anchor_j + length
+
+    return preferred_aligned, other_aligned
@@ -1,10 +1,14 @@
 from __future__ import annotations
+import codecs
 import json
 import os
 import warnings
-from dataclasses import dataclass, asdict
+from bisect import bisect_right
+from dataclasses import dataclass, asdict, field, fields
 from numbers import Number
- from typing import Protocol, runtime_checkable, Optional, Sequence, List, Iterator
+from typing import Protocol, runtime_checkable, Optional, Sequence, List, Iterator, Dict, Tuple, BinaryIO
+
+import numpy as np
 
 from Code.utils import time_signature2nominal_length, collect_measure_maps
 
@@ -41,21 +45,19 @@ class PMeasure(Protocol):
     """A list of measure IDs that follow this measure."""
 
 
-@dataclass(kw_only=True)
-class Measure(PMeasure):
-    ID: Optional[str] = None
-    count: Optional[int] = None
-    qstamp: Optional[Number] = None
-    number: Optional[int] = None
-    name: Optional[str] = None
-    time_signature: Optional[str] = None
-    nominal_length: Optional[Number] = None
-    actual_length: Optional[Number] = None
-    start_repeat: Optional[bool] = None
-    end_repeat: Optional[bool] = None
-    next: Optional[list[int]] = None
+class MeasureMethods:
+    """Behaviour shared by Measure and SlottedMeasure. Defines no slots of its own, so that SlottedMeasure
+    instances carry no __dict__."""
+    __slots__ = ()
 
-    def __post_init__(self):
+    def validate(self):
+        """Checks the field values and coerces them to the expected types, in place.
+
+        Raises:
+            ValueError: If neither ID nor count is set.
+            AssertionError: If a length or qstamp is not a positive number.
+
+        """
         if self.ID is None and self.count is None:
             raise ValueError("Either ID or count must be set")
         if self.ID is not None:
@@ -129,6 +131,54 @@ class Measure(PMeasure):
         return time_signature2nominal_length(self.time_signature)  # ValueError if not a fraction
 
 
+@dataclass(kw_only=True)
+class Measure(MeasureMethods, PMeasure):
+    ID: Optional[str] = None
+    count: Optional[int] = None
+    qstamp: Optional[Number] = None
+    number: Optional[int] = None
+    name: Optional[str] = None
+    time_signature: Optional[str] = None
+    nominal_length: Optional[Number] = None
+    actual_length: Optional[Number] = None
+    start_repeat: Optional[bool] = None
+    end_repeat: Optional[bool] = None
+    next: Optional[list[int]] = None
+
+    def __post_init__(self):
+        self.validate()
+
+    @classmethod
+    def from_trusted(cls, **kwargs) -> Measure:
+        """Fast-path constructor for values from a known-good source: skips validation and coercion entirely.
+        Call .validate() (or MeasureMap.validate()) to check such entries later."""
+        measure = cls.__new__(cls)
+        measure.__dict__.update(MEASURE_DEFAULTS)
+        measure.__dict__.update(kwargs)
+        return measure
+
+
+@dataclass(kw_only=True, slots=True)
+class SlottedMeasure(MeasureMethods):
+    """Memory-light equivalent of Measure using __slots__. Its constructor does not validate, which makes it
+    the entry type for bulk loading of trusted files; validation is available via .validate()."""
+    ID: Optional[str] = None
+    count: Optional[int] = None
+    qstamp: Optional[Number] = None
+    number: Optional[int] = None
+    name: Optional[str] = None
+    time_signature: Optional[str] = None
+    nominal_length: Optional[Number] = None
+    actual_length: Optional[Number] = None
+    start_repeat: Optional[bool] = None
+    end_repeat: Optional[bool] = None
+    next: Optional[list[int]] = None
+
+
+MEASURE_TYPES = (Measure, SlottedMeasure)
+MEASURE_DEFAULTS = {f.name: f.default for f in fields(Measure)}
+
+
 def make_default_successor(
         measure: Measure,
         ignore_ids: bool = False
@@ -136,7 +186,7 @@ def make_default_successor(
     """Generates the successor in the MeasureMap based on default values. This method is at the heart of the
     compressed measure map: An entry that is identical to <predecessor>.get_default_successor() can be omitted
     because it can be perfectly restored."""
-    if not isinstance(measure, Measure):
+    if not isinstance(measure, MEASURE_TYPES):
         raise TypeError(f"measure must be a Measure, got {type(measure)!r}: {measure!r}")
     successor_values = asdict(measure)
     if successor_values["qstamp"] is not None:
@@ -187,7 +237,7 @@ def make_default_successor(
                 successor_values['next'] = [str(successor_values['number'] + 1)]
             else:
                 raise TypeError(f"Unexpected type of 'next' field item: {type(old_next_value)!r}: {old_next_value!r}")
-    successor = Measure(**successor_values)
+    successor = type(measure)(**successor_values)
     return successor
 
 
@@ -202,56 +252,803 @@ class PMeasureMap(Protocol):
         ...
 
 
+class MeasureList(list):
+    """A list that counts its modifications, so that indexes built over it can tell when they are out of date."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+
+    def _modified(method):
+        def wrapper(self, *args, **kwargs):
+            self.version += 1
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __setitem__ = _modified(list.__setitem__)
+    __delitem__ = _modified(list.__delitem__)
+    __iadd__ = _modified(list.__iadd__)
+    __imul__ = _modified(list.__imul__)
+    append = _modified(list.append)
+    extend = _modified(list.extend)
+    insert = _modified(list.insert)
+    pop = _modified(list.pop)
+    remove = _modified(list.remove)
+    clear = _modified(list.clear)
+    sort = _modified(list.sort)
+    reverse = _modified(list.reverse)
+    del _modified
+
+
 @dataclass()
 class MeasureMap(PMeasureMap):
     entries: List[Measure]
 
     def __post_init__(self):
         assert len(self.entries) > 1, "A MeasureMap must contain at least two entries."
-        if any(not isinstance(entry, Measure) for entry in self.entries):
+        if any(not isinstance(entry, MEASURE_TYPES) for entry in self.entries):
             raise TypeError(f"Entries must be of type Measure.")
 
+    def __setattr__(self, name, value):
+        if name == "entries" and not isinstance(value, MeasureList):
+            value = MeasureList(value)
+        super().__setattr__(name, value)
+
     def __iter__(self) -> Iterator[Measure]:
         yield from self.entries
 
+    # Lookup indexes. They are built on first use and rebuilt after any change to the list of entries. Changing the
+    # fields of an entry in place is not detected: call .invalidate_indexes() after doing so.
+
+    def invalidate_indexes(self):
+        self.__dict__.pop("_indexes", None)
+
+    def _get_indexes(self) -> dict:
+        indexes = self.__dict__.get("_indexes")
+        if indexes is None or indexes["entries"] is not self.entries or indexes["version"] != self.entries.version:
+            indexes = {"entries": self.entries, "version": self.entries.version}
+            self.__dict__["_indexes"] = indexes
+        return indexes
+
+    def _get_time_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Start and end qstamps of all entries. The entries' qstamps are used if they are all specified, otherwise
+        the qstamps are accumulated from the actual lengths, starting from 0."""
+        indexes = self._get_indexes()
+        if "time" not in indexes:
+            lengths = np.array([entry.get_actual_length() for entry in self.entries], dtype=np.float64)
+            qstamps = [entry.qstamp for entry in self.entries]
+            if None in qstamps:
+                starts = np.concatenate(([0.0], np.cumsum(lengths[:-1])))
+            else:
+                starts = np.array(qstamps, dtype=np.float64)
+            indexes["time"] = (starts, starts + lengths)
+        return indexes["time"]
+
+    def _get_number_index(self) -> Dict[Tuple[Optional[int], Optional[str]], List[int]]:
+        indexes = self._get_indexes()
+        if "number" not in indexes:
+            number_index = {}
+            for position, entry in enumerate(self.entries):
+                number_index.setdefault((entry.number, entry.name), []).append(position)
+            indexes["number"] = number_index
+        return indexes["number"]
+
+    def position_at_qstamp(self, qstamp: float) -> int:
+        """Returns the position of the entry containing the given quarter-note offset.
+
+        Raises:
+            KeyError: If no entry contains that offset.
+
+        """
+        starts, stops = self._get_time_index()
+        position = int(np.searchsorted(starts, qstamp, side='right')) - 1
+        if position < 0 or not qstamp < stops[position]:
+            raise KeyError(f"No entry contains qstamp {qstamp!r}.")
+        return position
+
+    def get_at_qstamp(self, qstamp: float) -> Measure:
+        """Returns the entry containing the given quarter-note offset."""
+        return self.entries[self.position_at_qstamp(qstamp)]
+
+    def positions_of_number(
+            self,
+            number: int,
+            name: Optional[str] = None
+    ) -> List[int]:
+        """Returns the positions of all entries with the given number and name (e.g., 16 and '16b')."""
+        return list(self._get_number_index().get((number, name), []))
+
+    def get_count(
+            self,
+            number: int,
+            name: Optional[str] = None
+    ) -> int:
+        """Returns the count of the first entry with the given number and name.
+
+        Raises:
+            KeyError: If there is no such entry.
+
+        """
+        positions = self.positions_of_number(number, name)
+        if not positions:
+            raise KeyError(f"No entry with number {number!r} and name {name!r}.")
+        return self.entries[positions[0]].count
+
+    def positions_overlapping(
+            self,
+            start: float,
+            stop: float
+    ) -> range:
+        """Returns the positions of the entries overlapping the span [start, stop) in quarter notes."""
+        starts, stops = self._get_time_index()
+        first = int(np.searchsorted(stops, start, side='right'))
+        last = int(np.searchsorted(starts, stop, side='left'))
+        return range(first, max(first, last))
+
+    def get_overlapping(
+            self,
+            start: float,
+            stop: float
+    ) -> List[Measure]:
+        """Returns the entries overlapping the span [start, stop) in quarter notes."""
+        return [self.entries[position] for position in self.positions_overlapping(start, stop)]
+
+    def validate(self):
+        """Validates all entries in one batch, which is how maps loaded with trusted=True are checked.
+
+        Raises:
+            ValueError: Listing every entry that fails validation.
+
+        """
+        errors = []
+        for index, entry in enumerate(self.entries):
+            try:
+                entry.validate()
+            except (AssertionError, ValueError, TypeError) as e:
+                errors.append(f"Entry {index} (count {entry.count!r}): {e}")
+        if errors:
+            raise ValueError(f"{len(errors)} invalid entries:\n" + "\n".join(errors))
+
     @classmethod
     def from_dicts(
             cls,
-            sequence_of_dicts: dict
+            sequence_of_dicts: dict,
+            trusted: bool = False
     ):
-        entries = [Measure(**d) for d in sequence_of_dicts]
+        """Creates a MeasureMap from a sequence of dicts. With trusted=True, the entries are created as SlottedMeasure
+        objects without per-entry validation; call .validate() to check them in one go."""
+        if trusted:
+            entries = [SlottedMeasure(**d) for d in sequence_of_dicts]
+        else:
+            entries = [Measure(**d) for d in sequence_of_dicts]
         return cls(entries)
 
     @classmethod
     def from_json_file(
             cls,
-            filepath: str
+            filepath: str,
+            trusted: bool = False
     ):
         with open(filepath, 'r', encoding='utf-8') as f:
             mm_json = json.load(f)
-        return cls.from_dicts(mm_json)
+        return cls.from_dicts(mm_json, trusted=trusted)
+
+
+# endregion MeasureMap
+# region ColumnarMeasureMap
+
+MEASURE_FIELDS = [f.name for f in fields(Measure)]
+INT_FIELDS = ["count", "number"]
+FLOAT_FIELDS = ["qstamp", "nominal_length", "actual_length"]
+STRING_FIELDS = ["ID", "name", "time_signature"]
+BOOL_FIELDS = ["start_repeat", "end_repeat"]
+
+
+def encode_column(
+        name: str,
+        values: list,
+        arrays: dict,
+        strings: List[str],
+        string_codes: Dict[str, int]
+) -> Optional[np.ndarray]:
+    """Encodes one field's Python values (None for missing values) as the array(s) of a ColumnarMeasureMap,
+    stored in `arrays`, interning any strings into `strings` (`string_codes` being its reverse lookup).
+    Returns the mask of missing values, or None if there are none."""
+    length = len(values)
+    mask = np.fromiter((value is None for value in values), dtype=bool, count=length)
+    if mask.any():
+        if name == "next":
+            values = [[] if value is None else value for value in values]
+        else:
+            placeholder = "" if name in STRING_FIELDS else 0
+            values = [placeholder if value is None else value for value in values]
+    else:
+        mask = None
+    if name in INT_FIELDS:
+        arrays[name] = np.array(values, dtype=np.int32).reshape(length)
+    elif name in FLOAT_FIELDS:
+        arrays[name] = np.array(values, dtype=np.float64).reshape(length)
+        if mask is not None:
+            arrays[name][mask] = np.nan
+    elif name in BOOL_FIELDS:
+        arrays[name] = np.array(values, dtype=bool).reshape(length)
+    elif name in STRING_FIELDS:
+        codes = []
+        for value in values:
+            value = str(value)
+            if value not in string_codes:
+                string_codes[value] = len(strings)
+                strings.append(value)
+            codes.append(string_codes[value])
+        arrays[name] = np.array(codes, dtype=np.int32).reshape(length)
+    else:  # next
+        lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=length)
+        arrays["next_offsets"] = np.zeros(length + 1, dtype=np.int64)
+        np.cumsum(lengths, out=arrays["next_offsets"][1:])
+        targets = [target for value in values for target in value]
+        if all(isinstance(target, (int, np.integer)) for target in targets):
+            arrays["next_targets"] = np.array(targets, dtype=np.int32)
+        else:  # Measure IDs (strings): kept as Python objects
+            arrays["next_targets"] = np.empty(len(targets), dtype=object)
+            arrays["next_targets"][:] = targets
+    return mask
+
+
+@dataclass()
+class ColumnarMeasureMap:
+    """A struct-of-arrays measure map: one NumPy array per field rather than one object per measure.
+
+    Strings (IDs, names and time signatures) are interned as int32 codes into the `strings` table, and the 'next'
+    lists are stored CSR-style, the targets of entry i being next_targets[next_offsets[i]:next_offsets[i + 1]].
+    The targets are int32 counts, or, if any is a measure ID rather than a count, an object array of the values.
+    Fields that are None for some entries have a boolean mask in `missing`; the values underneath are placeholders.
+    Absent keys and None values are treated alike.
+    """
+    ID: np.ndarray
+    count: np.ndarray
+    qstamp: np.ndarray
+    number: np.ndarray
+    name: np.ndarray
+    time_signature: np.ndarray
+    nominal_length: np.ndarray
+    actual_length: np.ndarray
+    start_repeat: np.ndarray
+    end_repeat: np.ndarray
+    next_offsets: np.ndarray
+    next_targets: np.ndarray
+    strings: List[str]
+    missing: Dict[str, np.ndarray] = field(default_factory=dict)
+    fields: List[str] = field(default_factory=lambda: list(MEASURE_FIELDS))
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    @classmethod
+    def from_columns(
+            cls,
+            columns: Dict[str, list],
+            strings: List[str] = None,
+            present_fields: List[str] = None
+    ) -> ColumnarMeasureMap:
+        """Builds the arrays from one list of Python values per field (None for missing values). Passing the same
+        `strings` list to several maps gives them a common string table, so that their codes can be compared."""
+        if strings is None:
+            strings = []
+        string_codes = {string: code for code, string in enumerate(strings)}
+        length = len(columns["count"])
+        arrays = {}
+        missing = {}
+        for name in MEASURE_FIELDS:
+            values = columns.get(name, [None] * length)
+            mask = encode_column(name, values, arrays, strings, string_codes)
+            if mask is not None:
+                missing[name] = mask
+        if present_fields is None:
+            present_fields = [name for name in MEASURE_FIELDS if name in columns]
+        return cls(**arrays, strings=strings, missing=missing, fields=list(present_fields))
+
+    @classmethod
+    def from_dicts(
+            cls,
+            sequence_of_dicts: Sequence[dict],
+            strings: List[str] = None
+    ) -> ColumnarMeasureMap:
+        """Converts a measure map in the form of a list of dicts (as used by measuring_bars)."""
+        present_fields = list(dict.fromkeys(key for d in sequence_of_dicts for key in d if key in MEASURE_FIELDS))
+        columns = {name: [d.get(name) for d in sequence_of_dicts] for name in MEASURE_FIELDS}
+        return cls.from_columns(columns, strings=strings, present_fields=present_fields)
+
+    @classmethod
+    def from_measure_map(
+            cls,
+            measure_map: MeasureMap,
+            strings: List[str] = None
+    ) -> ColumnarMeasureMap:
+        """Converts a MeasureMap of Measure objects."""
+        columns = {name: [getattr(measure, name) for measure in measure_map] for name in MEASURE_FIELDS}
+        present_fields = [name for name in MEASURE_FIELDS if any(value is not None for value in columns[name])]
+        return cls.from_columns(columns, strings=strings, present_fields=present_fields)
+
+    def get_column(self, name: str) -> list:
+        """Returns the values of one field as a list of Python objects, with None for missing values."""
+        if name == "next":
+            targets = self.next_targets.tolist()
+            offsets = self.next_offsets.tolist()
+            values = [targets[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        elif name in STRING_FIELDS:
+            values = [self.strings[code] for code in getattr(self, name).tolist()]
+        else:
+            values = getattr(self, name).tolist()
+        if name in self.missing:
+            values = [None if is_missing else value for value, is_missing in zip(values, self.missing[name].tolist())]
+        return values
+
+    def set_column(
+            self,
+            name: str,
+            values: list
+    ) -> None:
+        """Replaces the values of one field with a list of Python objects (None for missing values)."""
+        if len(values) != len(self):
+            raise ValueError(f"Expected {len(self)} values for '{name}', got {len(values)}.")
+        arrays = {}
+        string_codes = {string: code for code, string in enumerate(self.strings)} if name in STRING_FIELDS else {}
+        mask = encode_column(name, values, arrays, self.strings, string_codes)
+        for key, array in arrays.items():
+            setattr(self, key, array)
+        self._set_missing(name, mask)
+
+    def copy_fields(
+            self,
+            source: ColumnarMeasureMap,
+            names: List[str]
+    ) -> None:
+        """Copies the values of the given fields from a map of the same length (and `strings` table)."""
+        if len(source) != len(self):
+            raise ValueError(f"Cannot copy fields from a map of {len(source)} entries to one of {len(self)}.")
+        for name in names:
+            if name in STRING_FIELDS and source.strings is not self.strings:
+                self.set_column(name, source.get_column(name))
+                continue
+            for key in ["next_offsets", "next_targets"] if name == "next" else [name]:
+                setattr(self, key, getattr(source, key).copy())
+            self._set_missing(name, source.missing.get(name))
+
+    def _set_missing(
+            self,
+            name: str,
+            mask: Optional[np.ndarray]
+    ) -> None:
+        if mask is None:
+            self.missing.pop(name, None)
+        else:
+            self.missing[name] = mask.copy()
+
+    def to_dicts(self) -> List[dict]:
+        """Converts back to a list of dicts with the fields present in the original."""
+        columns = [self.get_column(name) for name in self.fields]
+        return [dict(zip(self.fields, row)) for row in zip(*columns)]
+
+    def to_measure_map(self) -> MeasureMap:
+        """Converts back to a MeasureMap of Measure objects."""
+        columns = {name: self.get_column(name) for name in MEASURE_FIELDS}
+        entries = [Measure(**dict(zip(MEASURE_FIELDS, row))) for row in zip(*columns.values())]
+        return MeasureMap(entries)
+
+    def get_next(self, index: int) -> np.ndarray:
+        """Returns the 'next' targets of the entry at the given (0-based) index."""
+        return self.next_targets[self.next_offsets[index]:self.next_offsets[index + 1]]
+
+    def is_missing(self, name: str) -> np.ndarray:
+        """Boolean mask of the entries for which the given field is None."""
+        if name in self.missing:
+            return self.missing[name]
+        return np.zeros(len(self), dtype=bool)
+
+    def mismatch_mask(
+            self,
+            other: ColumnarMeasureMap,
+            name: str
+    ) -> np.ndarray:
+        """Boolean mask of the entries whose value for the given field differs between the two maps, over their
+        common length. Two missing values are equal. String fields are compared by code if the maps share their
+        `strings` table, and otherwise by translating the other map's codes into this one's (see `string_codes_of`).
+        """
+        length = min(len(self), len(other))
+        self_missing = self.is_missing(name)[:length]
+        other_missing = other.is_missing(name)[:length]
+        if name == "next":
+            self_lengths = np.diff(self.next_offsets[:length + 1])
+            other_lengths = np.diff(other.next_offsets[:length + 1])
+            mask = self_lengths != other_lengths
+            compared = np.flatnonzero(~mask & (self_lengths > 0))
+            if len(compared):
+                # compare the targets of all same-length entries at once, then reduce per entry
+                lengths = self_lengths[compared]
+                starts = np.cumsum(lengths) - lengths
+                within = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+                differs = (
+                    self.next_targets[np.repeat(self.next_offsets[compared], lengths) + within]
+                    != other.next_targets[np.repeat(other.next_offsets[compared], lengths) + within]
+                )
+                mask[compared] = np.logical_or.reduceat(differs, starts)
+        elif name in STRING_FIELDS and self.strings is not other.strings:
+            mask = getattr(self, name)[:length] != self.string_codes_of(other.strings)[getattr(other, name)[:length]]
+        else:
+            mask = getattr(self, name)[:length] != getattr(other, name)[:length]
+        mask = np.where(self_missing | other_missing, self_missing != other_missing, mask)
+        return mask
+
+    def string_codes_of(self, strings: Sequence[str]) -> np.ndarray:
+        """The code of each string of another table in this map's `strings` table (-1 for those not in it),
+        for comparing maps with separate tables (e.g., one opened from an .mmb file) without decoding every entry."""
+        codes = {string: code for code, string in enumerate(self.strings)}
+        return np.array([codes.get(string, -1) for string in strings], dtype=np.int32).reshape(len(strings))
+
+
+# endregion ColumnarMeasureMap
+# region CompressedMeasureMap
+
+COMPRESSED_FORMAT = "compressed measure map"
+COMPRESSED_VERSION = 1
+
+
+def is_default_successor(
+        predecessor: Measure,
+        measure: Measure
+) -> bool:
+    """Whether `measure` can be perfectly restored as <predecessor>.get_default_successor()."""
+    try:
+        return measure == predecessor.get_default_successor()
+    except (AssertionError, TypeError, ValueError):
+        return False
+
+
+def compress_measure_map(
+        measure_map: PMeasureMap,
+        checkpoint_interval: int = 64
+) -> dict:
+    """Converts a MeasureMap into the compressed format: only entries that differ from their predecessor's default
+    successor are stored, as [position, {non-null fields}] pairs. Every `checkpoint_interval`-th entry is stored
+    regardless, so that restoring any entry takes fewer than `checkpoint_interval` successor steps."""
+    if checkpoint_interval < 1:
+        raise ValueError(f"checkpoint_interval must be positive, got {checkpoint_interval!r}")
+    stored = []
+    previous = None
+    length = 0
+    for position, measure in enumerate(measure_map):
+        if previous is None or position % checkpoint_interval == 0 or not is_default_successor(previous, measure):
+            stored.append([position, {k: v for k, v in asdict(measure).items() if v is not None}])
+        previous = measure
+        length += 1
+    return {
+        "format": COMPRESSED_FORMAT,
+        "version": COMPRESSED_VERSION,
+        "length": length,
+        "checkpoint_interval": checkpoint_interval,
+        "entries": stored,
+    }
+
+
+def write_compressed_measure_map(
+        measure_map: PMeasureMap,
+        filepath: str,
+        checkpoint_interval: int = 64
+) -> None:
+    """Writes a MeasureMap to a JSON file in the compressed format."""
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(compress_measure_map(measure_map, checkpoint_interval), f)
+
+
+class CompressedMeasureMap(PMeasureMap, Sequence):
+    """Read-only MeasureMap backed by the compressed format. Entries are restored lazily: accessing one costs a
+    binary search over the stored positions plus fewer than `checkpoint_interval` default-successor steps,
+    and nothing is expanded until it is accessed."""
+
+    def __init__(self, compressed: dict):
+        if compressed.get("format") != COMPRESSED_FORMAT:
+            raise ValueError(f"Not a compressed measure map: format = {compressed.get('format')!r}")
+        if compressed.get("version") != COMPRESSED_VERSION:
+            raise ValueError(f"Unsupported compressed measure map version: {compressed.get('version')!r}")
+        self.length = compressed["length"]
+        self.checkpoint_interval = compressed["checkpoint_interval"]
+        self.stored_positions = [position for position, _ in compressed["entries"]]
+        self.stored_values = [values for _, values in compressed["entries"]]
+        self.stored_counts = [values.get("count") for values in self.stored_values]
+        if not self.stored_positions or self.stored_positions[0] != 0:
+            raise ValueError("A compressed measure map must store its first entry.")
+        self._restored = {}
+
+    @property
+    def entries(self) -> CompressedMeasureMap:
+        return self
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Measure]:
+        next_stored = 0
+        measure = None
+        for position in range(self.length):
+            if next_stored < len(self.stored_positions) and self.stored_positions[next_stored] == position:
+                measure = self._get_stored(next_stored)
+                next_stored += 1
+            else:
+                measure = measure.get_default_successor()
+            yield measure
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self.length))]
+        if position < 0:
+            position += self.length
+        if not 0 <= position < self.length:
+            raise IndexError(f"Position {position} out of range for a measure map of length {self.length}.")
+        stored = bisect_right(self.stored_positions, position) - 1
+        measure = self._get_stored(stored)
+        for _ in range(position - self.stored_positions[stored]):
+            measure = measure.get_default_successor()
+        return measure
+
+    def _get_stored(self, stored: int) -> Measure:
+        if stored not in self._restored:
+            self._restored[stored] = Measure(**self.stored_values[stored])
+        return self._restored[stored]
+
+    def position_of_count(self, count: int) -> int:
+        """Returns the position of the entry with the given count, found by binary search over the stored entries,
+        whose counts increase by one with each default successor.
+
+        Raises:
+            KeyError: If no entry has that count.
+
+        """
+        if None in self.stored_counts:
+            raise ValueError("Lookup by count requires every stored entry to have a count.")
+        stored = bisect_right(self.stored_counts, count) - 1
+        if stored >= 0:
+            position = self.stored_positions[stored] + count - self.stored_counts[stored]
+            following = self.stored_positions[stored + 1] if stored + 1 < len(self.stored_positions) else self.length
+            if position < following:
+                return position
+        raise KeyError(f"No entry with count {count!r}.")
+
+    def get_by_count(self, count: int) -> Measure:
+        return self[self.position_of_count(count)]
+
+    def to_measure_map(self) -> MeasureMap:
+        """Expands all entries into a regular MeasureMap."""
+        return MeasureMap(list(self))
+
+    @classmethod
+    def from_measure_map(
+            cls,
+            measure_map: PMeasureMap,
+            checkpoint_interval: int = 64
+    ) -> CompressedMeasureMap:
+        return cls(compress_measure_map(measure_map, checkpoint_interval))
+
+    @classmethod
+    def from_json_file(
+            cls,
+            filepath: str
+    ) -> CompressedMeasureMap:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            compressed = json.load(f)
+        return cls(compressed)
+
+
+# endregion CompressedMeasureMap
+# region LazyMeasureMap
+
+def scan_json_array(
+        file: BinaryIO,
+        chunk_size: int = 1 << 16,
+        after: Optional[int] = None
+) -> Iterator[Tuple[int, int, object]]:
+    """Incrementally parses a file containing a top-level JSON array, reading it in chunks of `chunk_size` bytes.
+    Yields (start, stop, value) for each element of the array, where start and stop are byte offsets in the file,
+    so that an element can later be re-read on its own with file.seek(start); file.read(stop - start).
+    Given the `after` (stop) offset of an element already scanned, carries on from the next element.
+
+    Raises:
+        ValueError: If the file is not a well-formed JSON array.
+
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ""
+    position = 0  # in the buffer
+    offset = 0  # byte offset of buffer[position] in the file
+    exhausted = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, exhausted
+        if exhausted:
+            return False
+        chunk = file.read(chunk_size)
+        exhausted = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk, final=exhausted)
+        position = 0
+        return True
+
+    def skip_whitespace() -> str:
+        """Advances past whitespace and returns the next character ('' at the end of the file)."""
+        nonlocal position, offset
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\n\r':
+                position += 1
+                offset += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    if after is not None:
+        file.seek(after)
+        offset = after
+        separator = skip_whitespace()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' after the array element ending at byte {after}, got {separator!r}.")
+        position += 1
+        offset += 1
+    else:
+        if skip_whitespace() == '\ufeff':  # byte order mark
+            position += 1
+            offset += 3
+        if skip_whitespace() != "[":
+            raise ValueError("Expected a JSON array.")
+        position += 1
+        offset += 1
+        if skip_whitespace() == "]":
+            return
+    while True:
+        skip_whitespace()
+        while True:
+            try:
+                value, stop = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if read_more():
+                    continue
+                raise
+            if stop == len(buffer) and not exhausted:  # could be a truncated number, read on to be sure
+                read_more()
+                continue
+            break
+        start = offset
+        offset += len(buffer[position:stop].encode('utf-8'))
+        position = stop
+        yield start, offset, value
+        separator = skip_whitespace()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' after the array element at byte {start}, got {separator!r}.")
+        position += 1
+        offset += 1
+
+
+def iter_measures(
+        filepath: str,
+        trusted: bool = False
+) -> Iterator[Measure]:
+    """Yields the entries of a .measuremap.json file one at a time, without loading the whole file. With
+    trusted=True, entries are SlottedMeasure objects created without validation (see MeasureMap.from_dicts)."""
+    measure_type = SlottedMeasure if trusted else Measure
+    with open(filepath, 'rb') as f:
+        for _, _, values in scan_json_array(f):
+            yield measure_type(**values)
+
+
+class LazyMeasureMap(PMeasureMap, Sequence):
+    """Read-only MeasureMap over a .measuremap.json file that deserializes entries on demand. The file is scanned
+    only as far as needed, recording the byte offsets of each entry on the way, so that accessing the first bars
+    of a long map reads only the start of the file and later accesses re-read single entries.
+    Re-reads share one file handle, kept open until close() (or the end of a `with` block)."""
+
+    def __init__(
+            self,
+            filepath: str,
+            trusted: bool = False
+    ):
+        self.filepath = filepath
+        self.measure_type = SlottedMeasure if trusted else Measure
+        self.offsets: List[Tuple[int, int]] = []
+        self._scanner = None
+        self._complete = False
+        self._file: Optional[BinaryIO] = None
+
+    def __enter__(self) -> LazyMeasureMap:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the file handles. Later accesses reopen the file as needed."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._scanner is not None:
+            self._scanner.close()
+            self._scanner = None
+
+    @property
+    def entries(self) -> LazyMeasureMap:
+        return self
+
+    def _scan_one(self) -> Optional[dict]:
+        """Scans the next entry, records its offsets and returns its values (None once the file is exhausted)."""
+        if self._complete:
+            return None
+        if self._scanner is None:
+            self._scanner = self._scan()
+        try:
+            start, stop, values = next(self._scanner)
+        except StopIteration:
+            self._complete = True
+            self._scanner = None
+            return None
+        self.offsets.append((start, stop))
+        return values
+
+    def _scan(self) -> Iterator[Tuple[int, int, object]]:
+        after = self.offsets[-1][1] if self.offsets else None  # after close(), carries on from the last entry scanned
+        with open(self.filepath, 'rb') as f:
+            yield from scan_json_array(f, after=after)
+
+    def _read(self, position: int) -> Measure:
+        start, stop = self.offsets[position]
+        if self._file is None:
+            self._file = open(self.filepath, 'rb')
+        self._file.seek(start)  # entries read in order mostly stay within the buffer
+        values = json.loads(self._file.read(stop - start).decode('utf-8'))
+        return self.measure_type(**values)
+
+    def __len__(self) -> int:
+        while self._scan_one() is not None:
+            pass
+        return len(self.offsets)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if position < 0:
+            raise IndexError("Position out of range.")
+        while position >= len(self.offsets):
+            values = self._scan_one()
+            if values is None:
+                raise IndexError(f"Position {position} out of range for a measure map of length {len(self.offsets)}.")
+            if position == len(self.offsets) - 1:
+                return self.measure_type(**values)
+        return self._read(position)
+
+    def __iter__(self) -> Iterator[Measure]:
+        position = 0
+        while True:
+            if position < len(self.offsets):
+                yield self._read(position)
+            else:
+                values = self._scan_one()
+                if values is None:
+                    return
+                yield self.measure_type(**values)
+            position += 1
+
+    def to_measure_map(self) -> MeasureMap:
+        """Materializes all entries into a regular MeasureMap."""
+        return MeasureMap(list(self))
 
 
 if __name__ == '__main__':
     parent = os.path.dirname(os.path.dirname(__file__))
     mm_paths = collect_measure_maps(parent)
     for mm_path in mm_paths:
-        print(mm_path)
         MM = MeasureMap.from_json_file(mm_path)
-        # prototype of compression algorithm:
-        previous_measure = None
-        for measure in MM:
-            if previous_measure is None:
-                previous_measure = measure
-                continue
-            default_successor = previous_measure.get_default_successor()
-            if measure == default_successor:
-                print(f"MC {measure.count} can be re-generated from its predecessor.")
-            else:
-                print(
-                    f"MC {measure.count} cannot be re-generated from its predecessor.\n"
-                    f"Displaying (predecessor MC {previous_measure.count}, default successor, actual successor MC"
-                    f" {measure.count}):"
-                    f"\n\t{previous_measure}\n\t{default_successor}\n\t{measure}"
-                    )
-            previous_measure = measure
+        compressed = compress_measure_map(MM)
+        print(f"{mm_path}: {len(compressed['entries'])} of {compressed['length']} entries stored.")
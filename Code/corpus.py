@@ -0,0 +1,505 @@
+"""
+
+NAME:
+===============================
+Corpus (corpus.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Parallel corpus runs: one task (e.g., `measuring_bars.one_comparison`) for each pair of
+corresponding `preferred` and `other` sources, dispatched to a pool of worker processes.
+
+Pairs are scheduled largest first (by the combined size of the two files),
+so that the longest tasks do not start last and leave the other workers idle at the end.
+Each pair runs in isolation: an exception is caught and recorded, and the run goes on.
+So are the failures that an exception cannot report:
+a pair can be given a time limit, after which it is stopped (or, failing that, its worker killed),
+and the pairs running when a worker dies (e.g., killed when out of memory) are run again,
+at the same time but each on a worker of its own, to find and record the one that killed it.
+Workers are replaced after a number of pairs, so that memory leaked by a task does not build up over a long run.
+The results (status, timing, changes or error of each pair) are written to a JSON manifest,
+and each is also recorded in a log as it completes, so that a run that is stopped partway can be resumed.
+
+A corpus too large for one machine can be split into shards (`i/N`, for i in 1 ... N),
+partitioned by a stable hash of each pair's path (relative to the corpus folder),
+so that nodes sharing the corpus on a filesystem can each run a shard without any coordination.
+Each shard writes a results file of its own, which can be re-run alone (or resumed, re-running only
+the pairs without a successful result), and the shard results are then merged into one corpus report.
+
+"""
+
+# ------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Generator, Iterator, TextIO
+
+
+# ------------------------------------------------------------------------------
+
+SHARD_NAME = "{stem}.shard-{index}-of-{count}{suffix}"
+MAX_TASKS_PER_CHILD = 100  # Pairs per worker process before it is replaced (from Python 3.11)
+KILL_GRACE = 30.0  # Seconds past its time limit before the worker running a pair is killed
+WORKER_DIED = "BrokenProcessPool: the worker process died (e.g., killed when out of memory, or crashed)"
+KILLED = "TimeoutError: Killed after the time limit of {timeout} seconds."
+
+
+def find_pairs(
+        base_path: Path,
+        preferred_name: str,
+        other_name: str
+) -> list[tuple[Path, Path]]:
+    """
+    Find each `preferred_name` file under `base_path`, paired with the `other_name` file in the same folder.
+    The pairs are in path order; a missing `other` is left for the run to report.
+    """
+    return sorted((x, x.parent / other_name) for x in base_path.rglob(preferred_name))
+
+
+def pair_size(pair: tuple[Path, Path]) -> int:
+    """The combined size of the files in a pair (counting a missing file as empty)."""
+    return sum(x.stat().st_size for x in pair if x.is_file())
+
+
+def largest_first(pairs: list[tuple[Path, Path]]) -> list[tuple[Path, Path]]:
+    """Order pairs by decreasing size, and then by path."""
+    return sorted(pairs, key=lambda pair: (-pair_size(pair), pair))
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Read a shard specification `i/N` (shard i of N, counting from 1) as (i, N)."""
+    match = re.fullmatch(r"\s*([0-9]+)\s*/\s*([0-9]+)\s*", spec)
+    if match is None or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f"A shard is given as i/N, with i from 1 to N: {spec!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_of(path: Path, count: int) -> int:
+    """The shard (from 1 to `count`) of a path, by a hash that is the same for every process and machine."""
+    digest = hashlib.sha1(path.as_posix().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def shard_pairs(
+        pairs: list[tuple[Path, Path]],
+        base_path: Path,
+        shard: tuple[int, int]
+) -> list[tuple[Path, Path]]:
+    """The pairs in a shard (i, N), by the path of each preferred source relative to `base_path`."""
+    index, count = shard
+    return [x for x in pairs if shard_of(x[0].relative_to(base_path), count) == index]
+
+
+def shard_manifest_name(manifest_name: str, shard: tuple[int, int]) -> str:
+    """The name of a shard's results file, e.g., `corpus_results.shard-2-of-8.json`."""
+    path = Path(manifest_name)
+    return SHARD_NAME.format(stem=path.stem, index=shard[0], count=shard[1], suffix=path.suffix)
+
+
+@contextmanager
+def time_limit(seconds: float = None) -> Iterator[None]:
+    """
+    Raise TimeoutError in the code run within, once it has taken more than `seconds`.
+    Only where there is SIGALRM (not on Windows), and in the main thread: elsewhere, there is no limit.
+    """
+    if seconds is None or not hasattr(signal, "SIGALRM") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise TimeoutError(f"Stopped after the time limit of {seconds} seconds.")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_pair(
+        task: Callable,
+        pair: tuple[Path, Path],
+        timeout: float = None
+) -> dict:
+    """
+    Run the task on one (preferred, other) pair, catching any exception,
+    and return the result entry for the manifest.
+    A task returning a diagnosis (list of changes) has the kind of each change recorded.
+    A task running for more than `timeout` seconds is stopped with a TimeoutError (see `time_limit`).
+    """
+    preferred, other = pair
+    result = {"preferred": str(preferred), "other": str(other)}
+    start = time.perf_counter()
+    try:
+        with time_limit(timeout):
+            diagnosis = task(preferred, other)
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = f"{type(error).__name__}: {error}"
+        result["traceback"] = traceback.format_exc()
+    else:
+        result["status"] = "ok"
+        if isinstance(diagnosis, list):
+            result["changes"] = [x[0] for x in diagnosis]
+    result["seconds"] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def failed_pair(
+        pair: tuple[Path, Path],
+        error: str,
+        seconds: float
+) -> dict:
+    """The result entry for a pair that could not report its own error (see `iter_pool_results`)."""
+    return {"preferred": str(pair[0]), "other": str(pair[1]), "status": "error", "error": error,
+            "seconds": round(seconds, 6)}
+
+
+def iter_results(
+        task: Callable,
+        pairs: list[tuple[Path, Path]],
+        processes: int = None,
+        timeout: float = None,
+        max_tasks_per_child: int = MAX_TASKS_PER_CHILD
+) -> Iterator[dict]:
+    """
+    Run the task on each pair, largest first, and generate the result entries as they complete.
+    With processes=None, all cores are used; with processes=1, the pairs run in this process, in turn.
+    See `run_pair` for the `timeout`, and `iter_pool_results` and `iter_isolated_results` for what happens when a worker dies.
+    """
+    pairs = largest_first(pairs)
+    processes = min(processes or os.cpu_count() or 1, max(len(pairs), 1))
+    if processes == 1:
+        for pair in pairs:
+            yield run_pair(task, pair, timeout)
+        return
+
+    pending = deque(pairs)
+    while pending:
+        lost = yield from iter_pool_results(task, pending, processes, timeout, max_tasks_per_child)
+        yield from iter_isolated_results(task, lost, timeout)  # Running when a worker died: to tell which killed it
+
+
+def iter_pool_results(
+        task: Callable,
+        pending: deque,
+        processes: int,
+        timeout: float = None,
+        max_tasks_per_child: int = None
+) -> Generator[dict, None, list]:
+    """
+    Run the task on the pending pairs (taken from the left) on a pool of worker processes,
+    and generate the result entries as they complete.
+    Each worker is given one pair at a time, so that the pairs running are known:
+    if a worker dies, the pool is broken, and the pairs that were running are returned (the others left pending).
+    A pair still running `KILL_GRACE` seconds after its `timeout` (e.g., stuck where it cannot be interrupted)
+    is recorded as an error, and the workers killed: the pairs the others were running go back to pending.
+    """
+
+    def new_executor() -> ProcessPoolExecutor:
+        if max_tasks_per_child and sys.version_info >= (3, 11):
+            return ProcessPoolExecutor(processes, max_tasks_per_child=max_tasks_per_child)
+        return ProcessPoolExecutor(processes)
+
+    executor = new_executor()
+    running = {}  # Future to (pair, start time)
+    try:
+        while pending or running:
+            while pending and len(running) < processes:
+                pair = pending.popleft()
+                running[executor.submit(run_pair, task, pair, timeout)] = (pair, time.perf_counter())
+            done, _ = wait(running, timeout=None if timeout is None else 1.0, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                running.pop(future)
+                yield result
+            if broken:
+                return [pair for pair, _ in running.values()]
+
+            now = time.perf_counter()
+            overdue = [x for x in running if timeout is not None and now - running[x][1] > timeout + KILL_GRACE]
+            if overdue:
+                kill_workers(executor)
+                executor.shutdown(wait=True, cancel_futures=True)
+                for future in overdue:
+                    pair, start = running.pop(future)
+                    yield failed_pair(pair, KILLED.format(timeout=timeout), now - start)
+                pending.extendleft(pair for pair, _ in reversed(list(running.values())))
+                running = {}
+                executor = new_executor()
+        return []
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_isolated_results(
+        task: Callable,
+        pairs: list[tuple[Path, Path]],
+        timeout: float = None
+) -> Iterator[dict]:
+    """
+    Run the task on each pair at the same time, each on a pool of its own (of one worker process),
+    and generate the result entries as they complete.
+    A pair whose worker dies is recorded as having killed it, without affecting the others;
+    and a pair still running `KILL_GRACE` seconds after its `timeout` has its worker killed.
+    """
+
+    running = {}  # Future to (pair, start time, executor)
+    try:
+        for pair in pairs:
+            executor = ProcessPoolExecutor(1)
+            running[executor.submit(run_pair, task, pair, timeout)] = (pair, time.perf_counter(), executor)
+        while running:
+            done, _ = wait(running, timeout=None if timeout is None else 1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                pair, start, executor = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    result = failed_pair(pair, WORKER_DIED, time.perf_counter() - start)
+                executor.shutdown(wait=False)
+                yield result
+
+            now = time.perf_counter()
+            for future in [x for x in running if timeout is not None and now - running[x][1] > timeout + KILL_GRACE]:
+                pair, start, executor = running.pop(future)
+                kill_workers(executor)
+                executor.shutdown(wait=False, cancel_futures=True)
+                yield failed_pair(pair, KILLED.format(timeout=timeout), now - start)
+    finally:
+        for _, _, executor in running.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def kill_workers(executor: ProcessPoolExecutor) -> None:
+    """Terminate the worker processes of a pool, and so the tasks they are running."""
+    for process in list(executor._processes.values()):  # No public way to stop a running task
+        process.terminate()
+
+
+def run_pairs(
+        task: Callable,
+        pairs: list[tuple[Path, Path]],
+        manifest_path: Path = None,
+        processes: int = None,
+        resume: bool = False,
+        timeout: float = None,
+        base_path: Path = None
+) -> dict:
+    """
+    Run the task on each (preferred, other) pair in parallel (see `iter_results`, and `run_pair` for the `timeout`),
+    and return the results manifest, also writing it to `manifest_path` if given.
+    With a `base_path`, the paths in the results are relative to it,
+    so that they do not depend on where the corpus is (e.g., mounted at different paths on different nodes).
+    Each result is also appended to a log (see `results_log_path`) as it completes, which is removed once the
+    manifest is written: so a run that is stopped partway (e.g., its node preempted) leaves the results so far.
+    With resume=True, the successful results recorded for `manifest_path` (see `read_results`) are kept,
+    and only the other pairs run.
+    """
+
+    def name(path: Path) -> str:
+        return path.relative_to(base_path).as_posix() if base_path is not None else str(path)
+
+    start = time.perf_counter()
+    pairs = {(name(x), name(y)): (x, y) for x, y in pairs}
+    kept = []
+    if resume and manifest_path is not None:
+        kept = [x for x in read_results(manifest_path)
+                if x["status"] == "ok" and (x["preferred"], x["other"]) in pairs]
+        for x in kept:
+            del pairs[x["preferred"], x["other"]]
+
+    results = kept
+    log = None
+    if manifest_path is not None:
+        write_results_log(kept, results_log_path(manifest_path))
+        log = open(results_log_path(manifest_path), "a")
+    try:
+        for result in iter_results(task, list(pairs.values()), processes, timeout):
+            result["preferred"], result["other"] = name(Path(result["preferred"])), name(Path(result["other"]))
+            results.append(result)
+            if log is not None:
+                log.write(json.dumps(result) + "\n")
+                log.flush()
+    finally:
+        if log is not None:
+            log.close()
+
+    manifest = summarise(results)
+    manifest["seconds"] = round(time.perf_counter() - start, 6)
+    if manifest_path is not None:
+        write_manifest(manifest, manifest_path)
+        results_log_path(manifest_path).unlink()
+    return manifest
+
+
+def run_corpus(
+        task: Callable,
+        base_path: Path,
+        preferred_name: str,
+        other_name: str,
+        processes: int = None,
+        manifest_name: str = "corpus_results.json",
+        shard: tuple[int, int] = None,
+        resume: bool = False,
+        timeout: float = None
+) -> dict:
+    """
+    Run the task on each pair of a corpus (see `find_pairs`), or on those of one shard (i, N),
+    writing the results manifest to `manifest_name` in `base_path`, or to the shard's own results file.
+
+    The pairs run in parallel on `processes` worker processes (default: one per core), largest first.
+    An error in any one pair is recorded (not raised) in the results manifest, which is returned (see `run_pairs`).
+
+    To split the corpus between nodes, each runs one `shard` (i, N) of the pairs,
+    writing its own results file (e.g., `corpus_results.shard-2-of-8.json`), and `merge_shards` combines them.
+    With resume=True, only the pairs without a successful result recorded by an earlier run
+    (whether it completed or was stopped partway) run again.
+    A pair that takes more than `timeout` seconds is stopped and recorded as an error (see `run_pair`).
+    """
+    pairs = find_pairs(base_path, preferred_name, other_name)
+    if shard is not None:
+        pairs = shard_pairs(pairs, base_path, shard)
+        manifest_name = shard_manifest_name(manifest_name, shard)
+    return run_pairs(task, pairs, base_path / manifest_name, processes, resume, timeout, base_path)
+
+
+def merge_shards(
+        base_path: Path,
+        manifest_name: str = "corpus_results.json",
+        count: int = None
+) -> dict:
+    """
+    Merge the shard results files in `base_path` into one corpus report, written to `manifest_name` there.
+    The report lists any shards missing (not yet run), and the total time spent on the shards.
+    Only the files of one partition, into `count` shards, are merged: by default,
+    that of the shard file written last, so that any files left from an earlier partition are ignored.
+    """
+    pattern = shard_manifest_name(manifest_name, ("*", "*"))
+    paths = {}
+    for path in base_path.glob(pattern):
+        index, shard_count = map(int, re.findall(r"shard-([0-9]+)-of-([0-9]+)", path.name)[-1])
+        paths[index, shard_count] = path
+    if count is None and paths:
+        count = max(paths.items(), key=lambda x: x[1].stat().st_mtime)[0][1]
+    shards = {key: read_manifest(path) for key, path in sorted(paths.items()) if key[1] == count}
+
+    count = count or 0
+    report = summarise([x for manifest in shards.values() for x in manifest["results"]])
+    report["seconds"] = round(sum(x["seconds"] for x in shards.values()), 6)
+    report["shards"] = [f"{index}/{count}" for index, count in sorted(shards)]
+    report["missing_shards"] = [f"{x}/{count}" for x in range(1, count + 1) if (x, count) not in shards]
+    write_manifest(report, base_path / manifest_name)
+    return report
+
+
+def add_corpus_arguments(parser) -> None:
+    """
+    Add the options of a corpus run (see `run_corpus`) and of the merge of its shards (see `merge_shards`)
+    to an `argparse.ArgumentParser`. See `corpus_run_options` for passing them on.
+    """
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Run only shard i of N, e.g., 2/8")
+    parser.add_argument("--resume", action="store_true", help="Only run the pairs without a successful result")
+    parser.add_argument("--merge", nargs="?", type=int, const=0, default=None, metavar="N",
+                        help="Merge the shard results (of a run in N shards, by default the latest) into one report")
+    parser.add_argument("--timeout", type=float, default=None, help="Time limit for each pair, in seconds")
+
+
+def corpus_run_options(args) -> dict:
+    """The keyword arguments of a corpus run, from the options parsed (see `add_corpus_arguments`)."""
+    return {"processes": args.processes, "shard": args.shard, "resume": args.resume, "timeout": args.timeout}
+
+
+def summarise(results: list[dict]) -> dict:
+    """A results manifest: the counts of pairs and errors, and the results in path order."""
+    results = sorted(results, key=lambda x: (x["preferred"], x["other"]))
+    return {
+        "pairs": len(results),
+        "errors": sum(x["status"] == "error" for x in results),
+        "results": results
+    }
+
+
+def read_manifest(manifest_path: Path) -> dict:
+    """Read a results manifest."""
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: dict, manifest_path: Path) -> None:
+    """Write a results manifest as JSON (see `replace_file`)."""
+    with replace_file(manifest_path) as file:
+        json.dump(manifest, file, indent=4)
+
+
+def results_log_path(manifest_path: Path) -> Path:
+    """The log of the results of a run writing to `manifest_path`, e.g., `corpus_results.shard-2-of-8.jsonl`."""
+    return manifest_path.with_suffix(".jsonl")
+
+
+def read_results(manifest_path: Path) -> list[dict]:
+    """
+    The results recorded by the runs writing to `manifest_path`: those in its manifest, if any,
+    updated by those in its log (one JSON object per line), if a later run was stopped before writing the manifest.
+    A last line cut short (by a run stopped while writing it) is skipped.
+    """
+    results = {}
+    if manifest_path.exists():
+        for x in read_manifest(manifest_path)["results"]:
+            results[x["preferred"], x["other"]] = x
+    log_path = results_log_path(manifest_path)
+    if log_path.exists():
+        with open(log_path, "r") as file:
+            for line in file:
+                try:
+                    x = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[x["preferred"], x["other"]] = x
+    return list(results.values())
+
+
+def write_results_log(results: list[dict], log_path: Path) -> None:
+    """Start the log of a run with the results given (see `replace_file`)."""
+    with replace_file(log_path) as file:
+        for x in results:
+            file.write(json.dumps(x) + "\n")
+
+
+@contextmanager
+def replace_file(path: Path) -> Iterator[TextIO]:
+    """
+    Open a temporary file next to `path` for writing, and swap it in for `path` once written,
+    so that the file at `path` is never left half-written.
+    """
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "w") as file:
+        yield file
+    os.replace(temporary, path)
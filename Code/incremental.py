@@ -0,0 +1,217 @@
+"""
+
+NAME:
+===============================
+Incremental Comparison (incremental.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Incremental re-diagnosis of two measure maps for interactive, editorial work.
+
+`measuring_bars.Compare` diagnoses a pair of maps from scratch.
+`IncrementalCompare` instead keeps the mismatch masks of every field (and the count of mismatches per block of bars)
+between edits, so that after a localised edit to either map
+only the edited window is compared again,
+along with the qstamps after it, which shift by the change in the window's total length.
+
+"""
+
+import copy
+
+import numpy as np
+
+from .base import ColumnarMeasureMap
+from .measuring_bars import Compare, MISMATCH_FIELDS
+
+
+# ------------------------------------------------------------------------------
+
+class IncrementalCompare:
+    """
+    Keeps the diagnosis of two measure maps (lists of dicts, as used by measuring_bars) up to date through edits.
+
+    Edit the maps with `edit` and `replace` (not directly) so that the state stays in step.
+    The maps passed in are edited in place.
+    """
+
+    def __init__(
+        self,
+        preferred: list[dict],
+        other: list[dict],
+        block_size: int = 64
+    ):
+        self.maps = {"preferred": preferred, "other": other}
+        self.block_size = block_size
+        self.qstamps = {side: self._qstamp_array(measure_map) for side, measure_map in self.maps.items()}
+        self.mismatches = {}
+        self.block_counts = {}
+        self._compare(0, None)
+
+    # Edits
+
+    def edit(
+        self,
+        side: str,
+        index: int,
+        **changes
+    ) -> None:
+        """
+        Change the fields of one measure (by 0-based index) in the "preferred" or "other" map, e.g.
+        `edit("other", 11, actual_length=3.0)`.
+        """
+        measure = dict(self.maps[side][index], **changes)
+        self.replace(side, index, index + 1, [measure])
+
+    def replace(
+        self,
+        side: str,
+        start: int,
+        stop: int,
+        measures: list[dict],
+        shift_qstamps: bool = True
+    ) -> None:
+        """
+        Replace the measures start:stop (0-based, as in a slice) of the "preferred" or "other" map.
+
+        If `shift_qstamps` is True (default), the qstamps of the measures after the window
+        move by the difference between the total actual_length of the new measures and the old.
+        Counts and `next` targets are left as given: see `measuring_bars.perform_batch_edits` for restructuring.
+
+        A replacement of the same number of measures updates the state for that window
+        (and the qstamps after it) only.
+        Otherwise, the measures after the window are paired afresh, so everything from the window on is compared again.
+        """
+        if side not in self.maps:
+            raise ValueError(f"Side must be 'preferred' or 'other', not {side}.")
+        measure_map = self.maps[side]
+        old = measure_map[start:stop]
+        measure_map[start:stop] = measures
+        new_stop = start + len(measures)
+
+        qstamps = self.qstamps[side]
+        self.qstamps[side] = np.concatenate([qstamps[:start], self._qstamp_array(measures), qstamps[stop:]])
+
+        if shift_qstamps:
+            shift = sum(x["actual_length"] for x in measures) - sum(x["actual_length"] for x in old)
+            if shift:
+                for measure in measure_map[new_stop:]:
+                    if measure.get("qstamp") is not None:
+                        measure["qstamp"] += shift
+                self.qstamps[side][new_stop:] += shift  # NaN stays NaN
+
+        self._compare(start, new_stop if len(measures) == stop - start else None)
+
+    # Diagnosis
+
+    def mismatched_blocks(self, name: str) -> np.ndarray:
+        """Start indices (0-based) of the blocks of `block_size` bars with at least one mismatch in the given field."""
+        return np.flatnonzero(self.block_counts[name]) * self.block_size
+
+    @property
+    def diagnosis(self) -> list:
+        """
+        The diagnosis in the terms of `measuring_bars.Compare`.
+
+        While the maps have the same length, this is read from the kept masks:
+        repeat marks, renumbering, measure lengths and time signatures, in the terms `Compare` uses,
+        but without attempting any fixes, so every mismatched field is reported.
+        `Compare` reports less when the numbering differs: its renumbering (`try_renumber`, with the maps swapped)
+        replaces the other map with the preferred one, and so hides the mismatches it has not yet reported.
+        Maps of different lengths need restructuring, which this defers to a full `Compare` (on copies).
+        """
+        preferred, other = self.maps["preferred"], self.maps["other"]
+        if len(preferred) != len(other):
+            return Compare(copy.deepcopy(preferred), copy.deepcopy(other)).diagnosis
+
+        diagnosis = []
+        start_mismatch = self.mismatches["start_repeat"]
+        end_mismatch = self.mismatches["end_repeat"]
+        for i in np.flatnonzero(start_mismatch | end_mismatch).tolist():
+            if start_mismatch[i]:
+                diagnosis.append(("Repeat_Marks", preferred[i]["count"], "start"))
+            if end_mismatch[i]:
+                diagnosis.append(("Repeat_Marks", preferred[i]["count"], "end"))
+        if self.mismatches["number"].any():
+            diagnosis.append(("Renumber", "all"))
+        for i in np.flatnonzero(self.mismatches["actual_length"]).tolist():
+            diagnosis.append(("Measure_Length", i + 1, preferred[i]["actual_length"]))
+        for i in np.flatnonzero(self.mismatches["time_signature"]).tolist():
+            diagnosis.append(("Time_Signature", i + 1, preferred[i]["time_signature"]))
+        return diagnosis
+
+    # State
+
+    @staticmethod
+    def _qstamp_array(measures: list[dict]) -> np.ndarray:
+        qstamps = [x.get("qstamp") for x in measures]
+        return np.array([np.nan if x is None else x for x in qstamps], dtype=float)
+
+    def _compare(
+        self,
+        start: int,
+        stop: int = None
+    ) -> None:
+        """
+        Compare the common part of the maps from start to stop (None for the end), replacing the kept state,
+        and the qstamps from start to the end.
+        """
+        preferred, other = self.maps["preferred"], self.maps["other"]
+        common = min(len(preferred), len(other))
+        stop = common if stop is None else min(stop, common)
+        start = min(start, stop)
+
+        strings = []
+        preferred_window = ColumnarMeasureMap.from_dicts(preferred[start:stop], strings)
+        other_window = ColumnarMeasureMap.from_dicts(other[start:stop], strings)
+        for name in MISMATCH_FIELDS:
+            if name == "qstamp":
+                continue
+            mask = preferred_window.mismatch_mask(other_window, name)
+            if name in self.mismatches:
+                self.mismatches[name] = np.concatenate([self.mismatches[name][:start], mask,
+                                                        self.mismatches[name][stop:common]])
+            else:
+                self.mismatches[name] = mask
+        self._compare_qstamps(start)
+        for name in self.mismatches:
+            if name != "qstamp":
+                self._count_blocks(name, start, stop)
+
+    def _compare_qstamps(self, start: int) -> None:
+        """Compare the qstamps from start to the end of the common part of the maps."""
+        preferred, other = self.qstamps["preferred"], self.qstamps["other"]
+        common = min(len(preferred), len(other))
+        preferred, other = preferred[start:common], other[start:common]
+        preferred_missing, other_missing = np.isnan(preferred), np.isnan(other)
+        mask = np.where(preferred_missing | other_missing, preferred_missing != other_missing, preferred != other)
+        if "qstamp" in self.mismatches:
+            mask = np.concatenate([self.mismatches["qstamp"][:start], mask])
+        self.mismatches["qstamp"] = mask
+        self._count_blocks("qstamp", start, common)
+
+    def _count_blocks(
+        self,
+        name: str,
+        start: int,
+        stop: int
+    ) -> None:
+        """Update the per-block mismatch counts of the given field for the blocks overlapping start:stop."""
+        mask = self.mismatches[name]
+        number_of_blocks = -(-len(mask) // self.block_size)
+        counts = self.block_counts.get(name)
+        if counts is None or len(counts) != number_of_blocks:
+            counts = np.zeros(number_of_blocks, dtype=np.int64)
+            first_block, last_block = 0, number_of_blocks
+        else:
+            first_block, last_block = start // self.block_size, -(-stop // self.block_size)
+        if last_block > first_block:
+            window = mask[first_block * self.block_size:last_block * self.block_size].astype(np.int64)
+            counts[first_block:last_block] = np.add.reduceat(window, np.arange(0, len(window), self.block_size))
+        self.block_counts[name] = counts
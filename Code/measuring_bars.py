@@ -20,19 +20,39 @@ Other modules provide format-specific applications (e.g., see music21_applicatio
 """
 
 import json
+import warnings
+from collections import deque
 from pathlib import Path
+
+import numpy as np
+
+from . import alignment
+from . import corpus
+from . import repeats
+from .base import ColumnarMeasureMap
 from . import REPO_FOLDER
 
 
 # ------------------------------------------------------------------------------
 
+MISMATCH_FIELDS = ["qstamp", "number", "time_signature", "start_repeat", "end_repeat",
+                   "actual_length", "nominal_length"]
+FIX_ORDER = ["repeats", "number", "actual_length", "time_signature", "qstamp", "nominal_length"]
+DEPENDS_ON = {"qstamp": "actual_length", "nominal_length": "time_signature"}
+RECALCULATIONS = {"qstamp", "nominal_length"}
+
+
 class Compare:
     def __init__(
         self,
         preferred: list[dict],
         other: list[dict],
         attempt_fix: bool = False,
-        write_modifications: bool = False
+        write_modifications: bool = False,
+        alignment_engine: str = "numpy",
+        linear_memory_threshold: int = 16_000_000,
+        anchor_k: int = 12,
+        length_comparison: str = "cumulative"
     ):
         self.preferred_mm = preferred
         self.other_mm = other
@@ -40,6 +60,10 @@ class Compare:
         self.renumbered_flag = False
         self.attempt_fix = attempt_fix
         self.write_modifications = write_modifications
+        self.alignment_engine = alignment_engine
+        self.linear_memory_threshold = linear_memory_threshold
+        self.anchor_k = anchor_k
+        self.length_comparison = length_comparison
 
         self.preferred_length = len(self.preferred_mm)
         self.other_length = len(self.other_mm)
@@ -49,140 +73,204 @@ class Compare:
 
         self.diagnosis = []
         self.attempted_changes = []
+        self.mismatches = {}
+        self.columns = None  # Columnar copies of the common part of both maps, kept up to date by the fixes
         self.diagnose()
 
-    def diagnose(self):
+    def diagnose(self, max_passes: int = 1000):
         """
         Attempt to diagnose the differences between two measure maps and
         optionally attempt to align them (if argument "fix" is True).
+
+        Diagnosis runs as a loop of passes rather than by recursion.
+        Each pass computes the mismatch masks of all fields in one vectorised sweep (see `find_mismatches`)
+        and queues every fix they call for, in order of priority:
+        repeat marks, numbering, actual lengths, time signatures, then the qstamp and nominal length recalculations.
+        A fix that depends on the outcome of an earlier one in the same pass
+        (qstamps on actual lengths, nominal lengths on time signatures) is left to the next pass,
+        as is everything after renumbering.
+        The loop stops when a pass finds nothing (more) to fix, and the number of passes is recorded in `self.passes`.
+
+        Raises:
+            RuntimeError: if the diagnosis has not settled after `max_passes` passes.
         """
 
-        self.preferred_length = len(self.preferred_mm)
-        self.other_length = len(self.other_mm)
+        self.passes = 0
+        previous_fixes = set()
+        self.columns = None
 
-        mismatch_qstamps = False
-        mismatch_number = False
-        mismatch_time_signature = False
-        mismatch_repeats = False
-        mismatch_actual_lengths = False
-        mismatch_nominal_lengths = False
-        repeats = False
-
-        for i in range(min(self.preferred_length, self.other_length)):
-            if self.preferred_mm[i]["qstamp"] != self.other_mm[i].get("qstamp"):
-                mismatch_qstamps = True
-            if self.preferred_mm[i]["number"] != self.other_mm[i].get("number"):
-                mismatch_number = True
-            if self.preferred_mm[i]["time_signature"] != self.other_mm[i].get("time_signature"):
-                mismatch_time_signature = True
-            if self.preferred_mm[i]["start_repeat"] != self.other_mm[i].get("start_repeat") \
-                    or self.preferred_mm[i]["end_repeat"] != self.other_mm[i].get("end_repeat"):
-                mismatch_repeats = True
-            if self.preferred_mm[i]["actual_length"] != self.other_mm[i]["actual_length"]:
-                mismatch_actual_lengths = True
-            if self.preferred_mm[i]["nominal_length"] != self.other_mm[i]["nominal_length"]:
-                mismatch_nominal_lengths = True
-
-            if self.other_mm[i].get("end_repeat") is True:
-                repeats = True
-
-        # print(self.other_mm)
-
-        if all(not x for x in [mismatch_qstamps,
-                               mismatch_number,
-                               mismatch_time_signature,
-                               mismatch_repeats,
-                               mismatch_actual_lengths,
-                               mismatch_nominal_lengths
-                               ]
-               ) and not self.preferred_length == self.other_length:
-            if self.attempt_fix or self.write_modifications:  # TODO implement write_modifications
-                return self.diagnosis
-            else:
-                return self.other_mm
+        while True:
+            self.passes += 1
+            if self.passes > max_passes:
+                raise RuntimeError(f"Diagnosis did not settle after {max_passes} passes.")
 
-        if self.preferred_length != self.other_length:
-            self.compare_lengths()
-            for change in self.diagnosis:
-                if change not in self.attempted_changes:
-                    if change[0] == "Join":
-                        self.other_mm = perform_join(self.other_mm, change)
-                        self.other_length = len(self.other_mm)
-                        self.attempted_changes.append(change)
-                    elif change[0] == "Split":
-                        self.other_mm = perform_split(self.other_mm, change)
-                        self.other_length = len(self.other_mm)
+            self.preferred_length = len(self.preferred_mm)
+            self.other_length = len(self.other_mm)
+            other = self.find_mismatches()
+            has_repeats = (other.end_repeat & ~other.is_missing("end_repeat")).any()
+
+            if not any(mask.any() for mask in self.mismatches.values()) \
+                    and not self.preferred_length == self.other_length:
+                # As per the recursive version, the diagnosis is only returned when it is settled on the first pass.
+                if (self.attempt_fix or self.write_modifications) and self.passes == 1:  # TODO implement write_modifications
+                    return self.diagnosis
+                else:
+                    return self.other_mm
+
+            if self.preferred_length != self.other_length:
+                start = len(self.diagnosis)
+                if self.length_comparison == "adjacent":
+                    self.compare_lengths()
+                else:
+                    self.compare_cumulative_lengths()
+                changes = []
+                for change in self.diagnosis[start:]:
+                    if change[0] in ("Join", "Split"):
+                        # Cumulative groups can repeat a change (e.g., two joins at one position): apply all of them.
+                        if self.length_comparison == "adjacent" and change in self.attempted_changes:
+                            continue
+                        changes.append(change)
                         self.attempted_changes.append(change)
-            if self.preferred_length == self.other_length:
-                self.diagnose()
-            else:
-                if not self.expanded_flag and repeats:
+                if changes:
+                    self.other_mm = perform_batch_edits(self.other_mm, changes)
+                    self.other_length = len(self.other_mm)
+                    self.columns = None
+                if self.preferred_length == self.other_length:
+                    continue
+                if not self.expanded_flag and has_repeats:
+                    self.expanded_flag = True
+                    difference = repeats.compare_repeat_structure(self.preferred_mm, self.other_mm)
+                    if not difference:  # Expanding both alike would not help
+                        continue
+                    self.diagnosis.append(("Repeat_Structure", difference))
                     self.preferred_mm = perform_expand_repeats(self.preferred_mm)
                     self.preferred_length = len(self.preferred_mm)
                     self.other_mm = perform_expand_repeats(self.other_mm)
                     self.other_length = len(self.other_mm)
-                    self.expanded_flag = True
+                    self.columns = None
                     self.diagnosis.append(("Expand_Repeats", "Both"))
-                    self.diagnose()
-                else:
-                    preferred_aligned, other_aligned = needleman_wunsch(self.old_preferred,
-                                                                        self.old_other
-                                                                        )
-                    self.diagnosis.append(
-                        ("Needleman-Wunsch", preferred_aligned, other_aligned)
+                    continue
+                if self.anchor_k:
+                    preferred_aligned, other_aligned = alignment.anchored_alignment(
+                        self.old_preferred,
+                        self.old_other,
+                        self.align,
+                        k=self.anchor_k
                     )
-                    # self.diagnosis.append("test")  # TODO: fix
-                    return self.diagnosis
-                    # TODO: worst case scenario?
-
-        elif mismatch_repeats:  # Above mismatch_number, fails otherwise
-            for i in range(self.preferred_length):
-                if self.preferred_mm[i]["start_repeat"] != self.other_mm[i]["start_repeat"]:
-                    self.diagnosis.append(
-                        ("Repeat_Marks", self.preferred_mm[i]["count"], "start")
-                    )
-                if self.preferred_mm[i]["end_repeat"] != self.other_mm[i]["end_repeat"]:
-                    self.diagnosis.append(
-                        ("Repeat_Marks", self.preferred_mm[i]["count"], "end")
-                    )
-            perform_repeat_copy(self.preferred_mm, self.other_mm)
-            self.diagnose()
-
-        elif mismatch_number:
-            if not self.renumbered_flag:
-                self.other_mm = try_renumber(self.other_mm, self.preferred_mm)
-                self.other_length = len(self.other_mm)
-                self.diagnosis.append(("Renumber", "all"))
-                self.renumbered_flag = True
-                self.diagnose()
-
-        elif mismatch_actual_lengths:
-            for i in range(self.preferred_length):
-                if self.preferred_mm[i]["actual_length"] != self.other_mm[i]["actual_length"]:
-                    self.diagnosis.append(
-                        ("Measure_Length", i + 1, self.preferred_mm[i]["actual_length"])
-                    )
-            perform_actual_length_copy(self.preferred_mm, self.other_mm)
-            self.diagnose()
-
-        elif mismatch_time_signature:
-            for i in range(self.preferred_length):
-                if self.preferred_mm[i]["time_signature"] != self.other_mm[i]["time_signature"]:
-                    self.diagnosis.append(
-                        ("Time_Signature", i + 1, self.preferred_mm[i]["time_signature"])
-                    )
-            perform_time_signature_copy(self.preferred_mm, self.other_mm)
-            self.diagnose()
+                else:
+                    preferred_aligned, other_aligned = self.align(self.old_preferred, self.old_other)
+                self.diagnosis.append(
+                    ("Needleman-Wunsch", preferred_aligned, other_aligned)
+                )
+                # TODO: worst case scenario?
+                return self.diagnosis if self.passes == 1 else self.other_mm
+
+            queue = deque(fix for fix in FIX_ORDER if self.mismatches[fix].any())
+            fixes = set()
+            while queue:
+                fix = queue.popleft()
+                if DEPENDS_ON.get(fix) in fixes:
+                    continue  # Picked up by the next pass if still needed
+                fixes.add(fix)
+
+                if fix == "repeats":  # Above numbering, fails otherwise
+                    start_mismatch = self.mismatches["start_repeat"]
+                    end_mismatch = self.mismatches["end_repeat"]
+                    for i in np.flatnonzero(start_mismatch | end_mismatch):
+                        if start_mismatch[i]:
+                            self.diagnosis.append(
+                                ("Repeat_Marks", self.preferred_mm[i]["count"], "start")
+                            )
+                        if end_mismatch[i]:
+                            self.diagnosis.append(
+                                ("Repeat_Marks", self.preferred_mm[i]["count"], "end")
+                            )
+                    perform_repeat_copy(self.preferred_mm, self.other_mm)
+                    self.columns["other"].copy_fields(self.columns["preferred"], ["start_repeat", "end_repeat", "next"])
+
+                elif fix == "number":
+                    if self.renumbered_flag:
+                        return self.other_mm
+                    self.other_mm = try_renumber(self.other_mm, self.preferred_mm)
+                    self.other_length = len(self.other_mm)
+                    self.columns = None
+                    self.diagnosis.append(("Renumber", "all"))
+                    self.renumbered_flag = True
+                    break  # Renumbering replaces the other map: leave the rest to the next pass
+
+                elif fix == "actual_length":
+                    for i in np.flatnonzero(self.mismatches["actual_length"]).tolist():
+                        self.diagnosis.append(
+                            ("Measure_Length", i + 1, self.preferred_mm[i]["actual_length"])
+                        )
+                    perform_actual_length_copy(self.preferred_mm, self.other_mm)
+                    self.columns["other"].copy_fields(self.columns["preferred"], ["actual_length"])
+
+                elif fix == "time_signature":
+                    for i in np.flatnonzero(self.mismatches["time_signature"]).tolist():
+                        self.diagnosis.append(
+                            ("Time_Signature", i + 1, self.preferred_mm[i]["time_signature"])
+                        )
+                    perform_time_signature_copy(self.preferred_mm, self.other_mm)
+                    self.columns["other"].copy_fields(self.columns["preferred"], ["time_signature"])
+
+                elif fix == "qstamp":
+                    perform_qstamp_recalculation(self.other_mm)  # TODO: diagnosis?
+                    self.refresh_column("qstamp")
+
+                elif fix == "nominal_length":
+                    perform_nominal_length_recalculation(self.other_mm)
+                    self.refresh_column("nominal_length")
+
+            # Stop if there was nothing to fix, or if repeating a recalculation has not cleared its mismatch.
+            if not fixes or (fixes == previous_fixes and fixes <= RECALCULATIONS):
+                return self.other_mm
+            previous_fixes = fixes
 
-        elif mismatch_qstamps:
-            perform_qstamp_recalculation(self.other_mm)
-            self.diagnose()  # TODO: diagnosis?
+    def find_mismatches(self, names: list = MISMATCH_FIELDS) -> ColumnarMeasureMap:
+        """
+        Compute the mismatch masks for the common part of the two measure maps in one vectorised pass,
+        storing them by field name in `self.mismatches` ("repeats" combining the start and end repeat masks).
+        Returns the common part of the other measure map in columnar form.
 
-        elif mismatch_nominal_lengths:
-            perform_nominal_length_recalculation(self.other_mm)
-            self.diagnose()
+        The columnar maps are only built when missing (at first, or after a fix that replaces a measure map):
+        the fixes that change fields in place update the affected columns instead (see `diagnose`).
+        """
+        if self.columns is None:
+            common = min(len(self.preferred_mm), len(self.other_mm))
+            strings = []
+            self.columns = {
+                "preferred": ColumnarMeasureMap.from_dicts(self.preferred_mm[:common], strings),
+                "other": ColumnarMeasureMap.from_dicts(self.other_mm[:common], strings)
+            }
+        preferred, other = self.columns["preferred"], self.columns["other"]
+        for name in names:
+            self.mismatches[name] = preferred.mismatch_mask(other, name)
+        if "start_repeat" in names or "end_repeat" in names:
+            self.mismatches["repeats"] = self.mismatches["start_repeat"] | self.mismatches["end_repeat"]
+        return other
+
+    def refresh_column(self, name: str):
+        """Re-read one field of the other measure map into its columnar copy, after a fix has recalculated it."""
+        other = self.columns["other"]
+        other.set_column(name, [x.get(name) for x in self.other_mm[:len(other)]])
+
+    def align(self, preferred: list, other: list) -> tuple:
+        """
+        Align two measure maps with needleman_wunsch and the chosen engine,
+        switching to the linear-memory engine if the full matrix would exceed `linear_memory_threshold` cells.
+        """
+        engine = self.alignment_engine
+        if (len(preferred) + 1) * (len(other) + 1) > self.linear_memory_threshold:
+            engine = "hirschberg"
+        return needleman_wunsch(preferred, other, engine=engine)
 
-        return self.other_mm
+    def compare_cumulative_lengths(self):
+        """
+        Find the joins and splits that turn the other measure map's bars into those of the preferred,
+        (see `cumulative_length_changes`) and add them to the diagnosis.
+        """
+        self.diagnosis += cumulative_length_changes(self.preferred_mm, self.other_mm)
 
     def compare_lengths(self):
         i = 0
@@ -204,6 +292,61 @@ class Compare:
 
 # ------------------------------------------------------------------------------
 
+def cumulative_length_changes(
+        preferred: list,
+        other: list,
+        max_group: int = 16,
+        tolerance: float = 1e-6
+) -> list:
+    """
+    Find the many-to-many correspondences between the bars of two measure maps
+    by merging the cumulative actual_length boundaries of both in one two-pointer pass.
+
+    Wherever the two maps reach a common boundary, the bars since the last common boundary form a group:
+    p bars in the preferred map corresponding to q in the other.
+    Groups of p == q bars are left alone (any differences are measure lengths, not barring).
+    Otherwise, the group is reported as q - 1 ("Join", position) changes, which make one bar of the q,
+    followed by p - 1 ("Split", position, length) changes, which cut it into the p preferred bars.
+    So a long cadenza bar against many short ones is a run of splits, and the reverse a run of joins.
+    Positions are those of the map as edited by the changes before, as expected by `perform_batch_edits`.
+
+    Groups of more than `max_group` bars on either side are treated as a divergence rather than a rebarring,
+    and left to the later steps of the comparison (repeats, alignment), as is any unmatched tail.
+    """
+
+    i = j = 0
+    group_i = group_j = 0
+    shift = 0  # Difference between the other's and preferred's count within groups left alone
+    preferred_end = other_end = 0.0
+    changes = []
+
+    while i < len(preferred) and j < len(other):
+        if i == group_i and j == group_j:
+            preferred_end += preferred[i]["actual_length"]
+            other_end += other[j]["actual_length"]
+        if abs(preferred_end - other_end) <= tolerance:
+            i += 1
+            j += 1
+            p, q = i - group_i, j - group_j
+            if p != q and p <= max_group and q <= max_group:
+                position = group_i + shift + 1
+                changes += [("Join", position)] * (q - 1)
+                changes += [("Split", position + k, preferred[group_i + k]["actual_length"]) for k in range(p - 1)]
+            elif p != q:
+                shift += q - p
+            group_i, group_j = i, j
+        elif preferred_end < other_end:
+            i += 1
+            if i < len(preferred):
+                preferred_end += preferred[i]["actual_length"]
+        else:
+            j += 1
+            if j < len(other):
+                other_end += other[j]["actual_length"]
+
+    return changes
+
+
 def perform_split(other, change):
     """
     Performs a split on the other measure map
@@ -250,6 +393,88 @@ def perform_join(other, change):
     return other
 
 
+def perform_batch_edits(other, changes):
+    """
+    Performs a batch of ("Join", count) and ("Split", count, offset) changes
+    (as found by Compare.compare_lengths) on the other measure map in one linear pass.
+
+    As when calling perform_join and perform_split in turn,
+    each change refers to the measure map as left by the changes before it.
+    Rather than renumbering the tail of the map after every change,
+    the counts, numbers and "next" targets are settled once at the end.
+    Returns a new measure map: the input is not modified.
+    Changes that refer to measures beyond the end of the map are skipped with a warning.
+    """
+
+    source = iter(other)
+    output = []
+    origins = []  # For each output measure, the original counts that now start there
+    joins = 0
+
+    def pull(length):
+        """Copy measures from the input until the output has `length` of them."""
+        while len(output) < length:
+            measure = next(source, None)
+            if measure is None:
+                return False
+            output.append(dict(measure, number=measure["number"] - joins, next=list(measure["next"])))
+            origins.append([measure["count"]])
+        return True
+
+    for change in changes:
+        position = change[1]
+        if change[0] == "Join":
+            if not pull(position + 1):
+                warnings.warn(f"Cannot join measure {position} with the next: out of range.")
+                continue
+            first, second = output[position - 1], output.pop(position)
+            first["actual_length"] += second["actual_length"]
+            first["end_repeat"] = second["end_repeat"]
+            first["next"] = second["next"]
+            origins[position - 1] += origins.pop(position)
+            for measure in output[position:]:
+                measure["number"] -= 1
+            joins += 1
+        elif change[0] == "Split":
+            if not pull(position):
+                warnings.warn(f"Cannot split measure {position}: out of range.")
+                continue
+            first = output[position - 1]
+            second = dict(first, next=list(first["next"]))
+            second["qstamp"] += change[2]
+            second["actual_length"] -= change[2]
+            first["actual_length"] = float(change[2])
+            first["start_repeat"] = False
+            first["end_repeat"] = False  # Repeats?
+            first["next"] = None  # The second part, once counts are settled
+            output.insert(position, second)
+            origins.insert(position, [])
+    pull(float("inf"))
+
+    if not output:
+        return output
+
+    first_count = other[0]["count"]
+    last_count = other[-1]["count"]
+    new_counts = {}
+    for index, counts in enumerate(origins):
+        for count in counts:
+            new_counts[count] = first_count + index
+    shift = len(output) - len(other)
+
+    for index, measure in enumerate(output):
+        measure["count"] = first_count + index
+        if measure["next"] is None:
+            measure["next"] = [measure["count"] + 1]
+        else:
+            measure["next"] = [
+                new_counts.get(target, target + shift if target > last_count else target)
+                for target in measure["next"]
+            ]
+
+    return output
+
+
 def try_renumber(preferred, other):
     """
     Renumbers measures in other measure map to match the numbering in the preferred measure map
@@ -260,6 +485,32 @@ def try_renumber(preferred, other):
     return other
 
 
+def perform_full_measure_numbering(measure_map):
+    """
+    Renumber a measure map (in place) by the "Full Measure" standard,
+    as music21_application.impose_numbering_standard does to a part (see notes there),
+    so that a map extracted without music21 can be numbered as if the standard had been imposed first.
+    """
+
+    count = 0
+    for index in range(len(measure_map) - 1):
+        measure = measure_map[index]
+        if measure["actual_length"] + measure_map[index + 1]["actual_length"] == measure["nominal_length"]:
+            count += 1
+            measure["number"] = count
+        elif index != 0 and measure["actual_length"] + measure_map[index - 1]["actual_length"] \
+                == measure_map[index - 1]["nominal_length"]:
+            measure["number"] = count
+        elif index == 0:
+            measure["number"] = count
+        else:
+            count += 1
+            measure["number"] = count
+    if measure_map:
+        measure_map[-1]["number"] = count + 1
+    return measure_map
+
+
 def perform_repeat_copy(preferred, other):
     """
     Copy the repeat markings from the preferred measure map to the other measure map
@@ -322,45 +573,138 @@ def perform_qstamp_recalculation(other):
 
 def perform_expand_repeats(measure_map):
     """
-    Expand all the repeats in other measure map
+    Expand all the repeats in other measure map.
+    The measure map is not modified: see repeats.ExpandedMeasureMap for the expansion without copies.
     """
 
-    measure_order = [1]
-    i = 0
-    while i < len(measure_map) - 1:
-        if not measure_map[i]["next"]:
-            measure_map[i]["next"].append(measure_map[i]["count"] + 1)
-        next = measure_map[i]["next"].pop(0)
-        measure_order.append(next)
-        i = next - 1
+    return repeats.ExpandedMeasureMap(measure_map).to_dicts()
+
 
-    expanded_map = []
-    index = 1
-    for measure_count in measure_order:
-        expanded_map.append(measure_map[measure_count - 1].copy())
-        expanded_map[index - 1]["count"] = index
-        expanded_map[index - 1]["next"] = [index + 1]
-        expanded_map[index - 1]["start_repeat"] = False
-        expanded_map[index - 1]["end_repeat"] = False
-        index += 1
+# ------------------------------------------------------------------------------
+
+def iter_measure_map(
+        bars,
+        settled: bool = True
+):
+    """
+    Generate a measure map from the bar attributes read from a source, in one pass, for extractors of any format.
 
-    return expanded_map
+    Each bar is a dict with the measure map's
+    "qstamp", "number", "nominal_length", "actual_length", "time_signature", "start_repeat" and "end_repeat",
+    plus "left_barline": the type of any (non-repeat) left barline ("regular" for a second-time bar), else None.
+    This adds the "count" and works out the "next" targets from the repeats and second-time bars.
+
+    A measure's "next" can gain a target when a later measure starts a second-time bar,
+    so the entries from the last possible such measure onwards are held back until they are settled.
+    With settled=False, each entry is yielded straight away instead,
+    and its "next" list may still be changed (in place) until the generator is exhausted.
+    """
+
+    pending = deque()  # Entries that may still be updated, from count `first_pending`
+    first_pending = 1
+    go_back_to = 1
+    go_forward_from = 1
+    previous_end_repeat = False
+
+    count = 0
+    for count, bar in enumerate(bars, start=1):
+        if count > 1 and not (previous_end_repeat and count - 1 > go_forward_from != 1):
+            pending[-1]["next"].append(count)  # The previous measure was not the last
+
+        next = []
+        start_repeat, end_repeat = bar["start_repeat"], bar["end_repeat"]
+        if start_repeat:  # Crude method to add next measure information including for multiple endings from repeats
+            go_back_to = count
+        elif bar["left_barline"]:
+            if bar["left_barline"] == "regular" and previous_end_repeat:
+                pending[go_forward_from - first_pending]["next"].append(count)
+            elif bar["left_barline"] == "regular":
+                go_forward_from = count - 1
+        if end_repeat:
+            next.append(go_back_to)
+
+        pending.append({
+            "count": count,
+            "qstamp": bar["qstamp"],
+            "number": bar["number"],
+            "nominal_length": bar["nominal_length"],
+            "actual_length": bar["actual_length"],
+            "time_signature": bar["time_signature"],
+            "start_repeat": start_repeat,
+            "end_repeat": end_repeat,
+            "next": next
+        })
+        previous_end_repeat = end_repeat
+
+        if not settled:
+            yield pending[-1]
+        while first_pending < go_forward_from:
+            entry = pending.popleft()
+            if settled:
+                yield entry
+            first_pending += 1
+
+    if settled:
+        yield from pending
+
+
+def first_difference(
+        measure_map: list,
+        entries
+):
+    """
+    Compare a measure map with the entries of another as they are generated
+    (e.g., by iter_measure_map with settled=False),
+    returning the count of the first measure that differs (or None if they match).
+    The "next" targets, which can change until the entries are exhausted, are compared last.
+    """
+
+    seen = []
+    for index, entry in enumerate(entries):
+        if index >= len(measure_map) or \
+                any(value != measure_map[index].get(key) for key, value in entry.items() if key != "next"):
+            return index + 1
+        seen.append(entry)
+
+    if len(seen) < len(measure_map):
+        return len(seen) + 1
+
+    for index, entry in enumerate(seen):
+        if entry["next"] != measure_map[index]["next"]:
+            return index + 1
+
+    return None
 
 
 # ------------------------------------------------------------------------------
 
-def needleman_wunsch(preferred_mm, other_mm):
+def needleman_wunsch(preferred_mm, other_mm, engine: str = "numpy"):
     """
     A standard alignment algorithm of some (limited) use for this use case.
     # TODO: make output easier to interpret for end user?
+
+    The `engine` argument selects the implementation:
+    "python" for the reference list-of-lists version below,
+    "numpy" for the vectorised equivalent in `alignment` (identical output), or
+    "hirschberg" for the linear-memory version (same score, ties may resolve differently), or
+    "affine" for the affine-gap (Gotoh) version, which favours continuing gaps over new gaps.
     """
 
+    if engine == "numpy":
+        return alignment.needleman_wunsch_numpy(preferred_mm, other_mm)
+    elif engine == "hirschberg":
+        return alignment.hirschberg(preferred_mm, other_mm)
+    elif engine == "affine":
+        return alignment.gotoh(preferred_mm, other_mm)
+    elif engine != "python":
+        raise ValueError(f"Unsupported alignment engine: {engine}")
+
     n = len(preferred_mm)
     m = len(other_mm)
     match_score = 1
     mismatch_score = -1
     gap_penalty = -1
-    continue_gap_penalty = -1  # TODO: needleman_wunsch to prioritise continuing gaps over new gaps
+    continue_gap_penalty = -1  # NB: gaps are linear here. The "affine" engine prioritises continuing gaps.
 
     preferred_comparer = []
     other_comparer = []
@@ -442,10 +786,17 @@ def write_diagnosis(
         file.write("Changes to be made to secondary measure map:\n")
         joins = [x[1] for x in diagnosis if x[0] == "Join"]
         for change in diagnosis:
-            if change[0] == :
+            if change[0] == "Join":
                 file.write(f" - Join measures {change[1]} and {change[1] + 1}.\n")
             elif change[0] == "Split":
                 file.write(f" - Split measure {change[1]} at offset {change[2]}.\n")
+            elif change[0] == "Repeat_Structure":
+                for key in ("loops", "branches"):
+                    if key in change[1]:
+                        for start, end in change[1][key]["missing"]:
+                            file.write(f" - Add the {key[:-1]} from {start} to {end} (in quarter notes).\n")
+                        for start, end in change[1][key]["extra"]:
+                            file.write(f" - Remove the {key[:-1]} from {start} to {end} (in quarter notes).\n")
             elif change[0] == "Expand_Repeats":
                 file.write(" - Expand the repeats.\n")
             elif change[0] == "Renumber":
@@ -456,6 +807,12 @@ def write_diagnosis(
                 file.write(f" - Change measure {change[1]} actual length to {change[2]}.\n")
             elif change[0] == "Time_Signature":
                 file.write(f" - Change measure {change[1]} time signature to {change[2]}.\n")
+            elif change[0] == "Needleman-Wunsch":
+                for kind, count, length in alignment.gap_runs(change[1], change[2]):
+                    if kind == "Missing":
+                        file.write(f" - Add {length} measure(s) from preferred measure {count}.\n")
+                    else:
+                        file.write(f" - Remove {length} measure(s) from measure {count}.\n")
 
 
 def one_comparison(
@@ -482,17 +839,40 @@ def one_comparison(
 def run_corpus(
         base_path: Path = REPO_FOLDER.parent / "Chorale-Corpus",  # "When-in-Rome" / "Corpus",
         preferred_name: str = "preferred_measure_map.json",
-        other_name: str = "other_measure_map.json"
-) -> None:
+        other_name: str = "other_measure_map.json",
+        processes: int = None,
+        manifest_name: str = "corpus_results.json",
+        shard: tuple[int, int] = None,
+        resume: bool = False,
+        timeout: float = None
+) -> dict:
     """
     Run comparisons on a corpus of pre-extracted measure maps.
     Set up with defaults for a local copy of `When in Rome` where the directory structure has
     pairs of corresponding `preferred` and `other`
     sources in the same folder.
+    See corpus.run_corpus for the other arguments (running in parallel, in shards, etc.).
     """
-    for pref_path in base_path.rglob(preferred_name):
-        other_path = pref_path.parent / other_name
-        one_comparison(pref_path, other_path)
+    return corpus.run_corpus(
+        one_comparison,
+        base_path,
+        preferred_name,
+        other_name,
+        processes=processes,
+        manifest_name=manifest_name,
+        shard=shard,
+        resume=resume,
+        timeout=timeout
+    )
+
+
+def merge_corpus(
+        base_path: Path = REPO_FOLDER.parent / "Chorale-Corpus",
+        manifest_name: str = "corpus_results.json",
+        count: int = None
+) -> dict:
+    """Merge the shard results files of a corpus run into one report: see corpus.merge_shards."""
+    return corpus.merge_shards(base_path, manifest_name, count)
 
 
 # ------------------------------------------------------------------------------
@@ -503,9 +883,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--run_corpus", action="store_true", )
+    corpus.add_corpus_arguments(parser)
 
     args = parser.parse_args()
     if args.run_corpus:
-        run_corpus()
+        run_corpus(**corpus.corpus_run_options(args))
+    elif args.merge is not None:
+        merge_corpus(count=args.merge or None)
     else:
         parser.print_help()
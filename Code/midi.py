@@ -0,0 +1,215 @@
+"""
+
+NAME:
+===============================
+MIDI (midi.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Extraction of measure maps from Standard MIDI Files (.mid, .midi) by their meta events alone:
+no import of the notes, and no quantization.
+
+The tracks are scanned event by event (channel events and system exclusives are skipped over unread)
+for three meta events:
+- time signatures, which set the bar length in ticks from there on;
+- the end of each track, the latest of which ends the last bar;
+- markers, of which any that gives a measure number (`12`, `m12`, `Bar 12`) at the start of a bar numbers it
+(and, counting on, those that follow).
+
+Bars run from tick 0 for the length of the current time signature (4/4 by default, as in MIDI),
+and a time signature change within a bar ends it early.
+Bar boundaries in ticks are converted to quarter-note qstamps by the file's ticks per quarter note.
+
+A MIDI file records a performance order, so the map has no repeats, and each measure's `next` is simply the following one:
+it is for comparison with the unfolded (repeats expanded) map of a score.
+
+"""
+
+# ------------------------------------------------------------------------------
+
+import re
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterator
+
+from . import measuring_bars
+from .utils import to_quarter_length
+
+
+# ------------------------------------------------------------------------------
+
+TIME_SIGNATURE = 0x58
+END_OF_TRACK = 0x2F
+MARKER = 0x06
+
+MARKER_NUMBER = re.compile(r"(?:m|bar|measure)?\s*\.?\s*([0-9]+)", re.IGNORECASE)
+
+
+def read_variable_length(data: bytes, position: int) -> tuple[int, int]:
+    """
+    Read a variable-length quantity from `position`: return its value, and the position after it.
+    Raises ValueError if the data ends first.
+    """
+    value = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("Truncated MIDI data: it ends within a variable-length quantity.")
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, position
+
+
+def iter_chunks(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+    """Generate the (type, content) of each chunk of a Standard MIDI File."""
+    position = 0
+    while position + 8 <= len(data):
+        chunk_type = data[position:position + 4]
+        length = int.from_bytes(data[position + 4:position + 8], "big")
+        yield chunk_type, data[position + 8:position + 8 + length]
+        position += 8 + length
+
+
+def iter_meta_events(track: bytes) -> Iterator[tuple[int, int, bytes]]:
+    """
+    Generate the (tick, type, data) of each meta event in a track chunk, skipping over all other events.
+    Stops at the end of track event (which is included) or the end of the chunk.
+    Raises ValueError for a track that ends within an event.
+    """
+
+    tick = 0
+    position = 0
+    running_status = None  # The last channel event's status
+    while position < len(track):
+        delta, position = read_variable_length(track, position)
+        tick += delta
+        if position >= len(track):
+            raise ValueError("Truncated MIDI track: it ends after a delta time.")
+        if track[position] >= 0x80:
+            status = track[position]
+            position += 1
+            if status < 0xF0:
+                running_status = status
+        elif running_status is None:
+            raise ValueError("MIDI data byte with no running status.")
+        else:
+            status = running_status  # Kept across meta and system exclusive events, as by music21 (and most readers)
+
+        if status == 0xFF:  # Meta event
+            if position >= len(track):
+                raise ValueError("Truncated MIDI track: it ends within a meta event.")
+            meta_type = track[position]
+            length, position = read_variable_length(track, position + 1)
+            if position + length > len(track):
+                raise ValueError("Truncated MIDI track: it ends within a meta event.")
+            yield tick, meta_type, track[position:position + length]
+            if meta_type == END_OF_TRACK:
+                return
+            position += length
+        elif status in (0xF0, 0xF7):  # System exclusive
+            length, position = read_variable_length(track, position)
+            position += length
+        elif status & 0xF0 in (0xC0, 0xD0):  # Program change and channel pressure: one data byte
+            position += 1
+        else:  # Other channel events: two data bytes
+            position += 2
+    if position > len(track):
+        raise ValueError("Truncated MIDI track: it ends within an event.")
+
+
+def parse_time_signature(data: bytes, division: int) -> tuple[int, int]:
+    """
+    The (numerator, denominator) of a time signature meta event.
+    Raises ValueError for a zero numerator, or a denominator so large (a power of two, in MIDI) that
+    a bar would be shorter than a tick, at `division` ticks per quarter note: bars of (next to) no length.
+    """
+    numerator, denominator = data[0], 2 ** data[1]
+    if numerator == 0 or numerator * 4 * division < denominator:
+        raise ValueError(f"Invalid MIDI time signature: {numerator}/{denominator}.")
+    return numerator, denominator
+
+
+def marker_number(data: bytes) -> int | None:
+    """The measure number given by a marker's text, if any."""
+    match = MARKER_NUMBER.fullmatch(data.decode("latin-1").strip())
+    return int(match.group(1)) if match else None
+
+
+# ------------------------------------------------------------------------------
+
+def iter_midi_bars(path: Path) -> Iterator[dict]:
+    """
+    Generate the bar attributes of each bar of a Standard MIDI File, in order,
+    in the form used by measuring_bars.iter_measure_map.
+    """
+
+    data = Path(path).read_bytes()
+    chunks = iter_chunks(data)
+    header_type, header = next(chunks, (None, b""))
+    if header_type != b"MThd" or len(header) < 6:
+        raise ValueError(f"Not a Standard MIDI File: {path}")
+    division = int.from_bytes(header[4:6], "big")
+    if division & 0x8000:
+        raise ValueError(f"Only metrical (ticks per quarter note) MIDI timing is supported: {path}")
+    if division == 0:
+        raise ValueError(f"Invalid MIDI timing: 0 ticks per quarter note: {path}")
+
+    time_signatures = {}  # Tick to (numerator, denominator); at the same tick, the last read wins
+    numbers = {}  # Tick to measure number, from markers
+    end = 0
+    for chunk_type, track in chunks:
+        if chunk_type != b"MTrk":
+            continue
+        for tick, meta_type, meta_data in iter_meta_events(track):
+            if meta_type == TIME_SIGNATURE and len(meta_data) >= 2:
+                time_signatures[tick] = parse_time_signature(meta_data, division)
+            elif meta_type == MARKER:
+                number = marker_number(meta_data)
+                if number is not None:
+                    numbers[tick] = number
+            elif meta_type == END_OF_TRACK:
+                end = max(end, tick)
+
+    changes = sorted(time_signatures.items())
+    next_change = 0  # Index of the next time signature change
+    numerator, denominator = 4, 4
+    number = 0
+    tick = 0
+    while tick < end:
+        while next_change < len(changes) and changes[next_change][0] <= tick:
+            numerator, denominator = changes[next_change][1]
+            next_change += 1
+        bar_ticks = Fraction(numerator * 4 * division, denominator)
+        bar_end = min(tick + bar_ticks, end)
+        if next_change < len(changes) and changes[next_change][0] < bar_end:  # A change within the bar ends it
+            bar_end = changes[next_change][0]
+        number = numbers.get(tick, number + 1)
+
+        yield {
+            "qstamp": to_quarter_length(Fraction(tick, division)),
+            "number": number,
+            "nominal_length": to_quarter_length(bar_ticks / division),
+            "actual_length": to_quarter_length(Fraction(bar_end - tick, division)),
+            "time_signature": f"{numerator}/{denominator}",
+            "start_repeat": False,
+            "end_repeat": False,
+            "left_barline": None
+        }
+        tick = bar_end
+
+
+def midi_to_measure_map(path: Path) -> list:
+    """
+    Extract the measure map of a Standard MIDI File from its meta events,
+    in the layout of `music21_application.part_to_measure_map` (see notes there):
+    without repeats, and with each measure followed by the next.
+    """
+    return list(measuring_bars.iter_measure_map(iter_midi_bars(path)))
@@ -0,0 +1,187 @@
+"""
+
+NAME:
+===============================
+Memory-mappable Measure Maps (mmb.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+A fixed-layout binary container for measure maps (.mmb),
+designed to be opened with `mmap` so that many processes can share one page-cached copy.
+
+Layout (little-endian throughout):
+- header: magic, version, number of entries, number of blocks;
+- block directory: one record per block with its name, NumPy dtype, byte offset and item count;
+- blocks, each aligned to 64 bytes: the columns of a `base.ColumnarMeasureMap`,
+the CSR offsets and targets for `next`, the masks of missing values,
+and a string table (offsets and UTF-8 data) for IDs, names and time signatures.
+
+Opening a file reads the header and directory only, and
+the columns are NumPy views onto the mapped file: no copies, whatever the size of the map.
+
+"""
+
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from .base import ColumnarMeasureMap, MEASURE_FIELDS
+
+
+# ------------------------------------------------------------------------------
+
+MAGIC = b"MMB\x00"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQ")  # magic, version, number of entries, number of blocks
+DIRECTORY_RECORD = struct.Struct("<24s8sQQ")  # name, dtype, offset, count
+ALIGNMENT = 64
+
+COLUMN_BLOCKS = {
+    "ID": "<i4",
+    "count": "<i4",
+    "qstamp": "<f8",
+    "number": "<i4",
+    "name": "<i4",
+    "time_signature": "<i4",
+    "nominal_length": "<f8",
+    "actual_length": "<f8",
+    "start_repeat": "|b1",
+    "end_repeat": "|b1",
+    "next_offsets": "<i8",
+    "next_targets": "<i4",
+}
+
+
+class StringTable(Sequence):
+    """
+    Read-only, lazily decoded view of the string table in an .mmb file,
+    so that opening a map does not decode every name.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("String table index out of range.")
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+
+# ------------------------------------------------------------------------------
+
+def write_mmb(
+        measure_map,
+        outpath: Path
+) -> None:
+    """
+    Write a measure map to an .mmb file.
+    Accepts a `base.ColumnarMeasureMap` or a list of dicts (as written by `write_measure_map`).
+    """
+
+    if not isinstance(measure_map, ColumnarMeasureMap):
+        measure_map = ColumnarMeasureMap.from_dicts(measure_map)
+    if measure_map.next_targets.dtype == object:
+        raise TypeError("The .mmb format only supports 'next' fields containing counts (integers).")
+
+    encoded = [string.encode("utf-8") for string in measure_map.strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(x) for x in encoded], out=string_offsets[1:])
+
+    blocks = {name: np.ascontiguousarray(getattr(measure_map, name), dtype=dtype)
+              for name, dtype in COLUMN_BLOCKS.items()}
+    for name, mask in measure_map.missing.items():
+        blocks["missing:" + name] = np.ascontiguousarray(mask, dtype="|b1")
+    blocks["field_order"] = np.array([MEASURE_FIELDS.index(name) for name in measure_map.fields], dtype="|u1")
+    blocks["string_offsets"] = string_offsets
+    blocks["string_data"] = np.frombuffer(b"".join(encoded), dtype="|u1")
+
+    position = HEADER.size + DIRECTORY_RECORD.size * len(blocks)
+    directory = []
+    for name, array in blocks.items():
+        position += -position % ALIGNMENT
+        directory.append((name, array, position))
+        position += array.nbytes
+
+    with open(outpath, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(measure_map), len(blocks)))
+        for name, array, offset in directory:
+            file.write(DIRECTORY_RECORD.pack(name.encode("ascii"), array.dtype.str.encode("ascii"), offset, len(array)))
+        for name, array, offset in directory:
+            file.write(b"\x00" * (offset - file.tell()))
+            file.write(array.tobytes())
+
+
+def open_mmb(path: Path) -> ColumnarMeasureMap:
+    """
+    Open an .mmb file as a `base.ColumnarMeasureMap` whose arrays are read-only views onto the memory-mapped file.
+    Only the header and block directory are read, so this takes constant time whatever the size of the map.
+    """
+
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, length, number_of_blocks = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Not an .mmb file: {path}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported .mmb version {version} in {path}")
+
+    blocks = {}
+    for index in range(number_of_blocks):
+        name, dtype, offset, count = DIRECTORY_RECORD.unpack_from(buffer, HEADER.size + index * DIRECTORY_RECORD.size)
+        name = name.rstrip(b"\x00").decode("ascii")
+        dtype = np.dtype(dtype.rstrip(b"\x00").decode("ascii"))
+        if count:
+            blocks[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        else:
+            blocks[name] = np.empty(0, dtype=dtype)
+
+    if len(blocks["count"]) != length:
+        raise ValueError(f"Corrupt .mmb file: header says {length} entries, count column has {len(blocks['count'])}")
+
+    return ColumnarMeasureMap(
+        **{name: blocks[name] for name in COLUMN_BLOCKS},
+        strings=StringTable(blocks["string_offsets"], blocks["string_data"]),
+        missing={name[len("missing:"):]: array for name, array in blocks.items() if name.startswith("missing:")},
+        fields=[MEASURE_FIELDS[index] for index in blocks["field_order"]]
+    )
+
+
+# ------------------------------------------------------------------------------
+
+def json_to_mmb(
+        json_path: Path,
+        mmb_path: Path
+) -> None:
+    """Convert a measure map JSON file (as written by `write_measure_map`) to .mmb."""
+    with open(json_path, "r") as file:
+        measure_map = json.load(file)
+    write_mmb(measure_map, mmb_path)
+
+
+def mmb_to_json(
+        mmb_path: Path,
+        json_path: Path
+) -> None:
+    """Convert an .mmb file back to measure map JSON in the layout of `write_measure_map`."""
+    with open(json_path, "w") as file:
+        json.dump(open_mmb(mmb_path).to_dicts(), file, indent=4)
@@ -0,0 +1,142 @@
+"""
+
+NAME:
+===============================
+MuseScore (musescore.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Streaming extraction of measure maps from MuseScore files (.mscx, and compressed .mscz),
+directly from MuseScore's own XML: no export to MusicXML, and no music21.
+
+The `.mscx` member of a `.mscz` zip is read in place (not extracted to disk) and
+the `<Measure>` elements of the first staff are parsed incrementally, one at a time, and discarded.
+Only the bar attributes are read:
+- the actual length of irregular measures (the `len` attribute), or else that of the time signature (`<TimeSig>`);
+- repeat barlines (`<startRepeat>`, `<endRepeat>`) and the starts of voltas (second-time bars, etc.);
+- measure numbers, as MuseScore displays them: counting the measures not excluded from the count (`<irregular>`),
+plus any number offsets (`<noOffset>`), and from one again after a section break (unless set otherwise).
+
+The map has the same structure as those of `music21_application` and `musicxml`,
+and the same content as theirs for a MusicXML export of the same score.
+
+"""
+
+# ------------------------------------------------------------------------------
+
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterator
+from xml.etree.ElementTree import iterparse
+
+from . import measuring_bars
+from .musicxml import open_score
+from .utils import to_quarter_length
+
+
+# ------------------------------------------------------------------------------
+
+class StaffReader:
+    """
+    Running state through the measures of one staff: time signature, numbering and offset.
+    """
+
+    def __init__(self):
+        self.time_signature = None
+        self.bar_duration = Fraction(4)  # 4/4 in the absence of a time signature
+        self.measure_number = 0  # As MuseScore's `no()`, which displays as one more
+        self.last_number = 0
+        self.offset = Fraction(0)
+
+    def read_measure(self, measure) -> dict:
+        """Read the bar attributes of a `<Measure>` element, in the form used by measuring_bars.iter_measure_map."""
+
+        for time_signature in measure.iter("TimeSig"):
+            numerator, denominator = time_signature.findtext("sigN"), time_signature.findtext("sigD")
+            if numerator and denominator:
+                self.time_signature = f"{numerator.strip()}/{denominator.strip()}"
+                self.bar_duration = Fraction(int(numerator) * 4, int(denominator))
+            break
+
+        length = measure.get("len")
+        actual_length = Fraction(length) * 4 if length else self.bar_duration
+
+        self.measure_number += int(measure.findtext("noOffset") or 0)
+        if measure.findtext("irregular", "0").strip() not in ("", "0"):
+            number = self.last_number  # Excluded from the count: as the previous measure (0 for a pickup)
+        else:
+            self.measure_number += 1
+            number = self.measure_number
+        self.last_number = number
+        if is_section_break(measure):
+            self.measure_number = 0
+
+        end_repeat = measure.find("endRepeat")
+        bar = {
+            "qstamp": to_quarter_length(self.offset),
+            "number": number,
+            "nominal_length": to_quarter_length(self.bar_duration),
+            "actual_length": to_quarter_length(actual_length),
+            "time_signature": self.time_signature,
+            "start_repeat": measure.find("startRepeat") is not None,
+            # As in music21_application, only plain repeats (played twice) count
+            "end_repeat": end_repeat is not None and (end_repeat.text or "2").strip() == "2",
+            # A volta starts on a left barline in MusicXML
+            "left_barline": "regular" if next(measure.iter("Volta"), None) is not None else None
+        }
+        self.offset += actual_length
+        return bar
+
+
+def is_section_break(measure) -> bool:
+    """True for a measure ending with a section break that starts the numbering from one again (as by default)."""
+    for layout_break in measure.iter("LayoutBreak"):
+        if (layout_break.findtext("subtype") or "").strip() == "section":
+            return (layout_break.findtext("startWithMeasureOne") or "1").strip() != "0"
+    return False
+
+
+# ------------------------------------------------------------------------------
+
+def iter_musescore_bars(path: Path) -> Iterator[dict]:
+    """
+    Generate the bar attributes of each measure of the first staff in a MuseScore file, in order,
+    holding no more than one measure in memory.
+    Parsing stops at the end of the first staff.
+    """
+
+    with open_score(path, (".mscx",)) as file:
+        reader = StaffReader()
+        path_tags = []  # Tags of the open elements
+        staff = None
+        for event, element in iterparse(file, events=("start", "end")):
+            if event == "start":
+                path_tags.append(element.tag)
+                # The music itself, not the staff definitions in <Part>, nor the <Score>s of excerpts
+                if path_tags[-3:] == ["museScore", "Score", "Staff"] and staff is None:
+                    staff = element
+                continue
+
+            path_tags.pop()
+            if staff is None:
+                continue
+            if element.tag == "Measure" and path_tags[-1] == "Staff":
+                yield reader.read_measure(element)
+                staff.clear()
+            elif element is staff:
+                return
+
+
+def musescore_to_measure_map(path: Path) -> list:
+    """
+    Extract the measure map of a MuseScore file (.mscx or .mscz) from its first staff,
+    in the layout of `music21_application.part_to_measure_map` (see notes there).
+    """
+    return list(measuring_bars.iter_measure_map(iter_musescore_bars(path)))
@@ -27,14 +27,21 @@ import json
 from pathlib import Path
 
 from music21 import bar, clef, converter, key, meter, stream
-from typing import Dict
+from typing import Dict, Iterator
 
+from . import corpus
 from . import measuring_bars
+from . import musicxml
+from . import romantext
 from . import REPO_FOLDER
 
 
 # ------------------------------------------------------------------------------
 
+MUSICXML_SUFFIXES = [".mxl", ".musicxml", ".xml"]
+ROMANTEXT_SUFFIXES = [".txt", ".rntxt"]
+
+
 class Aligner:
     def __init__(
         self,
@@ -44,34 +51,34 @@ class Aligner:
         write_maps: bool = True,
         write_diagnosis: bool = True,
         attempt_fix: bool = False,
-        check_parts_match: bool = True
+        check_parts_match: bool = True,
+        direct_extraction: bool = True
     ):
+        """
+        With direct_extraction=True, the measure maps of sources in a format with an extractor of its own
+        (see source_to_measure_map) are read straight from the files,
+        and the sources are only parsed with music21 if needed (to attempt the fixes or write the modified scores).
+        """
 
         # Paths
         self.path_to_preferred = path_to_preferred
         self.path_to_other = path_to_other
-
-        # Parse preferred
-        if self.path_to_preferred.suffix in [".txt", ".rntxt"]:
-            self.preferred = converter.parse(self.path_to_preferred, format="Romantext")
-        else:
-            self.preferred = converter.parse(self.path_to_preferred)
-
-        # Parse other
-        if self.path_to_other.suffix in [".txt", ".rntxt"]:
-            self.other = converter.parse(self.path_to_other, format="Romantext")
-        else:
-            self.other = converter.parse(self.path_to_other)
-
-        if impose_numbering_first:
-            for part in self.preferred.getElementsByClass(stream.Part):
-                impose_numbering_standard(part, "Full Measure")
-            for part in self.other.getElementsByClass(stream.Part):
-                impose_numbering_standard(part, "Full Measure")  # TODO: Have at start?
+        self.impose_numbering_first = impose_numbering_first
 
         # Prepare MMs
-        self.preferred_measure_map = stream_to_measure_map(self.preferred, check_parts_match)
-        self.other_measure_map = stream_to_measure_map(self.other, check_parts_match)
+        self.preferred = None
+        self.other = None
+        self.preferred_measure_map = None
+        self.other_measure_map = None
+        if direct_extraction:
+            self.preferred_measure_map = source_to_measure_map(
+                path_to_preferred, check_parts_match, impose_numbering_first
+            )
+            self.other_measure_map = source_to_measure_map(path_to_other, check_parts_match, impose_numbering_first)
+        if self.preferred_measure_map is None:
+            self.preferred_measure_map = stream_to_measure_map(self.parse("preferred"), check_parts_match)
+        if self.other_measure_map is None:
+            self.other_measure_map = stream_to_measure_map(self.parse("other"), check_parts_match)
 
         if write_maps:
             self.write_mm()  # before changes in place
@@ -85,15 +92,32 @@ class Aligner:
         )
         self.error = [x for x in self.comparison.diagnosis if x[0] == "Needleman-Wunsch"]
 
-        if self.attempt_fix and not self.error:
+        if attempt_fix and not self.error:
             self.attempt_fix()
 
         if write_diagnosis:
             measuring_bars.write_diagnosis(
                 self.comparison.diagnosis,
-                outpath=self.path_to_preferred.parent
+                out_path=self.path_to_preferred.parent
             )
 
+    def parse(self, source: str) -> stream.Score:
+        """
+        Parse the "preferred" or "other" source with music21 (once), imposing the numbering standard if required,
+        and return the score.
+        """
+        if getattr(self, source) is None:
+            path = getattr(self, "path_to_" + source)
+            if path.suffix in ROMANTEXT_SUFFIXES:
+                score = converter.parse(path, format="Romantext")
+            else:
+                score = converter.parse(path)
+            if self.impose_numbering_first:
+                for part in score.getElementsByClass(stream.Part):
+                    impose_numbering_standard(part, "Full Measure")  # TODO: Have at start?
+            setattr(self, source, score)
+        return getattr(self, source)
+
     def write_mm(self, outpath: Path = None):
         """Write the measure maps"""
         if outpath is not None:
@@ -107,6 +131,7 @@ class Aligner:
         write_measure_map(self.other_measure_map, outpath=other_outpath)
 
     def attempt_fix(self):
+        self.parse("other")
         for change in self.comparison.diagnosis:  # TODO: multiple parts?
             for part in self.other.getElementsByClass(stream.Part):
                 if change[0] == "Join":
@@ -126,10 +151,44 @@ class Aligner:
                     removeDuplicates(part)
 
     def write_modified(self):
+        self.parse("preferred")
+        self.parse("other")
         self.other.write("mxl", self.path_to_other.parent / "modified_other.mxl")
         self.preferred.write("mxl", self.path_to_preferred.parent / "modified_preferred.mxl")
 
 
+def source_to_measure_map(
+        path: Path,
+        check_parts_match: bool = True,
+        impose_numbering_first: bool = True,
+        processes: int = 1
+) -> list | None:
+    """
+    Extract the measure map of a source straight from the file, without parsing it with music21,
+    for the formats with an extractor of their own:
+    MusicXML (see musicxml.musicxml_to_measure_map) and RomanText (see romantext.romantext_to_measure_map).
+    The result is the same as that of stream_to_measure_map on the score parsed by music21,
+    with the "Full Measure" numbering standard imposed first if `impose_numbering_first`
+    (see measuring_bars.perform_full_measure_numbering).
+    Returns None for other formats, and for a file that the extractor cannot read, to leave it to music21.
+    With processes other than 1, the parts of a MusicXML file are read in parallel (see musicxml_to_measure_map).
+    """
+
+    try:
+        if path.suffix in MUSICXML_SUFFIXES:
+            measure_map = musicxml.musicxml_to_measure_map(path, check_parts_match, processes)
+        elif path.suffix in ROMANTEXT_SUFFIXES:
+            measure_map = romantext.romantext_to_measure_map(path)
+        else:
+            return None
+    except ValueError:  # E.g., parts that differ only in the numbering to be imposed
+        return None
+
+    if impose_numbering_first:
+        measuring_bars.perform_full_measure_numbering(measure_map)
+    return measure_map
+
+
 def generate_examples(
         path_to_examples: Path = REPO_FOLDER / "Examples"):
     """
@@ -145,7 +204,10 @@ def generate_examples(
         )
 
 
-def stream_to_measure_map(this_stream: stream.Stream, check_parts_match: bool = True) -> list:
+def stream_to_measure_map(
+        this_stream: stream.Stream,
+        check_parts_match: bool = True
+) -> list:
     """
     Maps from a music21 stream
     to a possible version of the "measure map".
@@ -154,6 +216,12 @@ def stream_to_measure_map(this_stream: stream.Stream, check_parts_match: bool =
     The additional check_parts_match argument defaults to False but
     if True and the score has multiple parts, it will
     check that those parts return the same measurement information.
+
+    The other parts are checked in turn, each against part 0 as it is extracted,
+    stopping at the first measure that differs.
+    The error reports the first part that differs, and from which measure (by count).
+    The parts of one music21 score cannot be shared between threads or processes:
+    for the parts of a MusicXML file read in parallel, see source_to_measure_map.
     """
 
     if isinstance(this_stream, stream.Part):
@@ -173,13 +241,26 @@ def stream_to_measure_map(this_stream: stream.Stream, check_parts_match: bool =
         return measure_map
 
     for part in range(1, num_parts):
-        part_measure_map = part_to_measure_map(this_stream.parts[part])
-        if part_measure_map != measure_map:
-            raise ValueError(f"Parts 0 and {part} do not match.")
+        count = first_difference(measure_map, this_stream.parts[part])
+        if count is not None:
+            raise ValueError(f"Parts 0 and {part} do not match (from measure count {count}).")
 
     return measure_map
 
 
+def first_difference(
+        measure_map: list,
+        this_part: stream.Part
+) -> int | None:
+    """
+    Compare a part with a measure map as the part's own measure map is extracted,
+    returning the count of the first measure that differs (or None if they match).
+    See measuring_bars.first_difference.
+    """
+
+    return measuring_bars.first_difference(measure_map, iter_part_measure_map(this_part, settled=False))
+
+
 def part_to_measure_map(this_part: stream.Part) -> list:
     """
     Mapping from a music21.stream.part
@@ -193,60 +274,58 @@ def part_to_measure_map(this_part: stream.Part) -> list:
         "start_repeat": bool,
         "end_repeat": bool
         "next": lst of str
+    See iter_part_measure_map for the same, one measure at a time.
+    """
+
+    return list(iter_part_measure_map(this_part))
+
+
+def is_repeat_barline(barline: bar.Barline, direction: str) -> bool:
+    """
+    True for a plain repeat barline (no `times`) in the given direction, e.g.,
+    for `bar.Repeat(direction="start")`.
+    """
+    return type(barline) is bar.Repeat and barline.direction == direction and barline.times is None
+
+
+def iter_part_measure_map(
+        this_part: stream.Part,
+        settled: bool = True
+) -> Iterator[dict]:
+    """
+    Generate the measure map of a music21.stream.part (as in part_to_measure_map) one measure at a time,
+    in a single pass over the measures.
+    See measuring_bars.iter_measure_map for when the entries are settled,
+    and the meaning of settled=False.
+    """
+
+    return measuring_bars.iter_measure_map(iter_part_bars(this_part), settled=settled)
+
+
+def iter_part_bars(this_part: stream.Part) -> Iterator[dict]:
+    """
+    Generate the bar attributes of each measure in a music21.stream.part,
+    in the form used by measuring_bars.iter_measure_map.
     """
 
-    sheet_measure_map = []
-    go_back_to = 1
-    go_forward_from = 1
     time_sig = this_part.getElementsByClass(stream.Measure)[0].timeSignature.ratioString
-    count = 1
 
     for measure in this_part.recurse().getElementsByClass(stream.Measure):
-        end_repeat = False
-        start_repeat = False
-        next = []
-
         if measure.timeSignature:
             time_sig = measure.timeSignature.ratioString
 
-        if measure.leftBarline:  # TODO: Replace with normal equality checks
-            if str(measure.leftBarline) == str(bar.Repeat(direction="start")):
-                start_repeat = True
-        if measure.rightBarline:
-            if str(measure.rightBarline) == str(bar.Repeat(direction="end")):
-                end_repeat = True
-
-        if start_repeat:  # Crude method to add next measure information including for multiple endings from repeats
-            go_back_to = count
-        elif measure.leftBarline:
-            if measure.leftBarline.type == "regular" and sheet_measure_map[count - 2]["end_repeat"]:
-                sheet_measure_map[go_forward_from - 1]["next"].append(count)
-            elif measure.leftBarline.type == "regular":
-                go_forward_from = count - 1
-        if end_repeat:
-            next.append(go_back_to)
-        if count + 1 <= len(this_part.recurse().getElementsByClass(stream.Measure)) and \
-                not (end_repeat and count > go_forward_from != 1):
-            next.append(count + 1)
-
-        measure_dict = {
-            "count": count,
-            "qstamp": measure.qstamp,
+        yield {
+            "qstamp": measure.offset,
             "number": measure.measureNumber,
             # "suffix": measure.suffix,
             "nominal_length": measure.barDuration.quarterLength,
             "actual_length": measure.duration.quarterLength,
             "time_signature": time_sig,
-            "start_repeat": start_repeat,
-            "end_repeat": end_repeat,
-            "next": next
+            "start_repeat": is_repeat_barline(measure.leftBarline, "start"),
+            "end_repeat": is_repeat_barline(measure.rightBarline, "end"),
+            "left_barline": measure.leftBarline.type if measure.leftBarline else None
         }
 
-        sheet_measure_map.append(measure_dict)
-        count += 1
-
-    return sheet_measure_map
-
 
 # ------------------------------------------------------------------------------
 
@@ -261,7 +340,7 @@ def split_measure(part_to_fix: stream.Part, diagnosis: tuple):
     assert isinstance(diagnosis[2], float)
 
     measure = part_to_fix.getElementsByClass(stream.Measure)[diagnosis[1] - 1]
-    qstamp = measure.qstamp
+    qstamp = measure.offset
     first_part, second_part = measure.splitAtQuarterLength(diagnosis[2])
     # second_part.removeClasses()  # TODO?
     second_part.number = first_part.measureNumber
@@ -294,7 +373,7 @@ def join_measures(part_to_fix: stream.Part, diagnosis: tuple) -> stream.Part:
     base_ql = target_measure.quarterLength
 
     for x in source_measure:
-        target_measure.insert(base_ql + x.qstamp, x)
+        target_measure.insert(base_ql + x.offset, x)
 
     part_to_fix.remove(source_measure)
 
@@ -541,17 +620,60 @@ def removeDuplicates(
 def run_corpus(
     base_path: Path = REPO_FOLDER.parent / "When-in-Rome" / "Corpus",
     preferred_name: str = "score.mxl",
-    other_name: str = "analysis.txt"
-) -> None:
+    other_name: str = "analysis.txt",
+    processes: int = None,
+    manifest_name: str = "corpus_results.json",
+    shard: tuple[int, int] = None,
+    resume: bool = False,
+    timeout: float = None
+) -> dict:
     """
     Run measure map comparisons on a corpus.
     Set up with defaults for a local copy of `When in Rome` where the directory structure has
     pairs of corresponding `preferred` and `other`
     sources in the same folder.
+    See corpus.run_corpus for the other arguments (running in parallel, in shards, etc.).
+    """
+    return corpus.run_corpus(
+        one_alignment,
+        base_path,
+        preferred_name,
+        other_name,
+        processes=processes,
+        manifest_name=manifest_name,
+        shard=shard,
+        resume=resume,
+        timeout=timeout
+    )
+
+
+def merge_corpus(
+    base_path: Path = REPO_FOLDER.parent / "When-in-Rome" / "Corpus",
+    manifest_name: str = "corpus_results.json",
+    count: int = None
+) -> dict:
+    """Merge the shard results files of a corpus run into one report: see corpus.merge_shards."""
+    return corpus.merge_shards(base_path, manifest_name, count)
+
+
+def one_alignment(
+    path_to_preferred: Path,
+    path_to_other: Path
+) -> list:
+    """
+    Align one pair of sources as in a corpus run, writing the maps and diagnosis, and return the diagnosis.
+    The fixed scores are not written, so the fixes are not attempted:
+    that leaves sources with an extractor of their own (see source_to_measure_map) unparsed by music21.
     """
-    for pref in base_path.rglob(preferred_name):
-        other = pref.parent / other_name
-        Aligner(pref, other, attempt_fix=True, write_maps=True, check_parts_match=False, write_diagnosis=True)
+    aligner = Aligner(
+        path_to_preferred,
+        path_to_other,
+        attempt_fix=False,
+        write_maps=True,
+        check_parts_match=False,
+        write_diagnosis=True
+    )
+    return aligner.comparison.diagnosis
 
 
 # ------------------------------------------------------------------------------
@@ -562,9 +684,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--run_corpus", action="store_true", )
+    corpus.add_corpus_arguments(parser)
 
     args = parser.parse_args()
     if args.run_corpus:
-        run_corpus()
+        run_corpus(**corpus.corpus_run_options(args))
+    elif args.merge is not None:
+        merge_corpus(count=args.merge or None)
     else:
         parser.print_help()
@@ -0,0 +1,544 @@
+"""
+
+NAME:
+===============================
+MusicXML (musicxml.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Streaming extraction of measure maps from MusicXML files (partwise .musicxml / .xml, and compressed .mxl),
+without building a score.
+
+The `.mxl` zip member is read in place (not extracted to disk) and
+the `<measure>` elements are parsed incrementally, one at a time, and discarded.
+Only the bar attributes are read: measure numbers, barlines, time signatures, and
+durations (from `<divisions>`, `<duration>`, `<backup>` and `<forward>`).
+
+The result is the same measure map as `music21_application.part_to_measure_map` for the same file,
+following music21's reading of the durations:
+a measure lasts until the end of its last note or other element placed in time
+(such as dynamics, text, tempo marks, chord symbols, clefs, keys and time signatures);
+an empty measure lasts a full bar of the current time signature;
+a measure overfull by a fraction of a beat that is not a plausible note value
+moves the following measures on by a full bar only;
+and for files from Finale, `<forward>` counts as a (hidden) rest, except at the very end of a single-voice part.
+
+"""
+
+# ------------------------------------------------------------------------------
+
+import io
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from fractions import Fraction
+from itertools import chain, groupby, tee
+from operator import itemgetter
+from pathlib import Path
+from typing import BinaryIO, ContextManager, Iterator
+from xml.etree.ElementTree import iterparse
+
+from . import measuring_bars
+from .utils import to_quarter_length
+
+
+# ------------------------------------------------------------------------------
+
+DIRECTION_TYPES = ("dynamics", "words", "metronome", "rehearsal", "segno", "coda")  # Those that music21 places
+TOLERANCE = 1e-6
+PART_TAGS = re.compile(rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<part(?=[\s/>])[^>]*>|</part\s*>", re.DOTALL)
+
+
+def open_musicxml(path: Path) -> ContextManager[BinaryIO]:
+    """
+    Open a MusicXML file for reading, as a binary file object.
+    For a compressed .mxl file, this is the score member of the zip archive, read without extracting it.
+    """
+    return open_score(path, (".xml", ".musicxml"))
+
+
+@contextmanager
+def open_score(
+        path: Path,
+        suffixes: tuple
+) -> Iterator[BinaryIO]:
+    """
+    Open a score file for reading, as a binary file object.
+    For a zip archive (.mxl, .mscz), this is the score member
+    (as named by `META-INF/container.xml`, or else the first file with one of the given suffixes),
+    read without extracting it.
+    """
+
+    if not zipfile.is_zipfile(path):
+        with open(path, "rb") as file:
+            yield file
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        member = None
+        if "META-INF/container.xml" in names:
+            with archive.open("META-INF/container.xml") as container:
+                for _, element in iterparse(container):
+                    if element.tag == "rootfile":
+                        member = element.get("full-path")
+                        break
+        if member is None:
+            member = next(
+                (name for name in names if not name.startswith("META-INF/") and name.endswith(suffixes)),
+                None
+            )
+        if member is None:
+            raise ValueError(f"No score found in {path}")
+        with archive.open(member) as file:
+            yield file
+
+
+def parse_time_signature(time) -> tuple[str, Fraction] | None:
+    """
+    The ratio string (as music21's `TimeSignature.ratioString`) and bar duration (in quarter notes)
+    of a `<time>` element, or None for senza misura.
+    """
+
+    if time.find("senza-misura") is not None:
+        return None
+    parts = []
+    for child in time:
+        name = child.tag
+        if name == "beats":
+            parts.append([child.text.strip(), None])
+        elif name == "beat-type" and parts:
+            parts[-1][1] = child.text.strip()
+        elif name == "interchangeable":
+            break
+
+    ratios = []
+    bar_duration = Fraction(0)
+    for beats, beat_type in parts:
+        for numerator in beats.split("+"):
+            ratios.append(f"{numerator}/{beat_type}")
+            bar_duration += Fraction(int(numerator) * 4, int(beat_type))
+    return "+".join(ratios), bar_duration
+
+
+def parse_number(raw: str | None) -> tuple[int, str]:
+    """Measure number and suffix from a `number` attribute, as music21's `common.getNumFromStr`."""
+    if raw is None:
+        return 0, ""
+    digits = "".join(x for x in raw if x.isdigit())
+    return (int(digits) if digits else 0), "".join(x for x in raw if not x.isdigit())
+
+
+# ------------------------------------------------------------------------------
+
+class PartReader:
+    """
+    Running state through the measures of one part: divisions, time signature, staves, numbering and offset.
+    With `finale=True`, `<forward>` elements count as rests (see music21's `applyFinaleWorkarounds`).
+    """
+
+    def __init__(self, finale: bool = False):
+        self.finale = finale
+        self.trimmed_lengths = None  # The last measure's lengths without an ending Finale forward rest, if any
+        self.divisions = 1
+        self.staves = 1
+        self.time_signature = None
+        self.bar_duration = Fraction(4)  # music21's default in the absence of a time signature
+        self.last_number = 0
+        self.offset = Fraction(0)
+
+    def read_measure(self, measure) -> list[dict]:
+        """
+        Read the bar attributes of a `<measure>` element, in the form used by measuring_bars.iter_measure_map.
+        As music21 makes a part of each staff, this returns one set of attributes per staff:
+        they differ only in the actual length, which runs to the end of the last note (etc.) on that staff.
+        """
+
+        number, suffix = parse_number(measure.get("number"))
+        if suffix == "X" and number != self.last_number + 1:  # Finale's unnumbered measures, as in music21
+            number = self.last_number
+        if number != self.last_number:
+            self.last_number = number
+
+        position = Fraction(0)
+        ends = {}  # Staff (None for all staves) to the end of the last timed element on it
+        forward_rests = []  # (staff, end) of each Finale forward rest
+        ending_forward = False  # The last note or rest is a Finale forward rest
+        has_notes = False
+        counts = {"note": 0, "rest": 0}  # Excluding the later notes of chords
+        first_rest = None  # (staff, start, duration, full measure) of the first rest
+        full_measure_rest = False
+        voices = set()
+        barlines = {}
+
+        for child in measure:
+            name = child.tag
+            staff = child.findtext("staff")
+            staff = int(staff) if staff and self.staves > 1 else None
+            if name in ("note", "forward") and child.findtext("voice"):
+                voices.add(child.findtext("voice").strip())
+
+            if name == "note":
+                has_notes = True
+                ending_forward = False
+                if child.find("chord") is not None:
+                    continue
+                rest = child.find("rest")
+                counts["note" if rest is None else "rest"] += 1
+                if child.find("grace") is not None:
+                    continue
+                duration = self.duration(child)
+                if rest is not None:
+                    full = rest.get("measure") == "yes" and child.findtext("type", "whole") in ("whole", "breve")
+                    full_measure_rest = full_measure_rest or full
+                    if first_rest is None:
+                        first_rest = (staff, position, duration, full or is_plain_whole(child, duration))
+                        position += duration
+                        continue  # Placed at the end, once its length is settled
+                position += duration
+                ends[staff] = max(ends.get(staff, 0), position)
+            elif name == "backup":
+                position = max(position - self.duration(child), Fraction(0))
+            elif name == "forward":
+                if self.finale and child.findtext("duration"):
+                    # As in music21, a zero duration gives the rest its default length, a quarter note.
+                    forward_rests.append((staff, position + (self.duration(child) or 1)))
+                    has_notes = ending_forward = True
+                position += self.duration(child)
+            elif name == "attributes":
+                if child.findtext("divisions"):
+                    self.divisions = Fraction(child.findtext("divisions").strip())
+                if child.findtext("staves"):
+                    self.staves = int(child.findtext("staves"))
+                time = child.find("time")
+                if time is not None:
+                    parsed = parse_time_signature(time)
+                    if parsed is not None:
+                        self.time_signature, self.bar_duration = parsed
+                for element in child:
+                    if element.tag in ("clef", "key", "time"):
+                        staff = int(element.get("number")) if element.get("number") and self.staves > 1 else None
+                        ends[staff] = max(ends.get(staff, 0), position)
+            elif name == "harmony" or is_placed_direction(child):
+                if name == "harmony":  # Not specific to a staff in music21
+                    staff = None
+                ends[staff] = max(ends.get(staff, 0), position + self.duration(child, "offset"))
+            elif name == "barline":
+                barlines[child.get("location", "right")] = child
+
+        if first_rest is not None:
+            staff, start, duration, full = first_rest
+            if (full_measure_rest or (counts["rest"] == 1 and counts["note"] == 0)) and full and len(voices) < 2:
+                duration = self.bar_duration  # As in music21, a full-measure rest fills the time signature
+            ends[staff] = max(ends.get(staff, 0), start + duration)
+
+        staves = range(1, self.staves + 1)
+        lengths = [self.staff_end(ends, forward_rests, staff) for staff in staves]
+        if forward_rests and ending_forward and len(voices) < 2:
+            self.trimmed_lengths = [to_quarter_length(self.staff_end(ends, forward_rests[:-1], staff))
+                                    for staff in staves]
+        else:
+            self.trimmed_lengths = None
+
+        highest = max(lengths)
+        bar_duration = self.bar_duration
+        if highest == bar_duration:
+            shift = highest
+        elif highest > bar_duration:
+            difference = highest - bar_duration
+            if difference > Fraction(1, 2) or any(
+                    abs(difference - round(difference / unit) * unit) < TOLERANCE
+                    for unit in (Fraction(1, 16), Fraction(1, 12))
+            ):
+                shift = highest
+            else:
+                shift = bar_duration
+        elif highest == 0 and not has_notes:  # music21 fills an empty measure with a full-bar rest
+            lengths = [bar_duration for _ in staves]
+            shift = bar_duration
+        else:
+            shift = highest
+
+        left = barlines.get("left")
+        right = barlines.get("right")
+        bar = {
+            "qstamp": to_quarter_length(self.offset),
+            "number": number,
+            "nominal_length": to_quarter_length(bar_duration),
+            "actual_length": None,
+            "time_signature": self.time_signature,
+            "start_repeat": is_repeat_barline(left, "left"),
+            "end_repeat": is_repeat_barline(right, "right"),
+            "left_barline": barline_type(left)
+        }
+        self.offset += shift
+        return [dict(bar, actual_length=to_quarter_length(length)) for length in lengths]
+
+    @staticmethod
+    def staff_end(
+            ends: dict,
+            forward_rests: list,
+            staff: int
+    ) -> Fraction:
+        """The end of the last timed element on a staff, including those common to all staves."""
+        return max([ends.get(None, Fraction(0)), ends.get(staff, Fraction(0))] +
+                   [end for key, end in forward_rests if key in (None, staff)])
+
+    def duration(
+            self,
+            element,
+            tag: str = "duration"
+    ) -> Fraction:
+        """The duration (or other value in divisions) given by a child element, in quarter notes."""
+        value = element.find(tag)
+        if value is None or not value.text:
+            return Fraction(0)
+        return Fraction(value.text.strip()) / self.divisions
+
+
+def is_repeat_barline(barline, location: str) -> bool:
+    """
+    True for a `<barline>` with a plain repeat (as music21 reads it) at the given location ("left" or "right").
+    As in music21, a left barline must repeat forward,
+    while any repeat on the right is taken as a backward repeat,
+    and `times` only counts when it is given for a backward repeat.
+    """
+    if barline is None:
+        return False
+    repeat = barline.find("repeat")
+    if repeat is None:
+        return False
+    if location == "left":
+        return repeat.get("direction") == "forward"
+    return repeat.get("direction") == "forward" or repeat.get("times") is None
+
+
+def is_plain_whole(
+        note,
+        duration: Fraction
+) -> bool:
+    """True for a note (or rest) written as a whole or breve, with no dots or tuplet."""
+    written = note.findtext("type") or {Fraction(4): "whole", Fraction(8): "breve"}.get(duration)
+    return written in ("whole", "breve") and note.find("dot") is None and note.find("time-modification") is None
+
+
+def is_placed_direction(element) -> bool:
+    """
+    True for a `<direction>` or `<sound>` element that music21 places in the measure,
+    rather than only reading it as the start or end of a spanner (such as a hairpin), or not at all.
+    """
+    name = element.tag
+    if name == "sound":
+        return "tempo" in element.attrib
+    if name != "direction":
+        return False
+    for direction_type in element.iter("direction-type"):
+        for child in direction_type:
+            tag = child.tag
+            if tag in DIRECTION_TYPES and (tag != "dynamics" or len(child)):
+                return True
+    return any("tempo" in sound.attrib for sound in element.iter("sound"))
+
+
+def barline_type(barline) -> str | None:
+    """The music21 type of a `<barline>` ("regular" by default), or None if there is none."""
+    if barline is None:
+        return None
+    if barline.find("repeat") is not None:
+        return "repeat"
+    style = barline.find("bar-style")
+    if style is None or not style.text or style.text.strip() == "regular":
+        return "regular"
+    return style.text.strip()
+
+
+# ------------------------------------------------------------------------------
+
+def iter_musicxml_bars(
+        path: Path,
+        number_of_parts: int = None
+) -> Iterator[tuple[int, list[dict]]]:
+    """
+    Generate (part index, bar attributes per staff) for each measure of each part of a partwise MusicXML file,
+    in order, holding no more than a couple of measures in memory.
+    Parsing stops after the first `number_of_parts` parts (if given), or when the generator is closed.
+    """
+
+    with open_musicxml(path) as file:
+        yield from read_musicxml_bars(file, number_of_parts, path)
+
+
+def read_musicxml_bars(
+        file: BinaryIO,
+        number_of_parts: int = None,
+        path: Path = None
+) -> Iterator[tuple[int, list[dict]]]:
+    """
+    Generate (part index, bar attributes per staff) for each measure of each part of an open MusicXML file:
+    see `iter_musicxml_bars`, for the file at `path`.
+    """
+
+    part_index = -1
+    finale = None  # Whether the first <software> named in the <encoding> is Finale
+    reader = None
+    part = None
+    last = None  # Each part's last measure waits for the end of the part
+    for event, element in iterparse(file, events=("start", "end")):
+        name = element.tag
+        if event == "start":
+            if name == "score-timewise":
+                raise ValueError(f"Only partwise MusicXML is supported: {path}")
+            if name == "part" and part is None:
+                part_index += 1
+                reader = PartReader(finale=bool(finale))
+                part = element
+            continue
+
+        if part is None:
+            if name == "software" and finale is None and element.text and element.text.strip():
+                finale = "Finale" in element.text
+            continue
+        if name == "measure":
+            if last is not None:
+                yield part_index, last
+            last = reader.read_measure(element)
+            part.clear()
+        elif element is part:
+            if last is not None:
+                if reader.trimmed_lengths is not None:
+                    for bar, length in zip(last, reader.trimmed_lengths):
+                        bar["actual_length"] = length
+                yield part_index, last
+            last = None
+            part = None
+            element.clear()
+            if number_of_parts is not None and part_index + 1 >= number_of_parts:
+                return
+
+
+def split_parts(data: bytes) -> list[bytes]:
+    """
+    Split the (UTF-8 or other ASCII-compatible) bytes of a partwise MusicXML file
+    into one document per `<part>`, each with the rest of the score around it (the header and the end),
+    for the parts to be read separately (see `musicxml_to_measure_map`).
+    Tags within comments, CDATA sections and processing instructions are skipped.
+    Returns an empty list if no parts are found (e.g., in UTF-16).
+    """
+
+    spans = []
+    start = None
+    for match in PART_TAGS.finditer(data):
+        tag = match.group()
+        if tag.startswith((b"<!", b"<?")):
+            continue
+        if tag.startswith(b"</"):
+            if start is not None:
+                spans.append((start, match.end()))
+                start = None
+        elif tag.endswith(b"/>"):
+            spans.append((match.start(), match.end()))
+        elif start is None:
+            start = match.start()
+    if not spans:
+        return []
+    header, footer = data[:spans[0][0]], data[spans[-1][1]:]
+    return [header + data[start:stop] + footer for start, stop in spans]
+
+
+def part_measure_maps(document: bytes) -> list[list]:
+    """The measure map of each staff of the part in a document made by `split_parts`."""
+    staves = []
+    for _, bars in read_musicxml_bars(io.BytesIO(document)):
+        if not staves:
+            staves = [[] for _ in bars]
+        for staff, bar in zip(staves, bars):
+            staff.append(bar)
+    return [list(measuring_bars.iter_measure_map(bars)) for bars in staves]
+
+
+def musicxml_to_measure_map(
+        path: Path,
+        check_parts_match: bool = True,
+        processes: int = 1
+) -> list:
+    """
+    Extract the measure map of a MusicXML file, as `music21_application.stream_to_measure_map` does
+    from the parsed score (see notes there).
+    As in music21, each staff of a part counts as a part of its own.
+
+    With check_parts_match=False, only the first part is parsed.
+    Otherwise, each later part is checked against the first as it is read, stopping at the first measure that differs
+    (for a part of several staves, the staves after the first are held until the first has been checked),
+    and the error reports the first part that differs, and from which measure (by count).
+
+    With processes other than 1 (None for one per core), the parts are read at the same time, on a pool of worker
+    processes, each parsing one part (see `split_parts`), and checked in turn as they are done.
+    This pays off for scores with many parts, on several cores: a pool takes time to start.
+    """
+
+    if check_parts_match and processes != 1:
+        with open_musicxml(path) as file:
+            documents = split_parts(file.read())
+        if len(documents) > 1:
+            return check_part_measure_maps(documents, processes)
+
+    measure_map = None
+    index = 0  # Of the part (staff) to check next
+    measures = iter_musicxml_bars(path, number_of_parts=None if check_parts_match else 1)
+    try:
+        for _, part in groupby(measures, key=itemgetter(0)):
+            part = map(itemgetter(1), part)
+            first = next(part)
+            for staff, bars in enumerate(tee(chain([first], part), len(first))):
+                bars = map(itemgetter(staff), bars)
+                if measure_map is None:
+                    measure_map = list(measuring_bars.iter_measure_map(bars))
+                    if not check_parts_match:
+                        return measure_map
+                else:
+                    count = measuring_bars.first_difference(
+                        measure_map,
+                        measuring_bars.iter_measure_map(bars, settled=False)
+                    )
+                    if count is not None:
+                        raise ValueError(f"Parts 0 and {index} do not match (from measure count {count}).")
+                index += 1
+    finally:
+        measures.close()
+
+    return measure_map if measure_map is not None else []
+
+
+def check_part_measure_maps(
+        documents: list[bytes],
+        processes: int = None
+) -> list:
+    """
+    Read the parts made by `split_parts` on a pool of worker processes, and check each against the first in turn,
+    as they are done, cancelling the rest at the first that differs (see `musicxml_to_measure_map`).
+    """
+
+    measure_map = None
+    index = 0
+    with ProcessPoolExecutor(processes) as executor:
+        try:
+            for future in [executor.submit(part_measure_maps, x) for x in documents]:
+                for staff_map in future.result():
+                    if measure_map is None:
+                        measure_map = staff_map
+                    else:
+                        count = measuring_bars.first_difference(measure_map, staff_map)
+                        if count is not None:
+                            raise ValueError(f"Parts 0 and {index} do not match (from measure count {count}).")
+                    index += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return measure_map if measure_map is not None else []
@@ -0,0 +1,410 @@
+"""
+
+NAME:
+===============================
+Repeats (repeats.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Repeat structures of measure maps (lists of dicts, as used by measuring_bars),
+read from the `next` field of each measure without modifying the map.
+
+The playback order follows the same rules as `measuring_bars.perform_expand_repeats`:
+playback starts at the first measure;
+the k-th time a measure is left, playback goes to the k-th entry of its `next` list
+(or, once that list is exhausted, to the following measure);
+and playback ends on reaching the last measure (or jumping beyond it).
+
+"""
+
+from typing import Iterator, Mapping, Sequence
+
+import numpy as np
+
+
+# ------------------------------------------------------------------------------
+
+def jump_table(measure_map: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gather the `next` targets of a measure map once, as 0-based indices in CSR form:
+    the targets of measure i are targets[offsets[i]:offsets[i + 1]].
+    Like the rest of measuring_bars, this assumes that counts run from 1.
+    """
+    lengths = [len(measure.get("next") or []) for measure in measure_map]
+    offsets = np.zeros(len(measure_map) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    targets = np.fromiter(
+        (target - 1 for measure in measure_map for target in measure.get("next") or []),
+        dtype=np.int64,
+        count=int(offsets[-1])
+    )
+    return offsets, targets
+
+
+def unfold(measure_map: list[dict]) -> Iterator[tuple[int, int]]:
+    """
+    Lazily yield the playback order of a measure map as (performance_index, count) pairs,
+    the performance index counting from 1 like `count`.
+    The measure map is not modified.
+    """
+    if not measure_map:
+        return
+    offsets, targets = jump_table(measure_map)
+    offsets, targets = offsets.tolist(), targets.tolist()
+    departures = [0] * len(measure_map)
+    last = len(measure_map) - 1
+
+    performance_index = 1
+    i = 0
+    yield performance_index, 1
+    while i < last:
+        k = offsets[i] + departures[i]
+        departures[i] += 1
+        if k < offsets[i + 1]:
+            i = targets[k]
+        else:
+            i = measure_map[i]["count"]  # The following measure
+        if not 0 <= i <= last:
+            return
+        performance_index += 1
+        yield performance_index, i + 1
+
+
+class MeasureView(Mapping):
+    """
+    Read-only view of a measure (dict) with some fields replaced, without copying the measure.
+    """
+
+    def __init__(
+        self,
+        measure: dict,
+        overrides: dict
+    ):
+        self.measure = measure
+        self.overrides = overrides
+
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.measure[key]
+
+    def __iter__(self):
+        yield from self.measure
+        yield from (key for key in self.overrides if key not in self.measure)
+
+    def __len__(self) -> int:
+        return len(self.measure) + sum(key not in self.measure for key in self.overrides)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class ExpandedMeasureMap(Sequence):
+    """
+    The measure map with its repeats expanded, as from `measuring_bars.perform_expand_repeats`,
+    but without copying any measures: each entry is a `MeasureView` of the original measure,
+    renumbered in performance order, running straight on to the next, and without repeat marks.
+
+    The playback order is worked out on first use (see `unfold`) and
+    held as one array of indices into the original map.
+    Use `to_dicts` to materialise the expanded map.
+    """
+
+    def __init__(self, measure_map: list[dict]):
+        self.measure_map = measure_map
+        self._order = None
+
+    @property
+    def order(self) -> np.ndarray:
+        """The 0-based index in the original map of each measure in performance order."""
+        if self._order is None:
+            self._order = np.fromiter((count - 1 for _, count in unfold(self.measure_map)), dtype=np.int64)
+        return self._order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Expanded measure map index out of range.")
+        overrides = {
+            "count": index + 1,
+            "next": [index + 2],
+            "start_repeat": False,
+            "end_repeat": False,
+        }
+        return MeasureView(self.measure_map[self.order[index]], overrides)
+
+    def to_dicts(self) -> list[dict]:
+        """Materialise the expanded map as a list of dicts."""
+        return [dict(view) for view in self]
+
+
+# ------------------------------------------------------------------------------
+
+class RepeatGraph:
+    """
+    The control flow of a measure map as a graph over its (0-based) measure indices,
+    held in CSR form: the successors of measure i are targets[offsets[i]:offsets[i + 1]],
+    being its `next` targets or, if it has none, the following measure.
+
+    Back edges (to the same or an earlier measure) are loops (repeats, da capo, dal segno);
+    forward edges that skip measures leave out a first-time bar or volta.
+    """
+
+    def __init__(self, measure_map: list[dict]):
+        self.measure_map = measure_map
+        length = len(measure_map)
+        self.explicit_offsets, self.explicit_targets = jump_table(measure_map)
+
+        explicit_lengths = np.diff(self.explicit_offsets)
+        successors = np.arange(1, length + 1)
+        lengths = np.where(explicit_lengths == 0, 1, explicit_lengths)
+        self.offsets = np.zeros(length + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.targets = np.repeat(successors, lengths)  # Placeholder for the explicit targets
+        explicit = np.repeat(explicit_lengths > 0, lengths)
+        self.targets[explicit] = self.explicit_targets
+        self.sources = np.repeat(np.arange(length), lengths)
+
+        self.starts = np.zeros(length + 1)
+        np.cumsum([measure.get("actual_length") or 0.0 for measure in measure_map], out=self.starts[1:])
+
+        # The measures whose departures do not all go to the following measure
+        linear = np.ones(length, dtype=bool)
+        linear[self.sources[self.targets != self.sources + 1]] = False
+        self.linear = linear
+
+    def loops(self) -> list[tuple[int, int]]:
+        """The (first, last) measure indices of each loop, from its back edge."""
+        back = self.targets <= self.sources
+        return list(zip(self.targets[back].tolist(), self.sources[back].tolist()))
+
+    def branches(self) -> list[tuple[int, int]]:
+        """The (from, to) measure indices of each forward edge that skips measures, as for voltas."""
+        skip = self.targets > self.sources + 1
+        return list(zip(self.sources[skip].tolist(), self.targets[skip].tolist()))
+
+    def segments(self) -> Iterator[tuple[int, int]]:
+        """
+        Yield the playback order (as in `unfold`) as (first, last) runs of measures played straight through,
+        jumping from the end of each run to the next so that the time taken follows the number of jumps,
+        not the number of measures performed.
+        """
+        length = len(self.measure_map)
+        if not length:
+            return
+        last = length - 1
+
+        # For each measure, the first measure from there on that does not just lead to the following one
+        stops = np.where(~self.linear, np.arange(length), last)
+        run_ends = np.minimum.accumulate(stops[::-1])[::-1].tolist()
+        offsets, targets = self.explicit_offsets.tolist(), self.explicit_targets.tolist()
+        departures = {}
+
+        i = 0
+        while True:
+            j = run_ends[i]
+            yield i, j
+            if j >= last:
+                return
+            k = offsets[j] + departures.get(j, 0)
+            departures[j] = departures.get(j, 0) + 1
+            i = targets[k] if k < offsets[j + 1] else j + 1
+            if not 0 <= i <= last:
+                return
+
+    def performed_length(self) -> int:
+        """The number of measures in the performance, without expanding the map."""
+        return sum(last - first + 1 for first, last in self.segments())
+
+    def performed_duration(self) -> float:
+        """The total actual_length of the performance, without expanding the map."""
+        return float(sum(self.starts[last + 1] - self.starts[first] for first, last in self.segments()))
+
+    def structure(self, digits: int = 6) -> dict:
+        """
+        The repeat structure in terms of notated positions (the sum of actual_lengths before a measure),
+        which are the same for two maps that differ only by splits and joins:
+        - "loops": (start of first measure, end of last measure) for each loop;
+        - "branches": (end of measure jumped from, start of measure jumped to) for each forward skip;
+        - "performed_duration": the total actual_length of the performance.
+        """
+        starts = np.round(self.starts, digits).tolist()
+        return {
+            "loops": sorted((starts[first], starts[last + 1]) for first, last in self.loops()),
+            "branches": sorted((starts[source + 1], starts[target]) for source, target in self.branches()),
+            "performed_duration": round(self.performed_duration(), digits),
+        }
+
+
+def compare_repeat_structure(
+        preferred: list[dict],
+        other: list[dict]
+) -> dict:
+    """
+    Compare the repeat structures of two measure maps (see `RepeatGraph.structure`) without expanding them.
+
+    Returns an empty dict if they agree, and otherwise the differences:
+    for "loops" and "branches", those "missing" from the other map and those "extra" to it;
+    and the two "performed_duration"s, if these differ.
+    """
+    preferred_structure = RepeatGraph(preferred).structure()
+    other_structure = RepeatGraph(other).structure()
+
+    difference = {}
+    for key in ("loops", "branches"):
+        missing = sorted(set(preferred_structure[key]) - set(other_structure[key]))
+        extra = sorted(set(other_structure[key]) - set(preferred_structure[key]))
+        if missing or extra:
+            difference[key] = {"missing": missing, "extra": extra}
+    if preferred_structure["performed_duration"] != other_structure["performed_duration"]:
+        difference["performed_duration"] = (preferred_structure["performed_duration"],
+                                            other_structure["performed_duration"])
+    return difference
+
+
+# ------------------------------------------------------------------------------
+
+class PerformanceIndex:
+    """
+    Two-way translation between notated positions in a measure map and positions in its performance
+    (with the repeats unfolded, as by `unfold`), for whole arrays of queries at once.
+
+    Notated positions are counts and qstamps (those of the map, if it has them all,
+    otherwise the sums of the actual_lengths before each measure);
+    performance positions are performance indices (from 1, as in `unfold`) and
+    performance qstamps (the sum of the actual_lengths performed before).
+
+    Since a repeated measure is performed more than once, the index holds one row per pass:
+    row k gives, for each measure, its performance index and qstamp the (k + 1)-th time it is played.
+    Queries are answered with `np.searchsorted` on these sorted arrays, and on the start of each run of the performance,
+    without walking the repeat structure again.
+    """
+
+    def __init__(self, measure_map: list[dict]):
+        graph = RepeatGraph(measure_map)
+        length = len(measure_map)
+        self.lengths = np.diff(graph.starts)
+        qstamps = [measure.get("qstamp") for measure in measure_map]
+        if all(qstamp is not None for qstamp in qstamps):
+            self.notated_starts = np.array(qstamps, dtype=float)
+        else:
+            self.notated_starts = graph.starts[:-1].copy()
+
+        segments = np.array(list(graph.segments()), dtype=np.int64).reshape(-1, 2)
+        self.segment_firsts = segments[:, 0]
+        segment_lengths = segments[:, 1] - segments[:, 0] + 1
+        segment_durations = graph.starts[segments[:, 1] + 1] - graph.starts[segments[:, 0]]
+        self.segment_indices = np.concatenate([[0], np.cumsum(segment_lengths)[:-1]]).astype(np.int64)
+        self.segment_starts = np.concatenate([[0.0], np.cumsum(segment_durations)[:-1]])
+        self.performed_length = int(segment_lengths.sum())
+        self.performed_duration = float(segment_durations.sum())
+
+        plays = np.zeros(length, dtype=np.int64)
+        passes, measures, indices, starts = [], [], [], []
+        for (first, last), index, start in zip(segments.tolist(), self.segment_indices.tolist(),
+                                               self.segment_starts.tolist()):
+            window = np.arange(first, last + 1)
+            passes.append(plays[first:last + 1].copy())
+            measures.append(window)
+            indices.append(index + 1 + window - first)
+            starts.append(start + graph.starts[window] - graph.starts[first])
+            plays[first:last + 1] += 1
+
+        self.passes = int(plays.max()) if length else 0
+        self.performance_indices = np.full((self.passes, length), -1, dtype=np.int64)
+        self.performance_starts = np.full((self.passes, length), np.nan)
+        if segments.size:
+            passes, measures = np.concatenate(passes), np.concatenate(measures)
+            self.performance_indices[passes, measures] = np.concatenate(indices)
+            self.performance_starts[passes, measures] = np.concatenate(starts)
+
+    # Score to performance
+
+    def _measures_at(self, qstamps: np.ndarray) -> np.ndarray:
+        """The 0-based index of the measure containing each notated qstamp (-1 if outside the map)."""
+        measures = np.searchsorted(self.notated_starts, qstamps, side="right") - 1
+        outside = (measures < 0) | (qstamps >= self.notated_starts[measures.clip(0)] + self.lengths[measures.clip(0)])
+        return np.where(outside, -1, measures)
+
+    def count_to_performance(
+        self,
+        counts,
+        occurrence: int = 0
+    ) -> np.ndarray:
+        """
+        The performance index of each count the (occurrence + 1)-th time it is played
+        (-1 if it is not played that often, or not in the map).
+        """
+        measures = np.asarray(counts, dtype=np.int64) - 1
+        valid = (measures >= 0) & (measures < self.performance_indices.shape[1]) & (occurrence < self.passes)
+        if not valid.any():
+            return np.full(measures.shape, -1, dtype=np.int64)
+        row = self.performance_indices[min(occurrence, self.passes - 1)]
+        return np.where(valid, row[measures.clip(0, len(row) - 1)], -1)
+
+    def to_performance(
+        self,
+        qstamps,
+        occurrence: int = 0
+    ) -> np.ndarray:
+        """
+        The performance qstamp of each notated qstamp the (occurrence + 1)-th time it is played
+        (NaN if it is not played that often, or not in the map).
+        """
+        qstamps = np.asarray(qstamps, dtype=float)
+        measures = self._measures_at(qstamps)
+        valid = (measures >= 0) & (occurrence < self.passes)
+        if not valid.any():
+            return np.full(qstamps.shape, np.nan)
+        row = self.performance_starts[min(occurrence, self.passes - 1)]
+        measures = measures.clip(0)
+        return np.where(valid, row[measures] + qstamps - self.notated_starts[measures], np.nan)
+
+    # Performance to score
+
+    def performance_to_count(self, indices) -> np.ndarray:
+        """The count played at each performance index (-1 if outside the performance)."""
+        indices = np.asarray(indices, dtype=np.int64) - 1
+        segments = np.searchsorted(self.segment_indices, indices, side="right") - 1
+        valid = (indices >= 0) & (indices < self.performed_length)
+        counts = self.segment_firsts[segments.clip(0)] + indices - self.segment_indices[segments.clip(0)] + 1
+        return np.where(valid, counts, -1)
+
+    def to_score(self, performance_qstamps) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        For each performance qstamp, the notated count and qstamp played at that moment,
+        and which time that measure is being played (from 0).
+        Positions outside the performance give count -1, qstamp NaN and occurrence -1.
+        """
+        performance_qstamps = np.asarray(performance_qstamps, dtype=float)
+        segments = np.searchsorted(self.segment_starts, performance_qstamps, side="right") - 1
+        valid = (performance_qstamps >= 0) & (performance_qstamps < self.performed_duration) & (segments >= 0)
+        segments = segments.clip(0)
+
+        # Position within the segment, as a notated position from its first measure
+        firsts = self.segment_firsts[segments]
+        within = performance_qstamps - self.segment_starts[segments]
+        cumulative = np.concatenate([[0.0], np.cumsum(self.lengths)])
+        measures = np.searchsorted(cumulative, cumulative[firsts] + within, side="right") - 1
+        measures = measures.clip(0, max(len(self.lengths) - 1, 0))
+        qstamps = self.notated_starts[measures] + cumulative[firsts] + within - cumulative[measures]
+
+        occurrences = (self.performance_starts[:, measures] <= performance_qstamps).sum(axis=0) - 1
+        return (
+            np.where(valid, measures + 1, -1),
+            np.where(valid, qstamps, np.nan),
+            np.where(valid, occurrences, -1),
+        )
@@ -0,0 +1,410 @@
+"""
+
+NAME:
+===============================
+RomanText (romantext.py)
+
+
+LICENCE:
+===============================
+Creative Commons Attribution-ShareAlike 4.0 International License
+https://creativecommons.org/licenses/by-sa/4.0/
+
+
+ABOUT:
+===============================
+Line-oriented extraction of measure maps from RomanText analyses (analysis.txt, .rntxt),
+without music21's RomanText parser (which builds every Roman numeral, key and pivot of the harmonic stream).
+
+Each line is read once, and only for what bears on the bar structure:
+- `Time Signature:` lines (in the header, or between measures);
+- measure lines (`mN`), including endings (`mNa`, `mNb`, ...) but not variants (`mNvar1`, ...);
+- measure copies (`mN = mA`, `mN-M = mA-B`);
+- within measures, the beat offsets (`b2`, `b3.5`, `b1.66`, ...),
+the chord and no-chord atoms placed at them, and repeat markers (`||:`, `:||`).
+
+The result is the same measure map as `music21_application.part_to_measure_map`
+for music21's reading of the same file, including its reading of the durations:
+a measure lasts until the end of the bar from its first chord (or beat) to its last;
+the previous chord runs on into any measure without one (or up to its first beat), and through any skipped measure numbers;
+a measure 0 starting after its first beat is a pickup, and then a last measure ending
+on a chord longer than that offset is shortened to complete it;
+and the last measure of a first ending gets an end repeat if it has none.
+
+"""
+
+# ------------------------------------------------------------------------------
+
+import copy
+import re
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterator
+
+from . import measuring_bars
+from .utils import to_quarter_length
+
+
+# ------------------------------------------------------------------------------
+
+MEASURE_TAG = re.compile(r"m[0-9]+[a-h]*-*[0-9]*[a-h]*")
+VARIANT = re.compile(r"var([0-9]+|[A-Z]+)")
+BEAT = re.compile(r"b[1-9.]")
+KEY = re.compile(r"[A-Ga-g]+[b#]*;?:")
+NO_CHORD = re.compile(r"(NC|N.C.|nc)")
+OTHER_ATOMS = re.compile(r"\?\([A-Ga-g]+[b#]*:|\?\)[A-Ga-g]+[b#]*:?|KS-?[0-7]")  # Optional keys and key signatures
+
+ENDING_LETTERS = "abcdefgh"
+TIME_SIGNATURE_NAMES = {"c": "4/4", "common": "4/4", "cut": "2/2"}
+
+
+class AnalysisReader:
+    """
+    Running state through the lines of a RomanText analysis: time signature, numbering,
+    and the measures read so far (for copying, and for the durations still open at the end of each).
+
+    Each measure is held as a dict of its number, attached time signature (if any), repeats and endings,
+    `extent` (the end of its last settled element) and `chord` (its last chord, whose length stays open
+    for as long as no later chord replaces it, as in music21).
+    """
+
+    def __init__(self):
+        self.time_signature, self.bar_duration, self.beats = parse_time_signature("4/4")  # music21's default
+        self.time_signature_due = True  # Not yet attached to a measure
+        self.chord_bar_duration = self.bar_duration  # At the last chord, for the measures it runs on through
+        self.measures = []
+        self.last_number = 0
+        self.last_letters = [""]  # Of the last measure line, for filling skipped measures
+        self.previous_chord = None  # The last chord of all, which any chordless measure extends
+
+    # Lines
+
+    def read_line(self, line: str) -> None:
+        """Read one line of the file: a measure line, a `Time Signature:` line, or anything else (ignored)."""
+        line = line.strip()
+        if MEASURE_TAG.match(line):
+            self.read_measure_line(line)
+        elif ":" in line:
+            tag, data = line.split(":", 1)
+            if tag.strip().lower() in ("timesignature", "time signature"):
+                self.set_time_signature(data.strip())
+
+    def set_time_signature(self, data: str) -> None:
+        """Set the current time signature (for the next measure line), unless it cannot be read."""
+        parsed = parse_time_signature(data)
+        if parsed is None:
+            return
+        self.time_signature, self.bar_duration, self.beats = parsed
+        self.time_signature_due = True
+
+    def read_measure_line(self, line: str) -> None:
+        """Read a measure line (`mN ...`), or a copy of earlier measures (`mN-M = mA-B`)."""
+
+        tag = MEASURE_TAG.match(line).group(0)
+        data = line[len(tag):].strip()
+        numbers, letters = parse_measure_tag(tag.strip())
+        if VARIANT.match(data):
+            return  # Not part of the main reading
+
+        if numbers[0] > self.last_number + 1 and self.previous_chord is not None:
+            self.fill_to(numbers[0])
+
+        self.last_letters = letters
+        if data.startswith("=") or len(numbers) > 1:
+            self.copy_measures(numbers, data)
+            return
+
+        measure = self.new_measure(numbers[0], letters)
+        if self.time_signature_due:
+            measure["time_signature"] = (self.time_signature, self.bar_duration)
+            self.time_signature_due = False
+        self.last_number = numbers[0]
+
+        self.read_atoms(measure, data.split())
+        if measure_length(measure) == 0:
+            self.extend_previous_chord(measure)
+        self.measures.append(measure)
+
+    def new_measure(self, number: int, letters: list) -> dict:
+        """A measure with nothing in it yet, for the number and ending letters given."""
+        return {
+            "number": number,
+            "time_signature": None,  # Attached: (ratio string, bar duration)
+            "start_repeat": False,
+            "end_repeat": False,
+            "endings": [ENDING_LETTERS.index(x) + 1 for x in letters if x],
+            "extent": Fraction(0),
+            "chord": None,  # The last: {"offset", "length", "rest"}
+            "first_chord": None  # Offset of the first chord (not rest), for pickups
+        }
+
+    def fill_to(self, number: int) -> None:
+        """Fill skipped measure numbers (before `number`) with the previous chord, running on."""
+        for skipped in range(self.last_number + 1, number):
+            measure = self.new_measure(skipped, self.last_letters)
+            self.extend_previous_chord(measure)
+            self.measures.append(measure)
+        self.last_number = number - 1
+
+    def copy_measures(self, numbers: list, data: str) -> None:
+        """Copy earlier measures by number: the first of each number, up to the first of the last."""
+
+        targets, _ = parse_measure_tag(data.replace("=", "").strip())
+        if len(targets) != len(numbers) or numbers[-1] - numbers[0] != targets[-1] - targets[0]:
+            raise ValueError(f"Copies must be of as many measures as they define: {numbers} = {targets}")
+
+        copies = []
+        for measure in self.measures:
+            if targets[0] <= measure["number"] <= targets[-1]:
+                copied = copy.deepcopy(measure)
+                copied["number"] = numbers[0] + measure["number"] - targets[0]
+                copied["endings"] = []
+                copies.append(copied)
+                if len(targets) == 1:
+                    break
+            if measure["number"] == targets[-1]:
+                break
+        if not copies:
+            raise ValueError(f"No measure {targets[0]} to copy for measure {numbers[0]}.")
+
+        self.measures.extend(copies)
+        self.last_number = copies[-1]["number"]
+        last_chord = copies[-1]["chord"]
+        if last_chord is not None and not last_chord["rest"]:  # Runs on from the copy
+            self.previous_chord = last_chord
+
+    # Atoms
+
+    def read_atoms(self, measure: dict, atoms: list) -> None:
+        """Read the atoms of a measure line for chord offsets and repeats, as music21 places them."""
+
+        offset = Fraction(0)
+        chord_in_measure = None
+        pivot_possible = False  # A second chord at the same offset is a pivot, not a chord of its own
+        for index, atom in enumerate(atoms):
+            if atom == "=":
+                break
+            if atom in ("||", "(", ")"):  # Phrase boundaries and parentheses
+                measure["extent"] = max(measure["extent"], offset)
+            elif BEAT.match(atom):
+                new_offset = self.beat_offset(atom)
+                if chord_in_measure is None and self.previous_chord is not None and new_offset > 0:
+                    # The previous chord runs on into this measure, up to the first beat given
+                    chord_in_measure = self.place_chord(measure, Fraction(0), self.previous_chord["rest"])
+                    chord_in_measure["length"] = new_offset
+                pivot_possible = False
+                offset = new_offset
+            elif OTHER_ATOMS.match(atom) or KEY.match(atom):
+                measure["extent"] = max(measure["extent"], offset)
+            elif atom.startswith("||:") or atom.startswith(":||"):
+                end = atom.startswith(":||")
+                if end and index == len(atoms) - 1:
+                    measure["end_repeat"] = True
+                    measure["extent"] = max(measure["extent"], self.bar_duration)
+                elif offset == 0 and not end:
+                    measure["start_repeat"] = True
+                elif offset == self.bar_duration and end:
+                    measure["end_repeat"] = True
+                measure["extent"] = max(measure["extent"], offset)
+            else:  # A chord, or no chord (a rest)
+                rest = NO_CHORD.match(atom) is not None
+                self.chord_bar_duration = self.bar_duration
+                if rest:
+                    measure["extent"] = max(measure["extent"], offset)
+                    if measure["first_chord"] is None:
+                        measure["first_chord"] = offset
+                if pivot_possible:
+                    pivot_possible = rest  # A pivot chord, or nothing after one
+                    continue
+                if chord_in_measure is not None:
+                    chord_in_measure["length"] = offset - chord_in_measure["offset"]
+                    measure["extent"] = max(measure["extent"], offset)
+                chord_in_measure = self.place_chord(measure, offset, rest)
+                pivot_possible = not rest
+
+        if self.previous_chord is not None:  # The last chord runs to the end of the bar
+            self.previous_chord["length"] = self.bar_duration - offset
+
+    def place_chord(self, measure: dict, offset: Fraction, rest: bool) -> dict:
+        """Place a chord (or rest) at an offset in a measure: the last chord, until another follows."""
+        chord = {"offset": offset, "length": Fraction(1), "rest": rest}
+        measure["chord"] = chord
+        if not rest and measure["first_chord"] is None:
+            measure["first_chord"] = offset
+        self.previous_chord = chord
+        return chord
+
+    def extend_previous_chord(self, measure: dict) -> None:
+        """Fill an empty measure with the previous chord, running on for a bar of its time signature."""
+        if self.previous_chord is None:
+            return
+        chord = self.place_chord(measure, Fraction(0), self.previous_chord["rest"])
+        chord["length"] = self.chord_bar_duration
+
+    def beat_offset(self, atom: str) -> Fraction:
+        """The offset of a beat atom (e.g., `b2.5`) in the current time signature, or 0 if there is no such beat."""
+        beat_number, fraction = divmod(parse_beat(atom), 1)
+        if not 1 <= beat_number <= len(self.beats):
+            return Fraction(0)
+        start, length = self.beats[int(beat_number) - 1]
+        return start + length * add_precision(fraction)
+
+    # Measure map
+
+    def iter_bars(self) -> Iterator[dict]:
+        """
+        Generate the bar attributes of each measure read, in the form used by measuring_bars.iter_measure_map,
+        once the pickup and endings are settled.
+        """
+
+        self.set_ending_repeats()
+        lengths = [measure_length(x) for x in self.measures]
+        self.fix_pickup(lengths)
+
+        time_signature, bar_duration = None, None
+        offset = Fraction(0)
+        for measure, length in zip(self.measures, lengths):
+            if measure["time_signature"] is not None:
+                time_signature, bar_duration = measure["time_signature"]
+            yield {
+                "qstamp": to_quarter_length(offset),
+                "number": measure["number"],
+                "nominal_length": to_quarter_length(bar_duration),
+                "actual_length": to_quarter_length(length),
+                "time_signature": time_signature,
+                "start_repeat": measure["start_repeat"],
+                "end_repeat": measure["end_repeat"],
+                "left_barline": None  # No voltas as such: endings are read from the measure numbers
+            }
+            offset += length
+
+    def set_ending_repeats(self) -> None:
+        """End each run of first-ending measures (contiguous by number) with a repeat, as music21 does."""
+        first_endings = [x for x in self.measures if 1 in x["endings"]]
+        for measure, following in zip(first_endings, first_endings[1:] + [None]):
+            if following is None or following["number"] > measure["number"] + 1:
+                measure["end_repeat"] = True
+
+    def fix_pickup(self, lengths: list) -> None:
+        """
+        Where measure 0 starts after its first beat, read it as a pickup of the rest of its bar, as music21 does;
+        the last measure is then cut to the length of that first beat offset, completing the bar,
+        if its last chord is longer than that.
+        """
+        pickup = next((i for i, x in enumerate(self.measures) if x["number"] == 0), None)
+        if pickup is None or not self.measures[pickup]["first_chord"]:
+            return
+        padding = self.measures[pickup]["first_chord"]
+        lengths[pickup] -= padding
+
+        last = self.measures[-1]
+        if pickup == len(self.measures) - 1 or last["chord"] is None or last["chord"]["rest"]:
+            return
+        if last["chord"]["length"] > padding:
+            last["chord"]["length"] -= lengths[-1] - padding
+            lengths[-1] = measure_length(last)
+
+
+def measure_length(measure: dict) -> Fraction:
+    """The actual length of a measure: to the end of its last element."""
+    chord = measure["chord"]
+    if chord is None:
+        return measure["extent"]
+    return max(measure["extent"], chord["offset"] + chord["length"])
+
+
+# ------------------------------------------------------------------------------
+
+def parse_measure_tag(tag: str) -> tuple[list, list]:
+    """
+    Measure numbers and ending letters of a measure tag or copy target, e.g., `m5a` or `m5-7`,
+    as music21's `RTMeasure._getMeasureNumberData`.
+    """
+    numbers, letters = [], []
+    for part in tag.split("-"):
+        if not part:
+            continue
+        match = re.search(r"[0-9]+", part)
+        if match is None:
+            raise ValueError(f"Cannot read the measure number(s) in {tag!r}.")
+        numbers.append(int(match.group(0)))
+        letters.append(re.sub(r"[0-9m\s]", "", part))
+    return numbers, letters
+
+
+def parse_time_signature(data: str) -> tuple[str, Fraction, list] | None:
+    """
+    The ratio string (as music21's `TimeSignature.ratioString`), bar duration (in quarter notes),
+    and beats (start and length of each, as music21's default beat partition) of a time signature,
+    or None if it cannot be read.
+    """
+    data = TIME_SIGNATURE_NAMES.get(data.lower(), data).replace(" ", "")
+    summands = []  # (numerator, denominator), where a denominator may be shared, as in 2+3/8
+    for summand in reversed(data.split("+")):
+        numerator, _, denominator = summand.partition("/")
+        if not denominator and summands:
+            denominator = str(summands[-1][1])
+        if not (numerator.isdigit() and denominator.isdigit() and int(denominator)):
+            return None
+        summands.append((numerator, int(denominator)))
+    summands.reverse()
+
+    beats = []
+    bar_duration = Fraction(0)
+    for numerator, denominator in summands:
+        numerator = int(numerator)
+        unit = Fraction(4, denominator)
+        if len(summands) > 1:  # One beat per summand
+            beat_units = numerator
+        elif numerator % 3 == 0 and (numerator > 3 or denominator >= 8):  # Compound
+            beat_units = 3
+        else:
+            beat_units = 1
+        for _ in range(max(numerator // beat_units, 1)):
+            beats.append((bar_duration, unit * beat_units))
+            bar_duration += unit * beat_units
+    ratio = "+".join(f"{n}/{d}" for n, d in summands)
+    return ratio, bar_duration, beats
+
+
+def parse_beat(atom: str) -> Fraction:
+    """The beat number of a beat atom, e.g., `b2.5` as 5/2, as music21's `RTBeat.getBeatFloatOrFrac`."""
+    parts = atom.replace("b", "").split(".")
+    beat = Fraction(int(parts[0] or 0))
+    if len(parts) > 1 and parts[1]:
+        fraction = add_precision(Fraction("." + parts[1]))
+        beat += fraction
+        if len(parts) > 2 and parts[2]:  # A fraction of that fraction, as in 1.66.5
+            beat += Fraction("." + parts[2]) / fraction.denominator
+    return beat
+
+
+def add_precision(value: Fraction) -> Fraction:
+    """Read decimals close to a third or a sixth as exactly that, as music21's `common.addFloatPrecision`."""
+    for exact in (Fraction(1, 3), Fraction(2, 3), Fraction(1, 6), Fraction(5, 6)):
+        if abs(value - exact) <= Fraction(1, 100):
+            return exact
+    return value
+
+
+# ------------------------------------------------------------------------------
+
+def iter_romantext_bars(path: Path) -> Iterator[dict]:
+    """
+    Generate the bar attributes of each measure in a RomanText file, in order.
+    The file is read line by line; the measures are held until the end,
+    as copies refer back to them and a pickup changes the length of the last.
+    """
+    reader = AnalysisReader()
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            reader.read_line(line)
+    yield from reader.iter_bars()
+
+
+def romantext_to_measure_map(path: Path) -> list:
+    """
+    Extract the measure map of a RomanText file,
+    in the layout of `music21_application.part_to_measure_map` (see notes there).
+    """
+    return list(measuring_bars.iter_measure_map(iter_romantext_bars(path)))
@@ -26,3 +26,10 @@ def time_signature2nominal_length(time_signature: str) -> float:
     except ValueError:
         raise ValueError(f"Invalid time signature: {time_signature!r}")
     return ts_frac * 4.0
+
+
+def to_quarter_length(value: Fraction) -> float | Fraction:
+    """As music21's `opFrac`: a float where that is exact (a power-of-two denominator), else the Fraction."""
+    if value.denominator & (value.denominator - 1) == 0:
+        return float(value)
+    return value.limit_denominator(65535)
@@ -0,0 +1,125 @@
+"""
+Test the array-based alignment engines.
+"""
+
+import json
+import random
+from unittest import TestCase
+
+from Code.alignment import *
+from Code.measuring_bars import needleman_wunsch
+
+from . import EG_FOLDER, REPO_FOLDER
+
+
+def random_measure_map(length: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "count": i + 1,
+            "actual_length": rng.choice([1.0, 3.0, 4.0]),
+            "time_signature": rng.choice(["4/4", "3/4"]),
+            "start_repeat": rng.random() < 0.1,
+            "end_repeat": rng.random() < 0.1,
+        }
+        for i in range(length)
+    ]
+
+
+class Test(TestCase):
+
+    def test_encoding(self):
+        preferred = [{"actual_length": 4.0, "time_signature": "4/4", "start_repeat": False, "end_repeat": False}]
+        other = [
+            {"actual_length": 4, "time_signature": "4/4", "start_repeat": False, "end_repeat": False},
+            {"actual_length": 3.0, "time_signature": "4/4", "start_repeat": False, "end_repeat": False},
+        ]
+        preferred_codes, other_codes = encode_measure_maps(preferred, other)
+        self.assertEqual(preferred_codes[0], other_codes[0])
+        self.assertNotEqual(other_codes[0], other_codes[1])
+
+    def test_numpy_engine_matches_python(self):
+        for seed in range(20):
+            preferred = random_measure_map(random.Random(seed).randint(0, 30), seed)
+            other = random_measure_map(random.Random(-seed).randint(0, 30), seed + 100)
+            self.assertEqual(
+                needleman_wunsch(preferred, other, engine="python"),
+                needleman_wunsch(preferred, other, engine="numpy")
+            )
+
+    def test_numpy_engine_on_examples(self):
+        with open(EG_FOLDER / "expanded_repeats.measuremap.json", "r") as file:
+            preferred = json.load(file)
+        with open(REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "other.measuremap.json", "r") as file:
+            other = json.load(file)
+        self.assertEqual(
+            needleman_wunsch(preferred, other, engine="python"),
+            needleman_wunsch(preferred, other, engine="numpy")
+        )
+
+    def test_last_row_scores(self):
+        preferred = random_measure_map(17, 1)
+        other = random_measure_map(23, 2)
+        preferred_codes, other_codes = encode_measure_maps(preferred, other)
+        for j in range(len(other) + 1):
+            self.assertEqual(
+                score_alignment(*needleman_wunsch(preferred, other[:j], engine="python")),
+                last_row_scores(preferred_codes, other_codes[:j])[-1]
+            )
+
+    def test_hirschberg_score(self):
+        for seed in range(20):
+            preferred = random_measure_map(random.Random(seed).randint(0, 40), seed)
+            other = random_measure_map(random.Random(-seed).randint(0, 40), seed + 100)
+            expected = needleman_wunsch(preferred, other, engine="numpy")
+            preferred_aligned, other_aligned = hirschberg(preferred, other, max_cells=16)
+            self.assertEqual(score_alignment(*expected), score_alignment(preferred_aligned, other_aligned))
+            self.assertEqual(preferred, [x for x in preferred_aligned if x is not None])
+            self.assertEqual(other, [x for x in other_aligned if x is not None])
+
+    def test_affine_gaps_are_contiguous(self):
+        lengths = [4.0, 2.0, 4.0, 4.0, 4.0, 4.0, 4.0, 4.0, 2.0, 4.0, 4.0, 4.0,
+                   2.0, 2.0, 4.0, 4.0, 2.0, 4.0, 4.0, 4.0, 4.0, 4.0, 4.0, 4.0]
+        preferred = [
+            {"count": i + 1, "actual_length": x, "time_signature": "4/4", "start_repeat": False, "end_repeat": False}
+            for i, x in enumerate(lengths)
+        ]
+        other = [dict(x) for x in preferred[:8] + preferred[16:]]  # missing an 8-bar ending
+        for i, x in enumerate(other):
+            x["count"] = i + 1
+
+        self.assertEqual(3, len(gap_runs(*needleman_wunsch(preferred, other, engine="numpy"))))
+        self.assertEqual(
+            [("Missing", 13, 8)],
+            gap_runs(*needleman_wunsch(preferred, other, engine="affine"))
+        )
+
+    def test_affine_keeps_all_measures(self):
+        for seed in range(10):
+            preferred = random_measure_map(random.Random(seed).randint(0, 30), seed)
+            other = random_measure_map(random.Random(-seed).randint(0, 30), seed + 100)
+            preferred_aligned, other_aligned = gotoh(preferred, other)
+            self.assertEqual(len(preferred_aligned), len(other_aligned))
+            self.assertEqual(preferred, [x for x in preferred_aligned if x is not None])
+            self.assertEqual(other, [x for x in other_aligned if x is not None])
+
+    def test_anchors(self):
+        preferred = random_measure_map(200, 3)
+        other = [dict(x) for x in preferred[:80] + preferred[90:]]
+        anchors = find_anchors(*encode_measure_maps(preferred, other), k=8)
+        self.assertTrue(anchors)
+        for i, j, length in anchors:
+            self.assertEqual(preferred[i:i + length], other[j:j + length])
+            self.assertTrue(i + length <= 80 or i >= 90)
+
+    def test_anchored_alignment_score(self):
+        for seed in range(10):
+            rng = random.Random(seed)
+            preferred = random_measure_map(300, seed)
+            other = [dict(x) for x in preferred]
+            for _ in range(4):
+                start = rng.randrange(len(other))
+                del other[start:start + rng.randint(1, 8)]
+            expected = needleman_wunsch(preferred, other)
+            anchored = anchored_alignment(preferred, other, needleman_wunsch)
+            self.assertEqual(score_alignment(*expected), score_alignment(*anchored))
@@ -0,0 +1,179 @@
+"""
+Test the measure map classes.
+"""
+
+import io
+import json
+from dataclasses import asdict
+from unittest import TestCase, mock
+
+from Code.base import *
+
+from . import EG_CORE, EG_FOLDER
+
+
+class Test(TestCase):
+
+    def test_columnar_round_trip(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            measure_map = json.load(file)
+        columnar = ColumnarMeasureMap.from_dicts(measure_map)
+        self.assertEqual(10, len(columnar))
+        self.assertEqual([6, 8], columnar.get_next(4).tolist())
+        self.assertEqual(measure_map, columnar.to_dicts())
+
+        measures = MeasureMap.from_dicts(measure_map)
+        self.assertEqual(measures, ColumnarMeasureMap.from_measure_map(measures).to_measure_map())
+
+    def test_columnar_missing_values(self):
+        measure_map = [
+            {"count": 1, "qstamp": 0.0, "time_signature": "4/4", "end_repeat": None, "next": [2]},
+            {"count": 2, "qstamp": None, "time_signature": None, "end_repeat": True, "next": None},
+        ]
+        columnar = ColumnarMeasureMap.from_dicts(measure_map)
+        self.assertEqual([False, True], columnar.is_missing("qstamp").tolist())
+        self.assertEqual(measure_map, columnar.to_dicts())
+
+    def test_mismatch_mask(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            preferred = json.load(file)
+        with open(EG_FOLDER / "no_repeats.measuremap.json", "r") as file:
+            other = json.load(file)
+        strings = []
+        preferred_columns = ColumnarMeasureMap.from_dicts(preferred, strings)
+        other_columns = ColumnarMeasureMap.from_dicts(other, strings)
+        for name in ["end_repeat", "actual_length", "time_signature", "next"]:
+            self.assertEqual(
+                [x[name] != y[name] for x, y in zip(preferred, other)],
+                preferred_columns.mismatch_mask(other_columns, name).tolist()
+            )
+
+    def test_columnar_next_measure_ids(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            preferred = json.load(file)
+        with open(EG_FOLDER / "no_repeats.measuremap.json", "r") as file:
+            other = json.load(file)
+        for measure in preferred + other:
+            measure["next"] = [str(x) for x in measure["next"]]
+        preferred_columns = ColumnarMeasureMap.from_dicts(preferred)
+        other_columns = ColumnarMeasureMap.from_dicts(other)
+        self.assertEqual(["6", "8"], preferred_columns.get_next(4).tolist())
+        self.assertEqual(preferred, preferred_columns.to_dicts())
+        self.assertEqual(
+            [x["next"] != y["next"] for x, y in zip(preferred, other)],
+            preferred_columns.mismatch_mask(other_columns, "next").tolist()
+        )
+
+    def test_columnar_updates(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            preferred = json.load(file)
+        with open(EG_FOLDER / "no_repeats.measuremap.json", "r") as file:
+            other = json.load(file)
+        strings = []
+        preferred_columns = ColumnarMeasureMap.from_dicts(preferred, strings)
+        other_columns = ColumnarMeasureMap.from_dicts(other, strings)
+        other_columns.copy_fields(preferred_columns, ["end_repeat", "next"])
+        self.assertFalse(other_columns.mismatch_mask(preferred_columns, "next").any())
+        other_columns.set_column("time_signature", ["3/4"] + [None] * 9)
+        self.assertEqual(["3/4"] + [None] * 9, other_columns.get_column("time_signature"))
+        self.assertEqual(
+            [True] * 10,
+            preferred_columns.mismatch_mask(other_columns, "time_signature").tolist()
+        )
+
+    def test_trusted_loading(self):
+        measure_map = MeasureMap.from_json_file(EG_CORE / "core.measuremap.json", trusted=True)
+        self.assertIsInstance(measure_map.entries[0], SlottedMeasure)
+        self.assertFalse(hasattr(measure_map.entries[0], "__dict__"))
+        measure_map.validate()
+        self.assertEqual(2, measure_map.entries[0].get_default_successor().count)
+
+        measure_map.entries[3].actual_length = -1.0
+        measure_map.entries[5].qstamp = "5"
+        with self.assertRaises(ValueError) as context:
+            measure_map.validate()
+        self.assertIn("2 invalid entries", str(context.exception))
+
+    def test_from_trusted(self):
+        measure = Measure.from_trusted(count="3", qstamp=8.0)
+        self.assertEqual("3", measure.count)
+        self.assertIsNone(measure.number)
+        measure.validate()
+        self.assertEqual(3, measure.count)
+
+    def test_compressed_measure_map(self):
+        measure_map = MeasureMap.from_json_file(EG_CORE / "core.measuremap.json")
+        compressed = CompressedMeasureMap.from_measure_map(measure_map, checkpoint_interval=4)
+        self.assertEqual(measure_map.entries, list(compressed))
+        self.assertEqual(measure_map.entries, [compressed[i] for i in range(len(compressed))])
+        self.assertEqual(measure_map.entries[6], compressed.get_by_count(7))
+        with self.assertRaises(KeyError):
+            compressed.get_by_count(11)
+
+    def test_compression_ratio(self):
+        entries = [
+            Measure(count=i + 1, qstamp=4.0 * i, number=i + 1, time_signature="4/4", nominal_length=4.0,
+                    actual_length=4.0, start_repeat=False, end_repeat=False, next=[i + 2])
+            for i in range(1000)
+        ]
+        entries[500] = Measure(**dict(asdict(entries[500]), end_repeat=True, next=[1, 502]))
+        compressed = compress_measure_map(MeasureMap(entries))
+        self.assertLess(len(compressed["entries"]), len(entries) / 10)
+        restored = CompressedMeasureMap(json.loads(json.dumps(compressed)))
+        self.assertEqual(entries[500], restored[500])
+        self.assertEqual(entries[501], restored.get_by_count(502))
+        self.assertEqual(entries, restored.to_measure_map().entries)
+
+    def test_scan_json_array(self):
+        measure_map = [{"count": i + 1, "name": "\u00e9" * (i % 3), "qstamp": 1.5 * i} for i in range(50)]
+        raw = json.dumps(measure_map, indent=4, ensure_ascii=False).encode("utf-8")
+        for chunk_size in [1, 7, 1 << 16]:
+            scanned = list(scan_json_array(io.BytesIO(raw), chunk_size=chunk_size))
+            self.assertEqual(measure_map, [values for _, _, values in scanned])
+            for index, (start, stop, values) in enumerate(scanned):
+                self.assertEqual(values, json.loads(raw[start:stop]))
+                self.assertEqual(scanned[index + 1:], list(scan_json_array(io.BytesIO(raw), chunk_size, after=stop)))
+        with self.assertRaises(ValueError):
+            list(scan_json_array(io.BytesIO(b'[{"count": 1} {"count": 2}]')))
+
+    def test_lazy_measure_map(self):
+        path = EG_CORE / "core.measuremap.json"
+        lazy = LazyMeasureMap(path)
+        self.assertEqual(1, lazy[0].count)
+        self.assertEqual(1, len(lazy.offsets))  # only the first entry has been scanned
+        self.assertEqual(MeasureMap.from_json_file(path).entries, list(lazy))
+        self.assertEqual(10, len(lazy))
+        self.assertEqual(10, lazy[-1].count)
+        self.assertEqual(list(lazy), list(iter_measures(path)))
+
+    def test_lazy_measure_map_file_handles(self):
+        path = EG_CORE / "core.measuremap.json"
+        with mock.patch("builtins.open", wraps=open) as opened:
+            with LazyMeasureMap(path) as lazy:
+                self.assertEqual(3, lazy[2].count)
+                lazy.close()  # the scan carries on where it stopped, without re-reading the start of the file
+                with mock.patch("Code.base.scan_json_array", wraps=scan_json_array) as scanned:
+                    self.assertEqual(list(range(1, 11)), [x.count for x in lazy])
+                self.assertEqual(lazy.offsets[2][1], scanned.call_args.kwargs["after"])
+                self.assertEqual(list(range(1, 11)), [x.count for x in lazy])
+        self.assertEqual(3, opened.call_count)  # one scan before close(), one after, and one for re-reading
+        self.assertIsNone(lazy._file)
+
+    def test_lookup_indexes(self):
+        measure_map = MeasureMap.from_json_file(EG_CORE / "core.measuremap.json")
+        self.assertEqual(0, measure_map.position_at_qstamp(0.5))
+        self.assertEqual(1, measure_map.position_at_qstamp(1.0))
+        self.assertEqual(10, measure_map.get_at_qstamp(30.0).count)
+        with self.assertRaises(KeyError):
+            measure_map.position_at_qstamp(31.0)
+        self.assertEqual([2, 3, 4], [x.count for x in measure_map.get_overlapping(4.0, 8.5)])
+        self.assertEqual([1, 2, 3, 4], list(measure_map.positions_overlapping(1.0, 9.5)))
+        self.assertEqual(5, measure_map.get_count(4))
+
+        measure_map.entries[4] = Measure(count=5, qstamp=9.0, number=4, name="4b", actual_length=4.0)
+        self.assertEqual(5, measure_map.get_count(4, "4b"))
+        with self.assertRaises(KeyError):
+            measure_map.get_count(4)
+
+        measure_map.entries = measure_map.entries[:5]
+        self.assertEqual([4], list(measure_map.positions_overlapping(9.0, 100.0)))
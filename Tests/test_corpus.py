@@ -0,0 +1,191 @@
+"""
+Test the parallel corpus runs.
+"""
+
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase, mock
+
+from Code import corpus
+from Code.corpus import *
+from Code.measuring_bars import merge_corpus, one_comparison, run_corpus
+
+from . import EG_CORE, EG_FOLDER
+
+
+def make_corpus(folder: Path) -> None:
+    """A corpus of pre-extracted measure maps: the core example against each other example, plus two broken pairs."""
+    for path in sorted(EG_FOLDER.glob("*.measuremap.json")) + [None, None]:
+        pair_folder = folder / (path.name.split(".")[0] if path else f"broken_{len(list(folder.iterdir()))}")
+        pair_folder.mkdir()
+        shutil.copy(EG_CORE / "core.measuremap.json", pair_folder / "preferred_measure_map.json")
+        if path is not None:
+            shutil.copy(path, pair_folder / "other_measure_map.json")
+    (folder / "broken_5" / "other_measure_map.json").write_text("[{")  # broken_6 has no `other` at all
+
+
+def misbehave(path_to_preferred: Path, path_to_other: Path) -> list:
+    """A comparison that misbehaves on the pair in broken_5, as named in its `other` file (see `Test.misbehaving`)."""
+    if path_to_preferred.parent.name == "broken_5":
+        behaviour = path_to_other.read_text()
+        if behaviour == "die":
+            os._exit(1)
+        if behaviour == "hang":  # Where the time limit cannot stop it
+            signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGALRM])
+        time.sleep(60)
+    return one_comparison(path_to_preferred, path_to_other, write=False)
+
+
+class Test(TestCase):
+
+    def misbehaving(self, behaviour: str, **kwargs) -> dict:
+        """The results of each pair of the test corpus, with the pair in broken_5 set to misbehave."""
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            make_corpus(folder)
+            (folder / "broken_5" / "other_measure_map.json").write_text(behaviour)
+            pairs = find_pairs(folder, "preferred_measure_map.json", "other_measure_map.json")
+            manifest = run_pairs(misbehave, pairs, **kwargs)
+        self.assertEqual(7, manifest["pairs"])
+        return {Path(x["preferred"]).parent.name: x for x in manifest["results"]}
+
+    def test_worker_dies(self):
+        results = self.misbehaving("die", processes=2)
+        self.assertEqual(WORKER_DIED, results["broken_5"]["error"])
+        self.assertTrue(results["broken_6"]["error"].startswith("FileNotFoundError"))
+        self.assertEqual(5, sum(x["status"] == "ok" for x in results.values()))
+
+    def test_isolated_results(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            make_corpus(folder)
+            (folder / "broken_5" / "other_measure_map.json").write_text("sleep")
+            pairs = find_pairs(folder, "preferred_measure_map.json", "other_measure_map.json")
+            broken = [x for x in pairs if x[0].parent.name == "broken_5"]
+            start = time.perf_counter()
+            results = list(iter_isolated_results(misbehave, broken * 5, timeout=1.0))
+        self.assertLess(time.perf_counter() - start, 3.0)  # At the same time: not one after another
+        self.assertEqual(5, sum(x["error"].startswith("TimeoutError: Stopped") for x in results))
+
+    def test_timeout(self):
+        for processes in [1, 2]:
+            with self.subTest(processes=processes):
+                results = self.misbehaving("sleep", processes=processes, timeout=1.0)
+                self.assertTrue(results["broken_5"]["error"].startswith("TimeoutError: Stopped"))
+                self.assertEqual(5, sum(x["status"] == "ok" for x in results.values()))
+
+    def test_timeout_kills(self):
+        with mock.patch.object(corpus, "KILL_GRACE", 0.5):
+            results = self.misbehaving("hang", processes=2, timeout=1.0)
+        self.assertTrue(results["broken_5"]["error"].startswith("TimeoutError: Killed"))
+        self.assertEqual(5, sum(x["status"] == "ok" for x in results.values()))
+
+    def test_run_corpus(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            make_corpus(folder)
+            manifest = run_corpus(folder, processes=2)
+            expected = one_comparison(folder / "expanded_repeats" / "preferred_measure_map.json",
+                                      folder / "expanded_repeats" / "other_measure_map.json", write=False)
+
+            self.assertEqual(manifest, json.loads((folder / "corpus_results.json").read_text()))
+            self.assertEqual(7, manifest["pairs"])
+            self.assertEqual(2, manifest["errors"])
+            self.assertTrue((folder / "no_repeats" / "other_modifications.txt").exists())
+
+        results = {Path(x["preferred"]).parent.name: x for x in manifest["results"]}
+        self.assertEqual(sorted(results), [Path(x["preferred"]).parent.name for x in manifest["results"]])
+        self.assertTrue(results["broken_5"]["error"].startswith("JSONDecodeError"))
+        self.assertTrue(results["broken_6"]["error"].startswith("FileNotFoundError"))
+        self.assertEqual("ok", results["expanded_repeats"]["status"])
+        self.assertEqual([x[0] for x in expected], results["expanded_repeats"]["changes"])
+        self.assertTrue(all(x["seconds"] >= 0 for x in manifest["results"]))
+
+    def test_shards(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            (folder / "node_1").mkdir()
+            make_corpus(folder / "node_1")
+            whole = run_corpus(folder / "node_1", processes=1)
+            stale = run_corpus(folder / "node_1", processes=1, shard=(1, 2))  # From an earlier partition
+            os.utime(folder / "node_1" / "corpus_results.shard-1-of-2.json", (0, 0))
+            shards = [run_corpus(folder / "node_1", processes=1, shard=(i, 3)) for i in (2, 3)]
+            partial_report = merge_corpus(folder / "node_1")
+            first = run_corpus(folder / "node_1", processes=1, shard=(1, 3))
+
+            # Resumed on another node, where the corpus is at another path
+            (folder / "node_1").rename(folder / "node_2")
+            (folder / "node_2" / "broken_5" / "other_measure_map.json").unlink()
+            resumed = run_corpus(folder / "node_2", processes=1, shard=(1, 3), resume=True)
+            report = merge_corpus(folder / "node_2")
+            self.assertEqual(report, json.loads((folder / "node_2" / "corpus_results.json").read_text()))
+            self.assertEqual(stale["results"], merge_corpus(folder / "node_2", count=2)["results"])
+
+        self.assertEqual(["1/3"], partial_report["missing_shards"])
+        self.assertEqual(["1/3", "2/3", "3/3"], report["shards"])
+        self.assertEqual([], report["missing_shards"])
+        self.assertEqual(whole["pairs"], sum(x["pairs"] for x in shards) + resumed["pairs"])
+        self.assertEqual("broken_5/preferred_measure_map.json", first["results"][0]["preferred"])  # Relative paths
+
+        # Only the failed pairs run again: broken_5 now fails for its missing `other`
+        self.assertEqual([x for x in first["results"] if x["status"] == "ok"],
+                         [x for x in resumed["results"] if x["status"] == "ok"])
+        results = {Path(x["preferred"]).parent.name: x for x in report["results"]}
+        self.assertTrue(results["broken_5"]["error"].startswith("FileNotFoundError"))
+        for x in whole["results"]:
+            if Path(x["preferred"]).parent.name != "broken_5":
+                self.assertEqual(x["status"], results[Path(x["preferred"]).parent.name]["status"])
+
+    def test_resume_interrupted(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            make_corpus(folder)
+            pairs = largest_first(find_pairs(folder, "preferred_measure_map.json", "other_measure_map.json"))
+            manifest_path = folder / "corpus_results.json"
+            ran = []
+            interrupt_after = [3]
+
+            def interrupted(path_to_preferred: Path, path_to_other: Path) -> list:
+                if len(ran) == interrupt_after[0]:
+                    raise KeyboardInterrupt  # E.g., Ctrl-C, partway through the run
+                ran.append(path_to_preferred.parent.name)
+                return one_comparison(path_to_preferred, path_to_other, write=False)
+
+            with self.assertRaises(KeyboardInterrupt):
+                run_pairs(interrupted, pairs, manifest_path, processes=1, base_path=folder)
+            self.assertFalse(manifest_path.exists())
+            with open(results_log_path(manifest_path), "a") as log:
+                log.write('{"preferred": "broken_')  # Cut short by a kill while writing
+
+            ran.clear()
+            interrupt_after[0] = None
+            manifest = run_pairs(interrupted, pairs, manifest_path, processes=1, resume=True, base_path=folder)
+            self.assertEqual(manifest, read_manifest(manifest_path))
+            self.assertFalse(results_log_path(manifest_path).exists())
+
+        self.assertEqual([x[0].parent.name for x in pairs[3:]], ran)  # Only the pairs after the interruption
+        self.assertEqual(7, manifest["pairs"])
+        self.assertEqual(2, manifest["errors"])
+
+    def test_parse_shard(self):
+        self.assertEqual((2, 8), parse_shard("2/8"))
+        for spec in ["0/8", "9/8", "2", "a/b"]:
+            with self.assertRaises(ValueError):
+                parse_shard(spec)
+        self.assertEqual("corpus_results.shard-2-of-8.json", shard_manifest_name("corpus_results.json", (2, 8)))
+
+    def test_largest_first(self):
+        with tempfile.TemporaryDirectory() as folder:
+            folder = Path(folder)
+            make_corpus(folder)
+            pairs = find_pairs(folder, "preferred_measure_map.json", "other_measure_map.json")
+            ordered = largest_first(pairs)
+
+            self.assertEqual(sorted(pairs), pairs)
+            self.assertEqual(sorted(pair_size(x) for x in pairs)[::-1], [pair_size(x) for x in ordered])
+            self.assertEqual(folder / "broken_6", ordered[-1][0].parent)  # Only the preferred map
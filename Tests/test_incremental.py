@@ -0,0 +1,72 @@
+"""
+Test the incremental comparison.
+"""
+
+import copy
+from unittest import TestCase
+
+from Code.incremental import *
+
+
+def measure_map(length: int) -> list:
+    return [
+        {
+            "count": i + 1,
+            "qstamp": 4.0 * i,
+            "number": i + 1,
+            "nominal_length": 4.0,
+            "actual_length": 4.0,
+            "time_signature": "4/4",
+            "start_repeat": False,
+            "end_repeat": False,
+            "next": [i + 2]}
+        for i in range(length)
+    ]
+
+
+class Test(TestCase):
+
+    def test_edit(self):
+        comparison = IncrementalCompare(measure_map(3000), measure_map(3000))
+        self.assertEqual([], comparison.diagnosis)
+
+        comparison.edit("other", 10, actual_length=3.0)
+        self.assertEqual([("Measure_Length", 11, 4.0)], comparison.diagnosis)
+        self.assertEqual(43.0, comparison.maps["other"][11]["qstamp"])
+        self.assertEqual(2989, comparison.mismatches["qstamp"].sum())
+        self.assertEqual([0, 64, 128], comparison.mismatched_blocks("qstamp")[:3].tolist())
+
+        comparison.edit("other", 2000, time_signature="3/4")
+        comparison.edit("other", 10, actual_length=4.0)
+        self.assertEqual([("Time_Signature", 2001, "4/4")], comparison.diagnosis)
+        self.assertFalse(comparison.mismatches["qstamp"].any())
+
+    def test_diagnosis(self):
+        preferred, other = measure_map(20), measure_map(20)
+        other[1]["start_repeat"] = True
+        other[5]["actual_length"] = 3.0
+        other[7]["time_signature"] = "3/4"
+        comparison = IncrementalCompare(copy.deepcopy(preferred), copy.deepcopy(other))
+        expected = [("Repeat_Marks", 2, "start"), ("Measure_Length", 6, 4.0), ("Time_Signature", 8, "4/4")]
+        self.assertEqual(expected, comparison.diagnosis)
+        self.assertEqual(expected, Compare(copy.deepcopy(preferred), copy.deepcopy(other)).diagnosis)
+
+        # With a numbering mismatch too, Compare stops at the renumbering: the later mismatches are not reported
+        comparison.edit("other", 3, number=9)
+        self.assertEqual(expected[:1] + [("Renumber", "all")] + expected[1:], comparison.diagnosis)
+        other[3]["number"] = 9
+        self.assertEqual(expected[:1] + [("Renumber", "all")], Compare(preferred, other).diagnosis)
+
+    def test_matches_fresh_comparison(self):
+        comparison = IncrementalCompare(measure_map(200), measure_map(200), block_size=16)
+        comparison.edit("preferred", 5, end_repeat=True)
+        comparison.edit("other", 50, number=7)
+        comparison.replace("other", 100, 101, [dict(comparison.maps["other"][100], actual_length=1.0),
+                                               dict(comparison.maps["other"][100], actual_length=3.0)])
+        comparison.replace("preferred", 150, 152, [])
+
+        fresh = IncrementalCompare(copy.deepcopy(comparison.maps["preferred"]),
+                                   copy.deepcopy(comparison.maps["other"]), block_size=16)
+        for name, mask in fresh.mismatches.items():
+            self.assertEqual(mask.tolist(), comparison.mismatches[name].tolist())
+            self.assertEqual(fresh.block_counts[name].tolist(), comparison.block_counts[name].tolist())
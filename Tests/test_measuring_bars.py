@@ -6,7 +6,9 @@ from unittest import TestCase
 from Code.measuring_bars import *
 from Code.music21_application import *
 from pathlib import Path
+import copy
 import json
+import random
 
 from . import REPO_FOLDER
 
@@ -510,3 +512,133 @@ class Test(TestCase):
         self.assertNotEqual(preferred, other)
         output = Compare(preferred, other).diagnose()
         self.assertEqual(preferred, output)
+
+    def test_next_measure_ids(self):
+        """The 'next' field can hold measure IDs (strings) rather than counts."""
+        with open(REPO_FOLDER / "Example_core" / "core.measuremap.json", "r") as file:
+            preferred = json.load(file)
+        with open(REPO_FOLDER / "Examples" / "no_repeats.measuremap.json", "r") as file:
+            other = json.load(file)
+        for measure in preferred + other:
+            measure["next"] = [str(x) for x in measure["next"]]
+
+        comparison = Compare(preferred, copy.deepcopy(other))
+        self.assertEqual(
+            [("Repeat_Marks", 3, "end"), ("Repeat_Marks", 4, "start"), ("Repeat_Marks", 7, "end")],
+            comparison.diagnosis
+        )
+        self.assertEqual(preferred, comparison.other_mm)
+
+    def test_diagnosis_passes(self):
+        preferred = [
+            {
+                "count": i + 1,
+                "qstamp": 4.0 * i,
+                "number": i + 1,
+                "nominal_length": 4.0,
+                "actual_length": 4.0,
+                "time_signature": "4/4",
+                "start_repeat": False,
+                "end_repeat": False,
+                "next": [i + 2]}
+            for i in range(3000)
+        ]
+        other = [dict(x) for x in preferred]
+        other[10] = dict(other[10], actual_length=3.0)
+        other[2000] = dict(other[2000], time_signature="3/4", nominal_length=3.0)
+        for i in range(11, 3000):
+            other[i] = dict(other[i], qstamp=other[i]["qstamp"] - 1.0)
+
+        comparison = Compare(preferred, other)
+        self.assertEqual(
+            [("Measure_Length", 11, 4.0), ("Time_Signature", 2001, "4/4")],
+            comparison.diagnosis
+        )
+        self.assertEqual(preferred, comparison.other_mm)
+        self.assertEqual(3, comparison.passes)
+        # The columns were updated along with the fixes, not rebuilt
+        self.assertEqual(comparison.other_mm, comparison.columns["other"].to_dicts())
+
+    def test_batch_edits(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            measure_map = [
+                {
+                    "count": i + 1,
+                    "qstamp": 4.0 * i,
+                    "number": i,
+                    "nominal_length": 4.0,
+                    "actual_length": 4.0,
+                    "time_signature": "4/4",
+                    "start_repeat": False,
+                    "end_repeat": False,
+                    "next": [i + 2]}
+                for i in range(30)
+            ]
+            changes = []
+            length = len(measure_map)
+            for position in sorted(rng.sample(range(1, 25), 6)):
+                if rng.random() < 0.5:
+                    changes.append(("Join", position))
+                    length -= 1
+                else:
+                    changes.append(("Split", position, 1.0))
+                    length += 1
+
+            sequential = copy.deepcopy(measure_map)
+            for change in changes:
+                if change[0] == "Join":
+                    sequential = perform_join(sequential, change)
+                else:
+                    sequential = perform_split(sequential, change)
+            before = copy.deepcopy(measure_map)
+            self.assertEqual(sequential, perform_batch_edits(measure_map, changes))
+            self.assertEqual(before, measure_map)
+            self.assertEqual(length, len(sequential))
+
+    def test_batch_join_keeps_repeat(self):
+        measure_map = [
+            {"count": 1, "number": 1, "actual_length": 4.0, "end_repeat": False, "next": [2]},
+            {"count": 2, "number": 2, "actual_length": 2.0, "end_repeat": False, "next": [3]},
+            {"count": 3, "number": 3, "actual_length": 2.0, "end_repeat": True, "next": [1, 4]},
+            {"count": 4, "number": 4, "actual_length": 4.0, "end_repeat": False, "next": [5]},
+        ]
+        output = perform_batch_edits(measure_map, [("Join", 2)])
+        self.assertEqual([1, 2, 3], [x["count"] for x in output])
+        self.assertEqual([[2], [1, 3], [4]], [x["next"] for x in output])
+        self.assertEqual([True, 4.0], [output[1]["end_repeat"], output[1]["actual_length"]])
+
+    def test_cumulative_lengths(self):
+        def measure_map(lengths):
+            return [
+                {
+                    "count": i + 1,
+                    "qstamp": sum(lengths[:i]),
+                    "number": i + 1,
+                    "nominal_length": 4.0,
+                    "actual_length": length,
+                    "time_signature": "4/4",
+                    "start_repeat": False,
+                    "end_repeat": False,
+                    "next": [i + 2]}
+                for i, length in enumerate(lengths)
+            ]
+
+        cadenza_bars = [4.0, 4.0, 2.5, 3.5, 5.0, 1.0, 4.0]
+        one_long_bar = [4.0, 4.0, 12.0, 4.0]
+        self.assertEqual(
+            [("Split", 3, 2.5), ("Split", 4, 3.5), ("Split", 5, 5.0)],
+            cumulative_length_changes(measure_map(cadenza_bars), measure_map(one_long_bar))
+        )
+        self.assertEqual(
+            [("Join", 3), ("Join", 3), ("Join", 3)],
+            cumulative_length_changes(measure_map(one_long_bar), measure_map(cadenza_bars))
+        )
+        self.assertEqual(  # 2 bars against 3 (and the tail still found after that)
+            [("Join", 2), ("Join", 2), ("Split", 2, 3.0), ("Join", 4)],
+            cumulative_length_changes(measure_map([4.0, 3.0, 3.0, 4.0]), measure_map([4.0, 2.0, 2.0, 2.0, 2.0, 2.0]))
+        )
+
+        comparison = Compare(measure_map(cadenza_bars), measure_map(one_long_bar))
+        self.assertEqual(cadenza_bars, [x["actual_length"] for x in comparison.other_mm])
+        self.assertNotIn("Needleman-Wunsch", [x[0] for x in comparison.diagnosis])
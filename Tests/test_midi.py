@@ -0,0 +1,106 @@
+"""
+Test the MIDI meta event extractor.
+"""
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from music21 import converter
+
+from Code.midi import *
+
+from . import EG_FOLDER
+
+
+def chunk(chunk_type: bytes, content: bytes) -> bytes:
+    return chunk_type + len(content).to_bytes(4, "big") + content
+
+
+def meta(meta_type: int, data: bytes) -> bytes:
+    return bytes([0xFF, meta_type, len(data)]) + data
+
+
+CONDUCTOR = chunk(b"MTrk", b"".join([
+    b"\x00" + meta(TIME_SIGNATURE, bytes([3, 2, 24, 8])),  # 3/4
+    b"\x96\x40" + meta(MARKER, b"Bar 10"),  # At tick 2880, the start of the third bar
+    b"\x8b\x20" + meta(TIME_SIGNATURE, bytes([2, 2, 24, 8])),  # 2/4 at 4320
+    b"\x83\x60" + meta(TIME_SIGNATURE, bytes([6, 3, 36, 8])),  # 6/8 at 4800, within the 2/4 bar
+    b"\x00" + meta(END_OF_TRACK, b""),
+]))
+
+NOTES = chunk(b"MTrk", b"".join([
+    b"\x00\x90\x3c\x40",  # Note on
+    b"\x83\x60\x3c\x00",  # Running status
+    b"\x00\xc0\x05",  # Program change: one data byte
+    b"\x00\xf0\x03\x43\x12\xf7",  # System exclusive
+    b"\xb0\x60" + meta(END_OF_TRACK, b""),  # At 6720, a quarter into the second 6/8 bar
+]))
+
+MIDI_FILE = chunk(b"MThd", (1).to_bytes(2, "big") + (2).to_bytes(2, "big") + (480).to_bytes(2, "big")) \
+    + CONDUCTOR + NOTES
+
+
+class Test(TestCase):
+
+    def test_meta_events(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "meta_events.mid"
+            path.write_bytes(MIDI_FILE)
+            measure_map = midi_to_measure_map(path)
+
+        self.assertEqual([1, 2, 10, 11, 12, 13], [x["number"] for x in measure_map])
+        self.assertEqual([0.0, 3.0, 6.0, 9.0, 10.0, 13.0], [x["qstamp"] for x in measure_map])
+        self.assertEqual([3.0, 3.0, 3.0, 1.0, 3.0, 1.0], [x["actual_length"] for x in measure_map])
+        self.assertEqual([3.0, 3.0, 3.0, 2.0, 3.0, 3.0], [x["nominal_length"] for x in measure_map])
+        self.assertEqual(
+            ["3/4", "3/4", "3/4", "2/4", "6/8", "6/8"],
+            [x["time_signature"] for x in measure_map]
+        )
+        self.assertEqual([[2], [3], [4], [5], [6], []], [x["next"] for x in measure_map])
+
+    def test_music21_export(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "no_repeats.mid"
+            converter.parse(EG_FOLDER / "no_repeats.mxl").write("midi", fp=path)
+            measure_map = midi_to_measure_map(path)
+
+        # MIDI has no pickups: full 4/4 bars from the start, to the end of the track
+        self.assertEqual(list(range(1, 9)), [x["number"] for x in measure_map])
+        self.assertEqual({4.0}, {x["actual_length"] for x in measure_map})
+        self.assertFalse(any(x["start_repeat"] or x["end_repeat"] for x in measure_map))
+
+    def test_not_midi(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "not_midi.mid"
+            path.write_bytes(b"RIFF")
+            with self.assertRaisesRegex(ValueError, "Not a Standard MIDI File"):
+                midi_to_measure_map(path)
+
+    def test_invalid_time_signature(self):
+        for data in [bytes([0, 2, 24, 8]), bytes([1, 255, 24, 8])]:  # 0/4, and 1/2**255
+            track = chunk(b"MTrk", b"\x00" + meta(TIME_SIGNATURE, data) + b"\x83\x60" + meta(END_OF_TRACK, b""))
+            with tempfile.TemporaryDirectory() as folder:
+                path = Path(folder) / "invalid.mid"
+                path.write_bytes(MIDI_FILE[:14] + track)
+                with self.assertRaisesRegex(ValueError, "Invalid MIDI time signature"):
+                    midi_to_measure_map(path)
+
+    def test_running_status_across_meta_events(self):
+        track = chunk(b"MTrk", b"".join([
+            b"\x00\x90\x3c\x40",  # Note on
+            b"\x00" + meta(0x01, b"text"),
+            b"\x83\x60\x3c\x00",  # Running status, from before the text event
+            b"\x00" + meta(END_OF_TRACK, b""),
+        ]))
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "running_status.mid"
+            path.write_bytes(chunk(b"MThd", bytes([0, 0, 0, 1, 1, 224])) + track)  # One track, 480 ticks
+            self.assertEqual(1, len(converter.parse(path).flatten().notes))
+            self.assertEqual([1.0], [x["actual_length"] for x in midi_to_measure_map(path)])
+
+    def test_truncated(self):
+        for end in [1, 3, 6, 10, 20, 35]:  # Within delta times and meta events, or just after a delta time
+            with self.subTest(end=end):
+                with self.assertRaisesRegex(ValueError, "Truncated MIDI"):
+                    list(iter_meta_events(CONDUCTOR[8:8 + end]))
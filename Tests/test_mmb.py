@@ -0,0 +1,62 @@
+"""
+Test the memory-mappable binary measure map format.
+"""
+
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from Code.mmb import *
+
+from . import EG_CORE, REPO_FOLDER
+
+
+class Test(TestCase):
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for json_path in [EG_CORE / "core.measuremap.json",
+                              REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "other.measuremap.json"]:
+                mmb_path = Path(directory) / "map.mmb"
+                back_path = Path(directory) / "map.json"
+                json_to_mmb(json_path, mmb_path)
+                mmb_to_json(mmb_path, back_path)
+                with open(json_path, "r") as original, open(back_path, "r") as back:
+                    self.assertEqual(original.read(), back.read())
+
+    def test_views(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            measure_map = json.load(file)
+        with tempfile.TemporaryDirectory() as directory:
+            mmb_path = Path(directory) / "map.mmb"
+            write_mmb(measure_map, mmb_path)
+            columnar = open_mmb(mmb_path)
+            self.assertFalse(columnar.qstamp.flags.writeable)
+            self.assertFalse(columnar.qstamp.flags.owndata)
+            self.assertEqual([6, 8], columnar.get_next(4).tolist())
+            self.assertEqual("4/4", columnar.strings[columnar.time_signature[0]])
+            self.assertEqual(measure_map, columnar.to_dicts())
+
+    def test_missing_values(self):
+        measure_map = [{"count": 1, "qstamp": None, "name": "1a"}, {"count": 2, "qstamp": 4.0, "name": None}]
+        with tempfile.TemporaryDirectory() as directory:
+            mmb_path = Path(directory) / "map.mmb"
+            write_mmb(measure_map, mmb_path)
+            self.assertEqual(measure_map, open_mmb(mmb_path).to_dicts())
+
+    def test_compare_with_dicts(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            measure_map = json.load(file)
+        with tempfile.TemporaryDirectory() as directory:
+            mmb_path = Path(directory) / "map.mmb"
+            write_mmb(measure_map, mmb_path)
+            opened = open_mmb(mmb_path)
+            changed = [dict(x) for x in measure_map]
+            changed[3]["time_signature"] = "3/4"
+            for name in MEASURE_FIELDS:
+                self.assertFalse(opened.mismatch_mask(ColumnarMeasureMap.from_dicts(measure_map), name).any())
+            self.assertEqual(
+                [i == 3 for i in range(10)],
+                ColumnarMeasureMap.from_dicts(changed).mismatch_mask(opened, "time_signature").tolist()
+            )
@@ -0,0 +1,111 @@
+"""
+Test the MuseScore extractor.
+"""
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from Code.musescore import *
+from Code.musicxml import musicxml_to_measure_map
+
+from . import EG_CORE, EG_FOLDER
+
+
+NUMBERING = """<?xml version="1.0" encoding="UTF-8"?>
+<museScore version="3.02">
+  <Score>
+    <Part>
+      <Staff id="1"/>
+    </Part>
+    <Staff id="1">
+      <Measure>
+        <voice><TimeSig><sigN>3</sigN><sigD>4</sigD></TimeSig></voice>
+      </Measure>
+      <Measure len="1/4">
+        <irregular>1</irregular>
+        <endRepeat>3</endRepeat>
+      </Measure>
+      <Measure>
+        <noOffset>9</noOffset>
+      </Measure>
+      <Measure>
+        <LayoutBreak><subtype>section</subtype></LayoutBreak>
+      </Measure>
+      <Measure/>
+    </Staff>
+  </Score>
+</museScore>
+"""
+
+
+def volta(endings: int) -> str:
+    return f"""<Spanner type="Volta">
+          <Volta><beginText>{endings}.</beginText><endings>{endings}</endings></Volta>
+          <next><location><measures>1</measures></location></next>
+        </Spanner>"""
+
+
+VOLTA_END = """<Spanner type="Volta"><prev><location><measures>-1</measures></location></prev></Spanner>"""
+
+VOLTAS = f"""<?xml version="1.0" encoding="UTF-8"?>
+<museScore version="3.02">
+  <Score>
+    <Staff id="1">
+      <Measure>
+        <startRepeat/>
+        <voice><TimeSig><sigN>2</sigN><sigD>4</sigD></TimeSig></voice>
+      </Measure>
+      <Measure/>
+      <Measure>
+        <endRepeat>2</endRepeat>
+        <voice>{volta(1)}</voice>
+      </Measure>
+      <Measure>
+        <voice>{VOLTA_END}{volta(2)}</voice>
+      </Measure>
+      <Measure>
+        <startRepeat/>
+        <voice>{VOLTA_END}</voice>
+      </Measure>
+      <Measure>
+        <endRepeat>3</endRepeat>
+      </Measure>
+      <Measure/>
+    </Staff>
+  </Score>
+</museScore>
+"""
+
+
+class Test(TestCase):
+
+    def test_matches_musicxml_exports(self):
+        for path in [EG_CORE / "core.mscz"] + sorted(EG_FOLDER.glob("*.mscz")):
+            with self.subTest(path=path.name):
+                self.assertEqual(
+                    musicxml_to_measure_map(path.with_suffix(".mxl")),
+                    musescore_to_measure_map(path)
+                )
+
+    def test_numbering(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "numbering.mscx"
+            path.write_text(NUMBERING)
+            measure_map = musescore_to_measure_map(path)
+
+        self.assertEqual([1, 1, 11, 12, 1], [x["number"] for x in measure_map])
+        self.assertEqual([3.0, 1.0, 3.0, 3.0, 3.0], [x["actual_length"] for x in measure_map])
+        self.assertEqual([0.0, 3.0, 4.0, 7.0, 10.0], [x["qstamp"] for x in measure_map])
+        self.assertFalse(any(x["end_repeat"] for x in measure_map))  # Played three times
+
+    def test_voltas_and_repeats(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "voltas.mscx"
+            path.write_text(VOLTAS)
+            measure_map = musescore_to_measure_map(path)
+
+        self.assertEqual([True, False, False, False, True, False, False], [x["start_repeat"] for x in measure_map])
+        self.assertEqual([False, False, True, False, False, False, False], [x["end_repeat"] for x in measure_map])
+        # Into either ending from measure 2, back from the first ending, and no repeat played three times
+        self.assertEqual([[2], [3, 4], [1], [5], [6], [7], []], [x["next"] for x in measure_map])
@@ -108,6 +108,23 @@ class Test(TestCase):
             ]
         )
 
+    def test_iter_part_measure_map(self):
+        part = converter.parse(EG_FOLDER / "split_join_and_repeat.mxl").parts[0]
+        entries = iter_part_measure_map(part)
+        self.assertEqual({"count": 1, "next": [2]}, {k: v for k, v in next(entries).items() if k in ("count", "next")})
+        self.assertEqual(part_to_measure_map(part)[1:], list(entries))
+        self.assertEqual([[2], [3], [4], [5, 7], [6], [1], [8], [9], []],
+                         [x["next"] for x in part_to_measure_map(part)])
+
+    def test_parts_match(self):
+        score = converter.parse(REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "score.mxl")
+        self.assertEqual(part_to_measure_map(score.parts[0]), stream_to_measure_map(score))
+
+        score.parts[2].getElementsByClass(stream.Measure)[7].timeSignature = meter.TimeSignature("3/4")
+        with self.assertRaisesRegex(ValueError, r"Parts 0 and 2 do not match \(from measure count 8\)"):
+            stream_to_measure_map(score)
+        self.assertEqual(part_to_measure_map(score.parts[0]), stream_to_measure_map(score, check_parts_match=False))
+
     def test_split_measure(self):
         from music21 import corpus
         s = corpus.parse("bach/bwv66.6").parts[0]
@@ -160,3 +177,21 @@ class Test(TestCase):
         analysis = REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "analysis.txt"
 
         Aligner(score, analysis, attempt_fix=True)
+
+    def test_direct_extraction(self):
+        paths = [EG_FOLDER / "split_join_and_repeat.mxl", REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "score.mxl"]
+        for path in paths:
+            with self.subTest(path=path.name):
+                direct = Aligner(path, EG_CORE / "core.mxl", write_maps=False, write_diagnosis=False)
+                parsed = Aligner(path, EG_CORE / "core.mxl", write_maps=False, write_diagnosis=False,
+                                 direct_extraction=False)
+                self.assertIsNone(direct.preferred)  # Not parsed
+                self.assertEqual(parsed.preferred_measure_map, direct.preferred_measure_map)
+                self.assertEqual(parsed.comparison.diagnosis, direct.comparison.diagnosis)
+
+        analysis = REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "analysis.txt"
+        direct = Aligner(analysis, EG_CORE / "core.mxl", write_maps=False, write_diagnosis=False)
+        parsed = Aligner(analysis, EG_CORE / "core.mxl", write_maps=False, write_diagnosis=False,
+                         direct_extraction=False)
+        self.assertIsNone(direct.preferred)
+        self.assertEqual(parsed.preferred_measure_map, direct.preferred_measure_map)
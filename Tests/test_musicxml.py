@@ -0,0 +1,79 @@
+"""
+Test the streaming MusicXML extractor.
+"""
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from music21 import converter
+
+from Code.musicxml import *
+from Code.music21_application import stream_to_measure_map
+
+from . import EG_CORE, EG_FOLDER, REPO_FOLDER
+
+
+TWO_PARTS = """<?xml version="1.0" encoding="UTF-8"?>
+<score-partwise version="4.0">
+  <part-list>
+    <score-part id="P1"><part-name>One</part-name></score-part>
+    <score-part id="P2"><part-name>Two</part-name></score-part>
+  </part-list>
+  <part id="P1">
+    <measure number="1">
+      <attributes><divisions>2</divisions><time><beats>3</beats><beat-type>4</beat-type></time></attributes>
+      <note><rest/><duration>6</duration></note>
+    </measure>
+    <measure number="2">
+      <note><rest/><duration>4</duration></note>
+      <barline location="right"><repeat direction="backward"/></barline>
+    </measure>
+  </part>
+  <part id="P2">
+    <measure number="1">
+      <attributes><divisions>2</divisions><time><beats>3</beats><beat-type>4</beat-type></time></attributes>
+      <note><rest/><duration>6</duration></note>
+    </measure>
+    <measure number="2">
+      <note><rest/><duration>6</duration></note>
+      <barline location="right"><repeat direction="backward"/></barline>
+    </measure>
+  </part>
+</score-partwise>
+"""
+
+
+class Test(TestCase):
+
+    def test_matches_music21(self):
+        paths = [EG_CORE / "core.mxl"] + sorted(EG_FOLDER.glob("*.mxl")) + \
+            sorted((REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang").glob("*.mxl"))
+        for path in paths:
+            with self.subTest(path=path.name):
+                self.assertEqual(
+                    stream_to_measure_map(converter.parse(path)),
+                    musicxml_to_measure_map(path)
+                )
+
+    def test_parts(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "two_parts.musicxml"
+            path.write_text(TWO_PARTS)
+
+            for processes in [1, 2]:
+                with self.assertRaisesRegex(ValueError, "Parts 0 and 1 do not match \\(from measure count 2\\)"):
+                    musicxml_to_measure_map(path, processes=processes)
+
+            measure_map = musicxml_to_measure_map(path, check_parts_match=False)
+            self.assertEqual([3.0, 2.0], [x["actual_length"] for x in measure_map])
+            self.assertEqual([[2], [1]], [x["next"] for x in measure_map])
+            self.assertEqual({0}, {part for part, _ in iter_musicxml_bars(path, number_of_parts=1)})
+
+    def test_processes(self):
+        path = REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "score.mxl"
+        self.assertEqual(musicxml_to_measure_map(path), musicxml_to_measure_map(path, processes=2))
+
+        documents = split_parts(TWO_PARTS.replace("<part-list>", "<!-- <part id='P0'> --><part-list>").encode())
+        self.assertEqual(2, len(documents))
+        self.assertEqual([[False, True]], [[x["end_repeat"] for x in y] for y in part_measure_maps(documents[0])])
@@ -0,0 +1,89 @@
+"""
+Test the repeat structures of measure maps.
+"""
+
+import copy
+import json
+from unittest import TestCase
+
+from Code.repeats import *
+
+from . import EG_CORE, EG_FOLDER
+
+
+class Test(TestCase):
+
+    def setUp(self):
+        with open(EG_FOLDER / "split_join_and_repeat.measuremap.json", "r") as file:
+            self.measure_map = json.load(file)
+
+    def test_unfold(self):
+        before = copy.deepcopy(self.measure_map)
+        self.assertEqual(
+            [1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 7, 8, 9],
+            [count for _, count in unfold(self.measure_map)]
+        )
+        self.assertEqual(list(range(1, 14)), [index for index, _ in unfold(self.measure_map)])
+        self.assertEqual(before, self.measure_map)
+
+    def test_expanded_measure_map(self):
+        expanded = ExpandedMeasureMap(self.measure_map)
+        self.assertEqual(13, len(expanded))
+        self.assertEqual(7, expanded[6]["count"])
+        self.assertEqual([8], expanded[6]["next"])
+        self.assertEqual(self.measure_map[0]["qstamp"], expanded[6]["qstamp"])
+        self.assertFalse(expanded[5]["end_repeat"])
+
+        self.measure_map[0]["actual_length"] = 2.0  # Views, not copies
+        self.assertEqual(2.0, expanded[6]["actual_length"])
+        self.assertEqual(list(self.measure_map[0]), list(expanded[6]))
+
+        dicts = expanded.to_dicts()
+        self.assertEqual([x["count"] for x in dicts], list(range(1, 14)))
+        self.assertTrue(all(type(x) is dict for x in dicts))
+
+    def test_repeat_graph(self):
+        graph = RepeatGraph(self.measure_map)
+        self.assertEqual([(0, 5)], graph.loops())
+        self.assertEqual([(3, 6)], graph.branches())
+        self.assertEqual([(0, 3), (4, 5), (0, 3), (6, 8)], list(graph.segments()))
+        self.assertEqual(13, graph.performed_length())
+        self.assertEqual(
+            sum(x["actual_length"] for x in ExpandedMeasureMap(self.measure_map)),
+            graph.performed_duration()
+        )
+
+    def test_compare_repeat_structure(self):
+        with open(EG_CORE / "core.measuremap.json", "r") as file:
+            core = json.load(file)
+        with open(EG_FOLDER / "re-numbered.measuremap.json", "r") as file:
+            renumbered = json.load(file)
+        with open(EG_FOLDER / "expanded_repeats.measuremap.json", "r") as file:
+            expanded = json.load(file)
+
+        self.assertEqual({}, compare_repeat_structure(core, renumbered))
+        self.assertEqual({}, compare_repeat_structure(expanded, ExpandedMeasureMap(core).to_dicts()))
+        self.assertEqual(
+            {
+                "loops": {"missing": [(0.0, 8.0), (8.0, 20.0)], "extra": []},
+                "branches": {"missing": [(13.0, 20.0)], "extra": []},
+            },
+            compare_repeat_structure(core, expanded)
+        )
+
+    def test_performance_index(self):
+        index = PerformanceIndex(self.measure_map)
+        self.assertEqual((2, 13, 44.0), (index.passes, index.performed_length, index.performed_duration))
+        self.assertEqual([1, 5, 11, -1], index.count_to_performance([1, 5, 7, 10]).tolist())
+        self.assertEqual([7, -1], index.count_to_performance([1, 5], occurrence=1).tolist())
+        self.assertEqual(
+            [count for _, count in unfold(self.measure_map)],
+            index.performance_to_count(range(1, 14)).tolist()
+        )
+
+        self.assertEqual([0.0, 13.5], index.to_performance([0.0, 13.5]).tolist())
+        self.assertEqual(20.5, index.to_performance([0.5], occurrence=1)[0])
+        counts, qstamps, occurrences = index.to_score([20.5, 33.0, 50.0])
+        self.assertEqual([1, 7, -1], counts.tolist())
+        self.assertEqual([0.5, self.measure_map[6]["qstamp"]], qstamps[:2].tolist())
+        self.assertEqual([1, 0, -1], occurrences.tolist())
@@ -0,0 +1,77 @@
+"""
+Test the line-oriented RomanText extractor.
+"""
+
+import tempfile
+from fractions import Fraction
+from pathlib import Path
+from unittest import TestCase
+
+from music21 import converter
+
+from Code.romantext import *
+from Code.music21_application import stream_to_measure_map
+
+from . import REPO_FOLDER
+
+
+STRUCTURES = """Composer: Test
+Time Signature: 3/4
+
+m0 b3 C: I
+m1 ||: V b2 I6 b3 V
+m2 I :||
+m3a V
+m4a I
+m3b IV
+m4b V
+m5 I
+m5var1 IV
+m8 V b3 NC
+m9 b2
+m10 I b2
+Time Signature: 6/8
+m11 V b1.66 I b2 V b2.5 I
+m12-13 = m11-12
+m14 G: I D: V b2 ii
+Time Signature: 2/4
+m15 I
+m16 = m14
+m17 I b2 V
+"""
+
+
+class Test(TestCase):
+
+    def test_matches_music21(self):
+        with tempfile.TemporaryDirectory() as folder:
+            structures = Path(folder) / "structures.txt"
+            structures.write_text(STRUCTURES)
+            for path in [REPO_FOLDER / "Real_Cases" / "Marias_Kirchgang" / "analysis.txt", structures]:
+                with self.subTest(path=path.name):
+                    self.assertEqual(
+                        stream_to_measure_map(converter.parse(path, format="Romantext")),
+                        romantext_to_measure_map(path)
+                    )
+
+    def test_structures(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "structures.txt"
+            path.write_text(STRUCTURES)
+            measure_map = romantext_to_measure_map(path)
+
+        self.assertEqual(
+            [0, 1, 2, 3, 4, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17],
+            [x["number"] for x in measure_map]
+        )
+        self.assertEqual([3, 5], [x["count"] for x in measure_map if x["end_repeat"]])  # :|| and first ending
+        self.assertEqual(1.0, measure_map[0]["actual_length"])  # Pickup
+        self.assertEqual(2.0, measure_map[-1]["actual_length"])  # Completing it
+        self.assertEqual([3.0, 3.0], [x["actual_length"] for x in measure_map[8:10]])  # Skipped measures 6, 7
+        self.assertEqual(2.0, measure_map[11]["actual_length"])  # From b2 only
+        self.assertEqual(["6/8", 3.0], [measure_map[13]["time_signature"], measure_map[13]["actual_length"]])
+
+    def test_parse_beat(self):
+        self.assertEqual(Fraction(5, 2), parse_beat("b2.5"))
+        self.assertEqual(Fraction(5, 3), parse_beat("b1.66"))
+        self.assertEqual(Fraction(11, 6), parse_beat("b1.66.5"))